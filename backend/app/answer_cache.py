@@ -0,0 +1,185 @@
+# backend/app/answer_cache.py
+import os
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+# Maximum number of cached answers per collection (0 disables the cache)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+# Minimum cosine similarity between query embeddings for a cache hit
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+# Seconds a cached answer stays valid (0 keeps it until the knowledge base changes)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+
+@dataclass
+class CachedAnswer:
+    """
+    A previously generated first-turn answer
+    """
+    query: str
+    answer: str
+    sources: List[str]
+    context: str
+    confidence_score: Optional[float] = None
+    confidence_reason: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+    def set_confidence(self, confidence_score: float, confidence_reason: str):
+        """
+        Record a score that was computed after the answer was cached
+
+        Callers drop the entry from the cache when the score is below the
+        confidence threshold.
+        """
+        self.confidence_score = confidence_score
+        self.confidence_reason = confidence_reason
+
+
+class _Bucket:
+    """
+    Cached answers of one collection with their unit-length query embeddings
+    """
+
+    def __init__(self):
+        self.embeddings: Optional[np.ndarray] = None
+        self.entries: List[CachedAnswer] = []
+
+    def remove(self, indexes: Sequence[int]):
+        removed = set(indexes)
+        keep = [i for i in range(len(self.entries)) if i not in removed]
+        self.entries = [self.entries[i] for i in keep]
+        self.embeddings = self.embeddings[keep] if keep else None
+
+
+class AnswerCache:
+    """
+    Semantic cache of first-turn answers
+
+    A query hits when its embedding is within ANSWER_CACHE_THRESHOLD cosine
+    similarity of a cached query in the same collection. Every knowledge base
+    change bumps the collection's version and drops its entries, and answers
+    computed against an older version are never stored.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._buckets: Dict[str, _Bucket] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def kb_version(self, collection: str) -> int:
+        """
+        Version of a collection's content, incremented on every change
+        """
+        return self._versions.get(collection, 0)
+
+    def invalidate(self, collection: str):
+        """
+        Drop all answers for a collection after its content changed
+        """
+        with self._lock:
+            self._versions[collection] = self.kb_version(collection) + 1
+            self._buckets.pop(collection, None)
+            self.invalidations += 1
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, collection: str, embedding: Sequence[float]) -> Optional[CachedAnswer]:
+        """
+        Closest cached answer above the similarity threshold, or None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(collection)
+            if bucket is None or bucket.embeddings is None:
+                self.misses += 1
+                return None
+            similarities = bucket.embeddings @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry = bucket.entries[best]
+                if self.ttl > 0 and time.time() - entry.created_at > self.ttl:
+                    bucket.remove([best])
+                    self.evictions += 1
+                else:
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(self, collection: str, kb_version: int, embedding: Sequence[float], entry: CachedAnswer) -> bool:
+        """
+        Cache an answer unless the knowledge base changed since it was retrieved
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            if kb_version != self.kb_version(collection):
+                return False
+            bucket = self._buckets.setdefault(collection, _Bucket())
+            vector = self._normalize(embedding)[np.newaxis, :]
+            bucket.embeddings = vector if bucket.embeddings is None else np.vstack([bucket.embeddings, vector])
+            bucket.entries.append(entry)
+            overflow = len(bucket.entries) - self.max_entries
+            if overflow > 0:
+                bucket.remove(range(overflow))
+                self.evictions += overflow
+            self.stores += 1
+            return True
+
+    def discard(self, collection: str, entry: CachedAnswer) -> bool:
+        """
+        Drop a cached answer, e.g. one that scored below the confidence threshold after it was stored
+        """
+        with self._lock:
+            bucket = self._buckets.get(collection)
+            if bucket is None:
+                return False
+            indexes = [i for i, cached in enumerate(bucket.entries) if cached is entry]
+            if not indexes:
+                return False
+            bucket.remove(indexes)
+            self.evictions += len(indexes)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": sum(len(bucket.entries) for bucket in self._buckets.values()),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "kb_versions": dict(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Process-wide answer cache
+answer_cache = AnswerCache()
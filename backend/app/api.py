@@ -1,9 +1,13 @@
 import os
+import base64
+import asyncio
 import datetime
 import structlog
-from typing import List
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -11,21 +15,34 @@ from openai import OpenAI
 from dotenv import load_dotenv
 from app.database import get_db
 from app.whatsapp import router as whatsapp_router
-from app.models import Conversation, Message
+from app.models import Conversation, ConversationStatus, Message
 from app.database import ENABLE_DATABASE_STORAGE
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-from app.rag import chat
+from app.rag import chat, confidence_worker, chat_coalescer, turn_writer
+from app.turn_writer import CHAT_PERSISTENCE_MODE, WriteBehindTimeout
 
 from app.models import ChatRequest, ChatResponse
-from app.chunk_and_index import index_file, get_chroma_client, get_embeddings
+from app.chunk_and_index import (
+    index_file, get_chroma_client, get_embeddings, with_collection,
+    reset_collection_handles, init_chroma, close_chroma, load_vector_index, load_lexical_index,
+    embedding_batcher
+)
+from app.embedding_cache import embedding_cache
+from app.answer_cache import answer_cache
+from app.session_cache import session_cache
+from app.vector_index import vector_index
+from app.lexical_index import lexical_index
+from app.summarizer import conversation_summarizer
+from app.metrics import render_metrics
 
 import logging
 logging.basicConfig(level=logging.INFO)
-from app.whatsapp import router as whatsapp_router, is_whatsapp_configured
+from app.whatsapp import router as whatsapp_router, is_whatsapp_configured, close_graph_client
 
-from app.database import init_db
+from app.database import init_db, close_db
 init_db()
 
 # Load environment variables
@@ -62,26 +79,54 @@ SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT",
 # Context memory - how many turns to remember
 CONTEXT_MEMORY = int(os.getenv("CONTEXT_MEMORY", "20"))
 
+# Default and largest page of GET /api/conversations
+CONVERSATIONS_PAGE_SIZE = int(os.getenv("CONVERSATIONS_PAGE_SIZE", "50"))
+CONVERSATIONS_PAGE_MAX = int(os.getenv("CONVERSATIONS_PAGE_MAX", "200"))
+
 # Configure OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-# Rate limiter configuration
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiter configuration (disabled for load tests, which send everything from one address)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMIT_ENABLED)
 
 port = int(os.getenv("PORT", 8000))
 print(f"Starting on port: {port}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the Chroma connection and start background workers with the app, and release them on shutdown"""
+    await init_chroma()
+    confidence_worker.start()
+    if CHAT_PERSISTENCE_MODE == "write_behind" and ENABLE_DATABASE_STORAGE:
+        turn_writer.start()
+    yield
+    # Queued turns first: writing them may queue confidence jobs
+    await turn_writer.stop()
+    await confidence_worker.stop()
+    await conversation_summarizer.stop()
+    await asyncio.to_thread(vector_index.flush_snapshot)
+    await close_graph_client()
+    await close_chroma()
+    await close_db()
+
 # Initialize FastAPI
 app = FastAPI(
     title="RAG Chatbot API",
     description="A backend service for RAG-based chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add rate limiting exception handler
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.exception_handler(WriteBehindTimeout)
+async def write_behind_timeout_handler(request: Request, exc: WriteBehindTimeout):
+    """Queued chat turns could not be written in time: tell the client to retry"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -157,8 +202,8 @@ async def upload_knowledge_base(request: Request, files: List[UploadFile] = File
             with open(file_path, "wb") as f:
                 f.write(content)
             
-            # Index file
-            success = index_file(file_path)
+            # Index file; chunking, embeddings and the Chroma add are sync, so off the event loop
+            success = await asyncio.to_thread(index_file, file_path)
             
             if success:
                 results[file.filename] = {"status": "success"}
@@ -175,11 +220,11 @@ async def upload_knowledge_base(request: Request, files: List[UploadFile] = File
 @app.delete("/api/kb/delete/{filename}")
 async def delete_from_knowledge_base(filename: str):
     try:
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-        
         # Delete all documents with this filename as source
-        collection.delete(where={"source": filename})
+        with_collection(lambda collection: collection.delete(where={"source": filename}))
+        vector_index.delete({"source": filename})
+        lexical_index.delete({"source": filename})
+        answer_cache.invalidate(COLLECTION_NAME)
         
         # Optionally delete the physical file
         file_path = os.path.join("kb_files", filename)
@@ -191,19 +236,99 @@ async def delete_from_knowledge_base(filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-from app.rag import chat as rag_chat
+from app.rag import chat as rag_chat, chat_stream as rag_chat_stream
 
 @app.post("/api/chat", response_model=ChatResponse)
 @limiter.limit("30/minute")
 async def chat_endpoint(  # Rename the function
     request: Request, 
     chat_request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     return await rag_chat(request, chat_request, db)
 
+@app.post("/api/chat/stream")
+@limiter.limit("30/minute")
+async def chat_stream_endpoint(
+    request: Request, 
+    chat_request: ChatRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streaming chat endpoint (Server-Sent Events)
+    
+    Emits a sources event after retrieval, token events while the answer is
+    generated and a final confidence event once the turn has been saved.
+    """
+    return StreamingResponse(
+        rag_chat_stream(request, chat_request, db),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus exposition of stage latencies, token usage and error counts"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/api/confidence/status")
+async def confidence_status():
+    """Queue depth and evaluation lag of the background confidence worker"""
+    return confidence_worker.stats()
+
+@app.get("/api/persistence/status")
+async def persistence_status():
+    """Queue depth, batch sizes and write lag of the write-behind turn writer"""
+    return turn_writer.stats()
+
+@app.get("/api/cache/status")
+async def cache_status():
+    """Hit, miss and eviction counters of the in-process caches"""
+    return {
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "sessions": session_cache.stats(),
+        "coalesced_chats": chat_coalescer.stats()
+    }
+
+@app.get("/api/embeddings/status")
+async def embeddings_status():
+    """Batch size distribution of the query embeddings requests"""
+    return embedding_batcher.stats()
+
+@app.get("/api/vector-index/status")
+async def vector_index_status():
+    """Size and state of the local vector index replica"""
+    return vector_index.stats()
+
+@app.post("/api/vector-index/reload")
+async def reload_vector_index():
+    """Rebuild the local vector index replica from Chroma"""
+    try:
+        # The sync Chroma client and the matrix rebuild must not hold up the event loop
+        records = await asyncio.to_thread(load_vector_index)
+        return {"status": "success", "records": records}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/lexical-index/status")
+async def lexical_index_status():
+    """Size and state of the BM25 index used for hybrid retrieval"""
+    return lexical_index.stats()
+
+@app.post("/api/lexical-index/reload")
+async def reload_lexical_index():
+    """Rebuild the BM25 index from Chroma"""
+    try:
+        # The sync Chroma client and the tokenizing must not hold up the event loop
+        records = await asyncio.to_thread(load_lexical_index)
+        return {"status": "success", "records": records}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/conversations/{session_id}")
-async def get_conversation(session_id: str, db: Session = Depends(get_db)):
+async def get_conversation(session_id: str, db: AsyncSession = Depends(get_db)):
     """
     Get conversation history by session ID
     
@@ -223,17 +348,22 @@ async def get_conversation(session_id: str, db: Session = Depends(get_db)):
             "messages": []
         }
         
+    # Include turns still queued for write-behind; answered with 503 if they cannot be written
+    await turn_writer.wait_for(session_id)
     try:
-        conversation = db.query(Conversation).filter(Conversation.session_id == session_id).first()
+        conversation = await db.scalar(select(Conversation).where(Conversation.session_id == session_id))
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        messages = db.query(Message).filter(Message.conversation_id == conversation.id).order_by(Message.timestamp).all()
+        messages = (await db.scalars(
+            select(Message).where(Message.conversation_id == conversation.id).order_by(Message.timestamp)
+        )).all()
         
         return {
             "session_id": conversation.session_id,
             "created_at": conversation.created_at.isoformat(),
             "updated_at": conversation.updated_at.isoformat(),
+            "summary": conversation.summary,
             "messages": [msg.to_dict() for msg in messages]
         }
     except HTTPException:
@@ -242,34 +372,80 @@ async def get_conversation(session_id: str, db: Session = Depends(get_db)):
         logger.error("Error retrieving conversation", error=str(e), session_id=session_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-# Modify the list_conversations function in api.py
+def _encode_cursor(conversation: Conversation) -> str:
+    """Opaque position after a conversation in the list order"""
+    position = f"{conversation.updated_at.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    """(updated_at, id) encoded by _encode_cursor; 400 if the cursor is not one"""
+    try:
+        updated_at, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(updated_at), int(conversation_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/api/conversations")
-async def list_conversations(db: Session = Depends(get_db)):
+async def list_conversations(
+    cursor: Optional[str] = None,
+    limit: int = Query(CONVERSATIONS_PAGE_SIZE, ge=1, le=CONVERSATIONS_PAGE_MAX),
+    status: Optional[ConversationStatus] = None,
+    db: AsyncSession = Depends(get_db)
+):
     """
-    List all conversations
+    List conversations, most recently updated first, one page at a time
+    
+    Pages are read with a keyset on (updated_at, id), so every page costs the
+    same however deep it is, and messages are counted for that page only.
     
     Args:
+        cursor: next_cursor of the previous page; omit for the first page
+        limit: Conversations per page
+        status: Only conversations with this status, e.g. waiting_for_manual
         db: Database session
         
     Returns:
-        List of conversations
+        The page of conversations and the cursor of the next page (None on the last page)
     """
     # Check if database storage is enabled
     if not ENABLE_DATABASE_STORAGE:
-        return {"conversations": []}
+        return {"conversations": [], "next_cursor": None}
+    
+    query = (
+        select(Conversation)
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    if status is not None:
+        query = query.where(Conversation.status == status.value)
+    if cursor:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < _decode_cursor(cursor))
         
+    # No wait for queued turns: one slow session must not hold up the whole list,
+    # which catches up within WRITE_BEHIND_INTERVAL_MS
     try:
-        conversations = db.query(Conversation).order_by(Conversation.updated_at.desc()).all()
+        conversations = (await db.scalars(query)).all()
+        page = conversations[:limit]
+        counts = {}
+        if page:
+            # One aggregate over the messages index for the whole page
+            counts = dict((await db.execute(
+                select(Message.conversation_id, func.count(Message.id))
+                .where(Message.conversation_id.in_([conv.id for conv in page]))
+                .group_by(Message.conversation_id)
+            )).all())
         return {
             "conversations": [
                 {
                     "session_id": conv.session_id,
+                    "status": conv.status,
                     "created_at": conv.created_at.isoformat(),
                     "updated_at": conv.updated_at.isoformat(),
-                    "message_count": len(conv.messages)
+                    "message_count": counts.get(conv.id, 0)
                 }
-                for conv in conversations
-            ]
+                for conv in page
+            ],
+            "next_cursor": _encode_cursor(page[-1]) if len(conversations) > limit else None
         }
     except Exception as e:
         logger.error("Error listing conversations", error=str(e))
@@ -331,6 +507,12 @@ async def delete_all_from_knowledge_base():
             chroma_client.create_collection(name=COLLECTION_NAME)
         except:
             pass  # Collection might not exist
+        # The recreated collection has a new id, so cached handles are stale
+        reset_collection_handles()
+        if vector_index.loaded:
+            vector_index.clear(str(with_collection(lambda collection: collection.id)))
+        lexical_index.clear()
+        answer_cache.invalidate(COLLECTION_NAME)
         
         return {"status": "success", "message": "Knowledge base cleared successfully"}
     except Exception as e:
@@ -349,10 +531,7 @@ async def get_file_info(filename: str):
         file_stat = os.stat(file_path)
         
         # Get chunk count from ChromaDB
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-        
-        results = collection.get(where={"source": filename})
+        results = with_collection(lambda collection: collection.get(where={"source": filename}))
         chunk_count = len(results['ids']) if results['ids'] else 0
         
         return {
@@ -369,11 +548,11 @@ async def get_file_info(filename: str):
 @app.delete("/api/kb/delete/{filename}")
 async def delete_from_knowledge_base(filename: str):
     try:
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-        
         # Delete all documents with this filename as source
-        collection.delete(where={"source": filename})
+        with_collection(lambda collection: collection.delete(where={"source": filename}))
+        vector_index.delete({"source": filename})
+        lexical_index.delete({"source": filename})
+        answer_cache.invalidate(COLLECTION_NAME)
         
         # Optionally delete the physical file
         file_path = os.path.join("kb_files", filename)
@@ -388,11 +567,8 @@ async def delete_from_knowledge_base(filename: str):
 async def list_chromadb_documents():
     """List all unique source documents in ChromaDB"""
     try:
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-        
         # Get all documents
-        results = collection.get()
+        results = with_collection(lambda collection: collection.get())
         
         # Extract unique sources
         sources = set()
@@ -409,11 +585,8 @@ async def get_kb_status():
     """Get knowledge base status"""
     try:
         # Get ChromaDB stats
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-        
         # Get all documents
-        results = collection.get()
+        results = with_collection(lambda collection: collection.get())
         
         # Count documents and unique sources
         total_documents = len(results['ids']) if 'ids' in results else 0
@@ -1,14 +1,24 @@
 import os
 import re
 import uuid
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Callable, Optional
 import chromadb
-from openai import OpenAI
+from chromadb.config import Settings
+from chromadb.errors import NotFoundError
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+from .embedding_cache import embedding_cache
+from .embedding_batcher import EmbeddingBatcher, EMBED_BATCHING_ENABLED
+from .metrics import track_request, timed, record_usage
+from .answer_cache import answer_cache
+from .vector_index import vector_index, LOCAL_VECTOR_INDEX
+from .lexical_index import lexical_index, HYBRID_RETRIEVAL
+
 # OpenAI API configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "text-embedding-ada-002")
@@ -16,39 +26,190 @@ EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "text-embedding-ada-002")
 # Chroma configuration
 CHROMA_SERVER_URL = os.getenv("CHROMA_SERVER_URL", "http://chromadb:8000")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "kb_default")
+# Seconds an idle HTTP connection to Chroma is kept open, and the pool size
+CHROMA_KEEPALIVE_SECS = float(os.getenv("CHROMA_KEEPALIVE_SECS", "60"))
+CHROMA_MAX_CONNECTIONS = int(os.getenv("CHROMA_MAX_CONNECTIONS", "100"))
 
-# Configure OpenAI client
+# Configure OpenAI clients (the async one is used on the request path)
 client = OpenAI(api_key=OPENAI_API_KEY)
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+def _parse_chroma_url(url: str):
+    """
+    Split the Chroma server URL into (protocol, host, port)
+    """
+    from urllib.parse import urlparse
+    parsed_url = urlparse(url)
+    protocol = parsed_url.scheme or "http"
+    host = parsed_url.netloc
+    if ':' in host:
+        host, port_str = host.split(':')
+        port = int(port_str)
+    else:
+        port = 443 if protocol == 'https' else 8000
+    return protocol, host, port
+
+# Process-wide Chroma clients and collection handles. Building a client performs
+# several handshake requests and every get_or_create_collection is a round trip,
+# so both are created once and reused over keep-alive connections.
+_chroma_client = None
+_async_chroma_client = None
+_collection = None
+_async_collection = None
+
+def _chroma_settings() -> Settings:
+    """
+    HTTP pool settings shared by the sync and async clients
+    """
+    return Settings(
+        chroma_http_keepalive_secs=CHROMA_KEEPALIVE_SECS,
+        chroma_http_max_connections=CHROMA_MAX_CONNECTIONS,
+        chroma_http_max_keepalive_connections=CHROMA_MAX_CONNECTIONS
+    )
 
 def get_chroma_client():
     """
-    Get a connection to the Chroma server
+    Get the shared connection to the Chroma server
     """
+    global _chroma_client
+    if _chroma_client is not None:
+        return _chroma_client
     try:
         url = CHROMA_SERVER_URL
         print(f"Attempting to connect to ChromaDB using URL: {url}")
         
         # Parse the URL
-        from urllib.parse import urlparse
-        parsed_url = urlparse(url)
-        protocol = parsed_url.scheme or "http"
-        host = parsed_url.netloc
-        if ':' in host:
-            host, port_str = host.split(':')
-            port = int(port_str)
-        else:
-            port = 443 if protocol == 'https' else 8000
+        protocol, host, port = _parse_chroma_url(url)
         
         print(f"Connecting to ChromaDB at {protocol}://{host}:{port}")
         
         # Create client
-        return chromadb.HttpClient(host=host, port=port, ssl=(protocol == 'https'))
+        _chroma_client = chromadb.HttpClient(
+            host=host, port=port, ssl=(protocol == 'https'), settings=_chroma_settings()
+        )
+        return _chroma_client
+    except Exception as e:
+        import traceback
+        print(f"ChromaDB connection error: {str(e)}")
+        print(f"Stack trace: {traceback.format_exc()}")
+        raise
+
+async def get_async_chroma_client():
+    """
+    Get a non-blocking connection to the Chroma server for use inside the event loop
+    """
+    global _async_chroma_client
+    if _async_chroma_client is not None:
+        return _async_chroma_client
+    try:
+        protocol, host, port = _parse_chroma_url(CHROMA_SERVER_URL)
+        _async_chroma_client = await chromadb.AsyncHttpClient(
+            host=host, port=port, ssl=(protocol == 'https'), settings=_chroma_settings()
+        )
+        return _async_chroma_client
     except Exception as e:
         import traceback
         print(f"ChromaDB connection error: {str(e)}")
         print(f"Stack trace: {traceback.format_exc()}")
         raise
 
+def get_collection():
+    """
+    Get the cached handle of the knowledge base collection, creating it if needed
+    """
+    global _collection
+    if _collection is None:
+        _collection = get_chroma_client().get_or_create_collection(name=COLLECTION_NAME)
+    return _collection
+
+async def get_async_collection():
+    """
+    Get the cached async handle of the knowledge base collection, creating it if needed
+    """
+    global _async_collection
+    if _async_collection is None:
+        chroma_client = await get_async_chroma_client()
+        _async_collection = await chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+    return _async_collection
+
+def reset_collection_handles():
+    """
+    Forget the cached collection handles after the collection was dropped or recreated
+    
+    The next call to get_collection or get_async_collection looks the collection up again.
+    """
+    global _collection, _async_collection
+    _collection = None
+    _async_collection = None
+
+def with_collection(operation: Callable[[Any], Any]) -> Any:
+    """
+    Run an operation on the cached collection handle
+    
+    If the collection was dropped or recreated elsewhere, the handle is
+    refreshed and the operation retried once.
+    
+    Args:
+        operation: Function receiving the collection
+        
+    Returns:
+        Whatever the operation returns
+    """
+    try:
+        return operation(get_collection())
+    except NotFoundError:
+        reset_collection_handles()
+        return operation(get_collection())
+
+async def init_chroma():
+    """
+    Open the Chroma connection and resolve the collection when the app starts
+    
+    A Chroma server that is not up yet is logged, not fatal: the handles are
+    created on first use instead.
+    """
+    try:
+        await get_async_collection()
+        if LOCAL_VECTOR_INDEX:
+            await asyncio.to_thread(load_vector_index)
+        if HYBRID_RETRIEVAL:
+            await asyncio.to_thread(load_lexical_index)
+    except Exception as e:
+        print(f"ChromaDB not ready at startup, will connect on first request: {str(e)}")
+
+def load_vector_index() -> int:
+    """
+    (Re)build the local vector index replica from the Chroma collection
+    
+    Returns:
+        Number of records in the replica
+    """
+    return with_collection(vector_index.load)
+
+def load_lexical_index() -> int:
+    """
+    (Re)build the BM25 index from the Chroma collection
+    
+    Returns:
+        Number of indexed chunks
+    """
+    return with_collection(lexical_index.load)
+
+async def close_chroma():
+    """
+    Close the shared Chroma clients and drop the handles when the app shuts down
+    """
+    global _chroma_client, _async_chroma_client
+    reset_collection_handles()
+    if _chroma_client is not None:
+        _chroma_client.close()
+    # AsyncHttpClient has no close(); its server API releases the pooled HTTP connections on exit
+    server = getattr(_async_chroma_client, "_server", None)
+    if server is not None and hasattr(server, "__aexit__"):
+        await server.__aexit__(None, None, None)
+    _chroma_client = None
+    _async_chroma_client = None
+
 def chunk_text(text: str, chunk_size: int = 2000, chunk_overlap: int = 200) -> List[str]:
     """
     Split text into chunks with overlap
@@ -98,10 +259,33 @@ def chunk_text(text: str, chunk_size: int = 2000, chunk_overlap: int = 200) -> L
     return chunks
 
 
+def _fill_from_cache(texts: List[str]):
+    """
+    Look texts up in the shared embedding cache
+    
+    Returns:
+        Tuple of (embeddings with None for misses, indexes of the misses)
+    """
+    embeddings = embedding_cache.get_many(EMBED_MODEL_NAME, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    return embeddings, missing
+
+
+def _store_in_cache(texts: List[str], embeddings: List[Optional[List[float]]], missing: List[int], data):
+    """
+    Place freshly generated vectors in the result list and the cache
+    """
+    for i, item in zip(missing, data):
+        embeddings[i] = item.embedding
+        embedding_cache.put(EMBED_MODEL_NAME, texts[i], item.embedding)
+
+
 def get_embeddings(texts: List[str]) -> List[List[float]]:
     """
     Generate embeddings for text chunks using OpenAI
     
+    Vectors already in the embedding cache are not requested again.
+    
     Args:
         texts: List of text chunks
         
@@ -111,14 +295,63 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
     if not texts:
         return []
     
-    response = client.embeddings.create(
-        input=texts,
-        model=EMBED_MODEL_NAME
-    )
+    embeddings, missing = _fill_from_cache(texts)
+    if missing:
+        response = client.embeddings.create(
+            input=[texts[i] for i in missing],
+            model=EMBED_MODEL_NAME
+        )
+        record_usage("embedding", EMBED_MODEL_NAME, response.usage)
+        _store_in_cache(texts, embeddings, missing, response.data)
     
+    return embeddings
+
+
+async def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts with a single request on the async client
+    """
+    response = await async_client.embeddings.create(input=texts, model=EMBED_MODEL_NAME)
+    record_usage("embedding", EMBED_MODEL_NAME, response.usage)
     return [item.embedding for item in response.data]
 
 
+# Shares embeddings requests between concurrent chat turns
+embedding_batcher = EmbeddingBatcher(_request_embeddings)
+
+
+async def get_embeddings_async(texts: List[str]) -> List[List[float]]:
+    """
+    Generate embeddings without blocking the event loop
+    
+    Vectors already in the embedding cache are not requested again. With
+    EMBED_BATCHING_ENABLED, cache misses of concurrent callers are sent
+    together in one request.
+    
+    Args:
+        texts: List of text chunks
+        
+    Returns:
+        List of embedding vectors
+    """
+    if not texts:
+        return []
+    
+    embeddings = await embedding_cache.get_many_async(EMBED_MODEL_NAME, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        if EMBED_BATCHING_ENABLED:
+            vectors = await embedding_batcher.embed(missing_texts)
+        else:
+            vectors = await _request_embeddings(missing_texts)
+        for i, vector in zip(missing, vectors):
+            embeddings[i] = vector
+            embedding_cache.put(EMBED_MODEL_NAME, texts[i], vector)
+    
+    return embeddings
+
+
 def index_file(file_path: str) -> bool:
     """
     Process a file, chunk it, generate embeddings, and add to Chroma
@@ -129,16 +362,24 @@ def index_file(file_path: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
+    with track_request("index_file", file=os.path.basename(file_path)) as timing:
+        indexed = _index_file(file_path)
+        timing["outcome"] = "ok" if indexed else "error"
+        return indexed
+
+
+def _index_file(file_path: str) -> bool:
     try:
         # Read file content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Extract filename for metadata
-        file_name = os.path.basename(file_path)
-        
-        # Chunk the text
-        chunks = chunk_text(content)
+        with timed("read_and_chunk"):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            # Extract filename for metadata
+            file_name = os.path.basename(file_path)
+            
+            # Chunk the text
+            chunks = chunk_text(content)
         
         # If no chunks, return
         if not chunks:
@@ -146,11 +387,8 @@ def index_file(file_path: str) -> bool:
             return False
         
         # Generate embeddings
-        embeddings = get_embeddings(chunks)
-        
-        # Connect to Chroma and get or create collection
-        chroma_client = get_chroma_client()
-        collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+        with timed("embedding"):
+            embeddings = get_embeddings(chunks)
         
         # Prepare document IDs and metadata
         ids = [str(uuid.uuid4()) for _ in chunks]
@@ -162,13 +400,20 @@ def index_file(file_path: str) -> bool:
             } for i in range(len(chunks))
         ]
         
-        # Add to Chroma
-        collection.add(
-            ids=ids,
-            documents=chunks,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
+        # Add to Chroma through the shared collection handle
+        with timed("chroma_add"):
+            with_collection(lambda collection: collection.add(
+                ids=ids,
+                documents=chunks,
+                embeddings=embeddings,
+                metadatas=metadatas
+            ))
+        with timed("local_indexes"):
+            vector_index.add(ids, chunks, embeddings, metadatas)
+            lexical_index.add(ids, chunks, metadatas)
+        
+        # Answers cached against the previous content are now stale
+        answer_cache.invalidate(COLLECTION_NAME)
         
         print(f"Successfully indexed {file_path} with {len(chunks)} chunks")
         return True
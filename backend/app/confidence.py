@@ -0,0 +1,179 @@
+# backend/app/confidence.py
+"""
+Confidence scoring from retrieval signals, without an extra LLM call.
+
+The score is a logistic model over features that are already available after a
+chat turn: the similarity of the best chunk, the margin to the runner-up, the
+mean similarity of the retrieved chunks and, optionally, the average token
+probability of the answer. Weights come from a calibration file fitted on a
+labelled set with:
+
+    python -m app.confidence --labels labelled.jsonl --output calibration.json
+
+Each line of the labelled set is {"query": ..., "label": 0|1} (retrieval is run
+against the live collection) or {"distances": [...], "label": 0|1}, optionally
+with "mean_logprob". The label says whether the bot's answer was acceptable.
+"""
+import os
+import json
+import math
+import argparse
+import structlog
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = structlog.get_logger()
+
+# Distance function of the Chroma collection: "l2" (Chroma's default, squared) or "cosine"
+CHROMA_DISTANCE_SPACE = os.getenv("CHROMA_DISTANCE_SPACE", "l2").lower()
+CONFIDENCE_CALIBRATION_FILE = os.getenv("CONFIDENCE_CALIBRATION_FILE", "app/data/confidence_calibration.json")
+CONFIDENCE_USE_LOGPROBS = os.getenv("CONFIDENCE_USE_LOGPROBS", "false").lower() == "true"
+
+FEATURES = ["bias", "top_similarity", "margin", "mean_similarity", "token_probability"]
+
+# Uncalibrated defaults: 50% at a top similarity of 0.5, rising steeply above it
+DEFAULT_WEIGHTS = [-6.0, 12.0, 4.0, 0.0, 0.0]
+
+
+def distance_to_similarity(distance: float) -> float:
+    """
+    Convert a Chroma distance to cosine similarity (embeddings are unit length)
+    """
+    if CHROMA_DISTANCE_SPACE == "cosine":
+        return 1.0 - distance
+    return 1.0 - distance / 2.0
+
+
+def retrieval_features(distances: Sequence[float], mean_logprob: Optional[float] = None) -> List[float]:
+    """
+    Feature vector (see FEATURES) for one retrieval result
+
+    Args:
+        distances: Distances of the retrieved chunks, best first
+        mean_logprob: Mean token log probability of the answer, if requested
+    """
+    similarities = sorted((distance_to_similarity(d) for d in distances), reverse=True)
+    if not similarities:
+        return [1.0, 0.0, 0.0, 0.0, 0.0]
+    top = similarities[0]
+    margin = top - similarities[1] if len(similarities) > 1 else top
+    token_probability = math.exp(mean_logprob) if mean_logprob is not None else 0.0
+    return [1.0, top, margin, sum(similarities) / len(similarities), token_probability]
+
+
+def load_weights(path: str = CONFIDENCE_CALIBRATION_FILE) -> List[float]:
+    """
+    Read calibrated weights, falling back to DEFAULT_WEIGHTS
+    """
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            calibration = json.load(f)
+        weights = [float(calibration["weights"][name]) for name in FEATURES]
+        logger.info("Loaded confidence calibration", path=path, samples=calibration.get("samples"))
+        return weights
+    return list(DEFAULT_WEIGHTS)
+
+
+WEIGHTS = load_weights()
+
+
+def retrieval_confidence(
+    distances: Sequence[float],
+    mean_logprob: Optional[float] = None,
+    weights: Optional[Sequence[float]] = None
+) -> Tuple[float, str]:
+    """
+    Score an answer from its retrieval distances (and optionally token logprobs)
+
+    Returns:
+        Tuple of (confidence_score, confidence_reasoning)
+    """
+    features = retrieval_features(distances, mean_logprob)
+    logit = float(np.dot(weights if weights is not None else WEIGHTS, features))
+    confidence_score = round(100.0 / (1.0 + math.exp(-logit)), 1)
+    reasoning = (
+        f"Retrieval confidence: top similarity {features[1]:.3f}, margin {features[2]:.3f}, "
+        f"mean similarity {features[3]:.3f}"
+    )
+    if mean_logprob is not None:
+        reasoning += f", token probability {features[4]:.3f}"
+    return confidence_score, reasoning
+
+
+def mean_token_logprob(logprobs) -> Optional[float]:
+    """
+    Mean log probability of the tokens in a completion's logprobs.content
+    """
+    values = [token.logprob for token in (logprobs or []) if token.logprob is not None]
+    return sum(values) / len(values) if values else None
+
+
+def fit_weights(features: np.ndarray, labels: np.ndarray, iterations: int = 5000,
+                learning_rate: float = 0.5, l2: float = 1e-3) -> np.ndarray:
+    """
+    Logistic regression by gradient descent (the bias feature is not regularised)
+    """
+    weights = np.zeros(features.shape[1])
+    penalty = np.full(features.shape[1], l2)
+    penalty[0] = 0.0
+    for _ in range(iterations):
+        predictions = 1.0 / (1.0 + np.exp(-features @ weights))
+        gradient = features.T @ (predictions - labels) / len(labels) + penalty * weights
+        weights -= learning_rate * gradient
+    return weights
+
+
+def _labelled_distances(records: List[dict], top_k: int) -> List[List[float]]:
+    """
+    Run retrieval for records that only carry a query
+    """
+    from .chunk_and_index import get_embeddings, get_collection
+
+    pending = [r for r in records if "distances" not in r]
+    if pending:
+        collection = get_collection()
+        embeddings = get_embeddings([r["query"] for r in pending])
+        results = collection.query(query_embeddings=embeddings, n_results=top_k, include=["distances"])
+        for record, distances in zip(pending, results["distances"]):
+            record["distances"] = distances
+    return [r["distances"] for r in records]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate retrieval confidence scoring on a labelled set")
+    parser.add_argument("--labels", required=True, help="JSONL file with query or distances plus label")
+    parser.add_argument("--output", default=CONFIDENCE_CALIBRATION_FILE, help="Where to write the calibration")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("TOP_K", "5")))
+    args = parser.parse_args()
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    distances = _labelled_distances(records, args.top_k)
+    features = np.array([
+        retrieval_features(d, r.get("mean_logprob")) for d, r in zip(distances, records)
+    ])
+    labels = np.array([float(r["label"]) for r in records])
+    weights = fit_weights(features, labels)
+
+    predictions = 1.0 / (1.0 + np.exp(-features @ weights))
+    accuracy = float(np.mean((predictions >= 0.5) == (labels >= 0.5)))
+    brier = float(np.mean((predictions - labels) ** 2))
+
+    calibration = {
+        "weights": {name: round(float(w), 6) for name, w in zip(FEATURES, weights)},
+        "samples": len(records),
+        "accuracy": round(accuracy, 4),
+        "brier_score": round(brier, 4),
+        "distance_space": CHROMA_DISTANCE_SPACE
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(calibration, f, indent=2)
+    print(json.dumps(calibration, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# backend/app/confidence_worker.py
+import os
+import time
+import asyncio
+import datetime
+import structlog
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from .database import AsyncSessionLocal, ENABLE_DATABASE_STORAGE
+from .models import Conversation, Message, ConversationStatus
+from .session_cache import session_cache
+
+# Configure logging
+logger = structlog.get_logger()
+
+CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "70.0"))
+INCLUDE_CONFIDENCE_REASON = os.getenv("INCLUDE_CONFIDENCE_REASON", "false").lower() == "true"
+
+# "inline" scores answers before responding; "background" (opt-in) scores them after the response is sent
+CONFIDENCE_EVALUATION_MODE = os.getenv("CONFIDENCE_EVALUATION_MODE", "inline").lower()
+CONFIDENCE_WORKERS = int(os.getenv("CONFIDENCE_WORKERS", "4"))
+CONFIDENCE_QUEUE_SIZE = int(os.getenv("CONFIDENCE_QUEUE_SIZE", "1000"))
+CONFIDENCE_DRAIN_TIMEOUT = float(os.getenv("CONFIDENCE_DRAIN_TIMEOUT", "10"))
+
+
+def status_for_confidence(confidence_score: float) -> str:
+    """
+    Conversation status implied by a confidence score
+    """
+    if confidence_score < CONFIDENCE_THRESHOLD:
+        return ConversationStatus.WAITING_FOR_MANUAL.value
+    return ConversationStatus.WAITING_FOR_USER.value
+
+
+@dataclass
+class ConfidenceJob:
+    """
+    An assistant message waiting to be scored
+    """
+    message_id: int
+    conversation_id: int
+    query: str
+    context: str
+    answer: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # Called with (confidence_score, confidence_reason) once the answer is scored
+    on_result: Optional[Callable[[float, str], None]] = None
+
+
+class ConfidenceWorker:
+    """
+    In-process queue that scores answers in the background with bounded concurrency
+    and writes the result back to the message and its conversation
+    """
+
+    def __init__(
+        self,
+        evaluate: Callable[..., Awaitable[Tuple[float, str]]],
+        workers: int = CONFIDENCE_WORKERS,
+        queue_size: int = CONFIDENCE_QUEUE_SIZE
+    ):
+        self.evaluate = evaluate
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._total_lag = 0.0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """
+        Start the worker tasks on the running event loop
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        logger.info("Confidence worker started", workers=self.workers, queue_size=self.queue_size)
+
+    async def stop(self, timeout: float = CONFIDENCE_DRAIN_TIMEOUT):
+        """
+        Give queued jobs up to `timeout` seconds to finish, then cancel the workers
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Confidence worker stopped with pending jobs", queue_depth=self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, job: ConfidenceJob) -> bool:
+        """
+        Queue a job without waiting. Returns False if the queue is full and the job was dropped.
+        """
+        if not self.running:
+            self.start()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self._dropped += 1
+            logger.warning("Confidence queue full, answer left unscored", message_id=job.message_id)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and evaluation lag, for sizing the worker pool
+        """
+        return {
+            "mode": CONFIDENCE_EVALUATION_MODE,
+            "running": self.running,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "processed": self._processed,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "last_lag_seconds": round(self._last_lag, 3),
+            "max_lag_seconds": round(self._max_lag, 3),
+            "avg_lag_seconds": round(self._total_lag / self._processed, 3) if self._processed else 0.0
+        }
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._process(job)
+            except Exception as e:
+                self._failed += 1
+                logger.error("Error in confidence worker", error=str(e), message_id=job.message_id)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _process(self, job: ConfidenceJob):
+        confidence_score, confidence_reason = await self.evaluate(
+            query=job.query,
+            context=job.context,
+            answer=job.answer
+        )
+        await apply_confidence(job.message_id, job.conversation_id, confidence_score, confidence_reason)
+        if job.on_result:
+            job.on_result(confidence_score, confidence_reason)
+
+        lag = time.monotonic() - job.enqueued_at
+        self._processed += 1
+        self._total_lag += lag
+        self._last_lag = lag
+        self._max_lag = max(self._max_lag, lag)
+        logger.info(
+            "Confidence evaluated in background",
+            message_id=job.message_id,
+            confidence_score=confidence_score,
+            lag_seconds=round(lag, 3),
+            queue_depth=self._queue.qsize()
+        )
+
+
+async def apply_confidence(message_id: int, conversation_id: int, confidence_score: float, confidence_reason: str):
+    """
+    Store a confidence score on a message and update the conversation status
+
+    The status is only changed while the message is still the latest assistant
+    reply and the conversation has not been closed, so a late evaluation never
+    overrides a newer turn or an operator decision.
+    """
+    if not ENABLE_DATABASE_STORAGE:
+        return
+
+    async with AsyncSessionLocal() as db:
+        message = await db.get(Message, message_id)
+        if not message:
+            return
+        message.confidence_score = confidence_score
+        message.confidence_reason = confidence_reason if INCLUDE_CONFIDENCE_REASON else None
+
+        conversation = await db.get(Conversation, conversation_id)
+        latest = await db.scalar(
+            select(Message.id)
+            .where(Message.conversation_id == conversation_id, Message.role == "assistant")
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(1)
+        )
+        status_changed = False
+        if conversation and latest == message_id \
+                and conversation.status != ConversationStatus.CLOSED.value:
+            status_changed = conversation.status != status_for_confidence(confidence_score)
+            conversation.status = status_for_confidence(confidence_score)
+            conversation.updated_at = datetime.datetime.utcnow()
+        await db.commit()
+    # A conversation sent to (or back from) manual review must not be served from a stale copy
+    if status_changed:
+        session_cache.invalidate(conversation_id)
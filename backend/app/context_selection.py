@@ -0,0 +1,262 @@
+# backend/app/context_selection.py
+"""
+Post-retrieval selection of the chunks sent to the model.
+
+Retrieval over-fetches MMR_CANDIDATES chunks with their embeddings. This stage
+drops near-duplicates (the knowledge base holds raw, clean and enhanced
+variants of the same topics), trims the overlap between neighbouring chunks of
+the same file, and picks TOP_K diverse chunks by maximal marginal relevance.
+
+Before that, retrieved chunks can be cut by similarity: chunks below
+RETRIEVAL_MIN_SIMILARITY are dropped, and the list stops at the first drop in
+similarity larger than RETRIEVAL_MAX_GAP, so a question answered by one chunk
+does not carry TOP_K of them and an off-topic question carries none.
+"""
+import os
+import structlog
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .prompt_builder import count_tokens, CHUNK_SEPARATOR
+from .confidence import distance_to_similarity
+
+# Configure logging
+logger = structlog.get_logger()
+
+MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+# Chunks retrieved before selection
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+# Trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Cosine similarity above which two chunks count as duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.95"))
+# Shortest shared text between neighbouring chunks that is trimmed
+MIN_OVERLAP_CHARS = int(os.getenv("MIN_OVERLAP_CHARS", "40"))
+MAX_OVERLAP_CHARS = int(os.getenv("MAX_OVERLAP_CHARS", "600"))
+
+# Cosine similarity a retrieved chunk needs to be sent to the model (0 disables)
+RETRIEVAL_MIN_SIMILARITY = float(os.getenv("RETRIEVAL_MIN_SIMILARITY", "0"))
+# Drop in similarity between consecutive chunks after which the rest are dropped (0 disables)
+RETRIEVAL_MAX_GAP = float(os.getenv("RETRIEVAL_MAX_GAP", "0"))
+# Chunks kept regardless of the gap once the best one passes the floor
+RETRIEVAL_MIN_CHUNKS = int(os.getenv("RETRIEVAL_MIN_CHUNKS", "1"))
+
+
+@dataclass
+class ContextSelection:
+    """
+    Chunks chosen for the prompt, best first
+    """
+    indexes: List[int]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def relevance_cutoff(
+    distances: Sequence[float],
+    min_similarity: float = RETRIEVAL_MIN_SIMILARITY,
+    max_gap: float = RETRIEVAL_MAX_GAP,
+    min_chunks: int = RETRIEVAL_MIN_CHUNKS
+) -> int:
+    """
+    Number of nearest chunks worth sending to the model
+
+    Args:
+        distances: Distances of the retrieved chunks, nearest first
+        min_similarity: Similarity below which a chunk is dropped
+        max_gap: Similarity drop between consecutive chunks that ends the list
+        min_chunks: Chunks kept before the gap rule applies
+
+    Returns:
+        How many of the leading chunks to keep, 0 when none passes the floor
+    """
+    similarities = [distance_to_similarity(d) for d in distances]
+    keep = 0
+    for position, similarity in enumerate(similarities):
+        if min_similarity > 0 and similarity < min_similarity:
+            break
+        if max_gap > 0 and position >= max(min_chunks, 1) and similarities[position - 1] - similarity > max_gap:
+            break
+        keep += 1
+    return keep
+
+
+def cut_results(
+    results: Dict[str, Any],
+    session_id: Optional[str] = None,
+    min_similarity: float = RETRIEVAL_MIN_SIMILARITY,
+    max_gap: float = RETRIEVAL_MAX_GAP,
+    min_chunks: int = RETRIEVAL_MIN_CHUNKS
+) -> Dict[str, Any]:
+    """
+    Apply relevance_cutoff to a Chroma query result
+
+    Documents, metadatas, ids and embeddings are cut; distances are left whole,
+    since retrieval confidence is calibrated on the full list.
+
+    Args:
+        results: Query result for a single query embedding, nearest first
+        session_id: Session ID, for logging
+        min_similarity, max_gap, min_chunks: As for relevance_cutoff
+
+    Returns:
+        The result with only the chunks that passed the cutoff
+    """
+    if min_similarity <= 0 and max_gap <= 0:
+        return results
+    distances = (results.get("distances") or [[]])[0]
+    keep = relevance_cutoff(distances, min_similarity, max_gap, min_chunks)
+    logger.info(
+        "Retrieval cutoff",
+        session_id=session_id,
+        kept=keep,
+        dropped=len(distances) - keep,
+        best_similarity=round(distance_to_similarity(distances[0]), 4) if len(distances) else None
+    )
+    if keep == len(distances):
+        return results
+    cut = dict(results)
+    for key in ("ids", "documents", "metadatas", "embeddings"):
+        if results.get(key) is not None:
+            cut[key] = [results[key][0][:keep]]
+    return cut
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _overlap(previous: str, current: str) -> int:
+    """
+    Length of the longest suffix of previous that starts current
+    """
+    longest = min(len(previous), len(current), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(current[:size]):
+            return size
+    return 0
+
+
+def _trim_overlaps(documents: List[str], metadatas: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    Remove text a chunk repeats from the previous chunk of the same file
+
+    Returns:
+        Tuple of (trimmed chunks, the overlapping text removed from them)
+    """
+    by_position = {
+        ((metadata or {}).get("source"), (metadata or {}).get("chunk_index")): document
+        for document, metadata in zip(documents, metadatas)
+    }
+    trimmed, removed = [], []
+    for document, metadata in zip(documents, metadatas):
+        metadata = metadata or {}
+        chunk_index = metadata.get("chunk_index")
+        previous = by_position.get((metadata.get("source"), chunk_index - 1)) if isinstance(chunk_index, int) else None
+        size = _overlap(previous, document) if previous else 0
+        trimmed.append(document[size:])
+        if size:
+            removed.append(document[:size])
+    return trimmed, removed
+
+
+def select_context(
+    query_embedding: Sequence[float],
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    embeddings: Optional[Sequence[Optional[Sequence[float]]]],
+    k: int,
+    lambda_: float = MMR_LAMBDA,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    session_id: Optional[str] = None
+) -> ContextSelection:
+    """
+    Pick k diverse, non-duplicate chunks by maximal marginal relevance
+
+    Chunks without an embedding (BM25-only hits in hybrid retrieval) get the
+    median relevance of the others and are only de-duplicated by their text.
+
+    Args:
+        query_embedding: Embedding of the query
+        documents: Candidate chunks, in retrieval order
+        metadatas: Their metadata
+        embeddings: Their embeddings, None where unknown
+        k: Number of chunks to select
+        lambda_: Relevance weight, 1 - lambda_ weights diversity
+        dedup_threshold: Similarity at which a candidate is a duplicate of a selected chunk
+        session_id: Session ID, for logging
+
+    Returns:
+        ContextSelection with the chosen chunks, overlap trimmed, and token stats
+    """
+    count = len(documents)
+    if count == 0:
+        return ContextSelection(indexes=[], documents=[], metadatas=[], stats={})
+
+    dimensions = len(query_embedding)
+    if embeddings is None:
+        embeddings = [None] * count
+    known = np.array([e is not None and len(e) == dimensions for e in embeddings], dtype=bool)
+    vectors = np.zeros((count, dimensions), dtype=np.float32)
+    if known.any():
+        vectors[known] = np.asarray([embeddings[i] for i in np.flatnonzero(known)], dtype=np.float32)
+    vectors = _normalize_rows(vectors)
+    query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+
+    relevance = vectors @ query
+    if known.any() and not known.all():
+        relevance[~known] = np.median(relevance[known])
+    similarity = vectors @ vectors.T
+
+    # Text containment catches duplicates among chunks without embeddings
+    texts = [" ".join(document.split()).casefold() for document in documents]
+
+    selected: List[int] = []
+    duplicates: List[int] = []
+    available = np.ones(count, dtype=bool)
+    max_similarity = np.full(count, -np.inf, dtype=np.float32)
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(available, lambda_ * relevance - (1.0 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        available[best] = False
+        if max_similarity[best] >= dedup_threshold or any(texts[best] in texts[i] for i in selected):
+            duplicates.append(best)
+            continue
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+    trimmed, overlaps = _trim_overlaps([documents[i] for i in selected], [metadatas[i] for i in selected])
+    # A chunk entirely made of overlap adds nothing
+    kept = [position for position, document in enumerate(trimmed) if document.strip()]
+    selected = [selected[position] for position in kept]
+    chosen_documents = [trimmed[position] for position in kept]
+
+    # Without this stage the prompt would carry the first k retrieved chunks as they are
+    tokens_before = count_tokens(CHUNK_SEPARATOR.join(documents[:k]))
+    tokens_after = count_tokens(CHUNK_SEPARATOR.join(chosen_documents))
+    redundant_tokens = sum(count_tokens(documents[i]) for i in duplicates if i < k)
+    redundant_tokens += sum(count_tokens(overlap) for overlap in overlaps)
+    stats = {
+        "candidates": count,
+        "selected": len(selected),
+        "duplicates_removed": len(duplicates),
+        "overlap_chars_trimmed": sum(len(overlap) for overlap in overlaps),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        # Can be negative when diverse chunks replace shorter duplicates
+        "tokens_saved": tokens_before - tokens_after,
+        # Duplicate and overlapping text the first k chunks would have repeated
+        "redundant_tokens_removed": redundant_tokens
+    }
+    logger.info("Context selection", session_id=session_id, **stats)
+    return ContextSelection(
+        indexes=selected,
+        documents=chosen_documents,
+        metadatas=[metadatas[i] for i in selected],
+        stats=stats
+    )
@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
@@ -13,6 +14,89 @@ ENABLE_DATABASE_STORAGE = os.getenv("ENABLE_DATABASE_STORAGE", "true").lower() =
 # Get database URL from environment or use a default SQLite URL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////app/app/data/app.db")
 
+# Connection pool of the async engine used by requests and background workers
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# SQLite has one writer at a time: with a single connection, writers queue for it in the
+# pool instead of busy-waiting on the database file lock
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "1"))
+
+# SQLite settings applied to every connection. WAL lets readers on other connections run
+# while a turn is being saved; with SQLITE_POOL_SIZE=1 the app's own reads still queue behind
+# its writes, and WAL mostly spares fsyncs. Set SQLITE_JOURNAL_MODE=DELETE when the file is
+# on a network filesystem
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+
+# asyncio drivers for the sync URLs DATABASE_URL usually holds
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def async_database_url(url: str) -> str:
+    """
+    DATABASE_URL with an asyncio driver, e.g. sqlite:// -> sqlite+aiosqlite://
+
+    Args:
+        url: SQLAlchemy URL, with or without a driver
+
+    Returns:
+        The URL with the backend's asyncio driver, or unchanged if it has none known
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None or parsed.get_driver_name() == driver:
+        return url
+    return parsed.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+
+def _pool_options(url: str) -> dict:
+    """
+    Pool settings for the async engine; in-memory SQLite keeps its single shared connection
+    """
+    parsed = make_url(url)
+    sqlite = parsed.get_backend_name() == "sqlite"
+    if sqlite and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": SQLITE_POOL_SIZE if sqlite else DB_POOL_SIZE,
+        "max_overflow": 0 if sqlite else DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Apply the SQLITE_* settings to a new connection
+
+    Args:
+        dbapi_connection: sqlite3 or aiosqlite connection just opened by the pool
+        connection_record: Pool record of the connection (unused)
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # A negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _configure_engine(sync_engine):
+    """
+    Register the SQLite connection settings on an engine; other databases are left as they are
+    """
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
 # Create engine and session only if database storage is enabled
 if ENABLE_DATABASE_STORAGE:
     db_path = "./app/app/data"
@@ -20,72 +104,177 @@ if ENABLE_DATABASE_STORAGE:
     os.makedirs(db_path, exist_ok=True)
     print(f"Directory exists: {os.path.exists(db_path)}")
     
-    # Create SQLAlchemy engine
+    # Sync engine, only for creating and migrating the schema at startup
     engine = create_engine(DATABASE_URL)
+    _configure_engine(engine)
+    
+    # Async engine for everything else, so queries and commits do not block the event loop
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL))
+    _configure_engine(async_engine.sync_engine)
+    # Time every statement for the /metrics endpoint
+    from .metrics import instrument_engine
+    instrument_engine(async_engine.sync_engine)
     
-    # Create SessionLocal class
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Objects stay loaded after commit: an expired attribute would need IO to reload
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 else:
     print("Database storage disabled, using dummy database session")
-    # Create dummy engine and session
+    # Create dummy engines and session
     engine = None
+    async_engine = None
     
     # Define a dummy session class that does nothing
+    class DummyResult:
+        def scalars(self):
+            return self
+            
+        def all(self):
+            return []
+            
+        def first(self):
+            return None
+            
+        def scalar(self):
+            return None
+            
+        def scalar_one_or_none(self):
+            return None
+    
     class DummySession:
-        def __init__(self):
+        def add(self, obj):
             pass
             
-        def commit(self):
+        async def execute(self, *args, **kwargs):
+            return DummyResult()
+            
+        async def scalar(self, *args, **kwargs):
+            return None
+            
+        async def scalars(self, *args, **kwargs):
+            return DummyResult()
+            
+        async def flush(self):
             pass
             
-        def close(self):
+        async def commit(self):
             pass
             
-        def add(self, obj):
+        async def refresh(self, obj):
             pass
             
-        def refresh(self, obj):
+        async def close(self):
             pass
             
-        def query(self, *args, **kwargs):
-            class DummyQuery:
-                def filter(self, *args, **kwargs):
-                    return self
-                    
-                def order_by(self, *args, **kwargs):
-                    return self
-                    
-                def limit(self, n):
-                    return self
-                    
-                def all(self):
-                    return []
-                    
-                def first(self):
-                    return None
-            return DummyQuery()
+        async def __aenter__(self):
+            return self
+            
+        async def __aexit__(self, *exc):
+            pass
     
-    # Create a dummy SessionLocal that returns DummySession
-    def SessionLocal():
+    # Create a dummy AsyncSessionLocal that returns DummySession
+    def AsyncSessionLocal():
         return DummySession()
 
 # Create Base class for declarative models
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    if ENABLE_DATABASE_STORAGE:
-        db = SessionLocal()
-        try:
-            yield db
-        finally:
-            db.close()
-    else:
-        # Return a dummy session that does nothing
-        yield SessionLocal()
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def close_db():
+    """Close the async engine's pooled connections on shutdown"""
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def _add_missing_columns():
+    """
+    Add nullable columns introduced after a table was created
+    
+    create_all only creates missing tables, so columns added to an existing
+    model are appended here with ALTER TABLE.
+    """
+    from sqlalchemy import inspect, text
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}")
+
+def _create_index(connection, table_name: str, index_name: str):
+    """
+    Create an index declared on a model if the database does not have it yet
+    
+    Args:
+        connection: Connection of the migration transaction
+        table_name: Table the index belongs to
+        index_name: Name of the Index declared in app.models
+    """
+    index = next(index for index in Base.metadata.tables[table_name].indexes if index.name == index_name)
+    index.create(connection, checkfirst=True)
+
+def _index_messages_by_conversation(connection):
+    # History is read by conversation, newest first
+    _create_index(connection, "messages", "ix_messages_conversation_id_timestamp")
+
+def _index_conversations_by_status(connection):
+    # The manual review queue lists conversations by status
+    _create_index(connection, "conversations", "ix_conversations_status")
+
+def _index_conversations_by_recency(connection):
+    # The conversation list is paged by updated_at, with or without a status filter
+    _create_index(connection, "conversations", "ix_conversations_updated_at_id")
+    _create_index(connection, "conversations", "ix_conversations_status_updated_at_id")
+
+# Schema changes create_all cannot make to existing tables, in the order they were introduced.
+# Versions are never renumbered; add new migrations at the end.
+MIGRATIONS = [
+    (1, "messages (conversation_id, timestamp) index", _index_messages_by_conversation),
+    (2, "conversations.status index", _index_conversations_by_status),
+    (3, "conversations (updated_at, id) and (status, updated_at, id) indexes", _index_conversations_by_recency),
+]
+
+def _run_migrations():
+    """
+    Apply the MIGRATIONS not yet recorded in the schema_migrations table
+    
+    Each migration runs in its own transaction together with its record, so
+    a failed migration is retried on the next start.
+    """
+    from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+    import datetime
+    schema_migrations = Table(
+        "schema_migrations", MetaData(),
+        Column("version", Integer, primary_key=True),
+        Column("description", String),
+        Column("applied_at", DateTime)
+    )
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        applied = set(connection.scalars(select(schema_migrations.c.version)))
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.datetime.utcnow()
+            ))
+        print(f"Applied migration {version}: {description}")
 
 def init_db():
     if ENABLE_DATABASE_STORAGE and engine is not None:
+        # Models must be registered on Base before the schema is compared with them
+        from . import models  # noqa: F401
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
+        _run_migrations()
     else:
         print("Database storage disabled, skipping database initialization")
\ No newline at end of file
@@ -0,0 +1,126 @@
+# backend/app/embedding_batcher.py
+"""
+Micro-batching of embedding requests made on the event loop.
+
+Every chat turn embeds its query with a single-input request. Under load the
+batcher holds texts for up to EMBED_BATCH_WINDOW_MS (or until
+EMBED_BATCH_MAX_SIZE texts are waiting), sends them as one embeddings request
+and hands each waiting coroutine its own vector.
+"""
+import os
+import asyncio
+import structlog
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# Configure logging
+logger = structlog.get_logger()
+
+# Longest wait for other texts to share a request with (0 disables batching)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+# Texts per embeddings request; a full batch is sent without waiting for the window
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+
+EMBED_BATCHING_ENABLED = EMBED_BATCH_WINDOW_MS > 0 and EMBED_BATCH_MAX_SIZE > 1
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts from concurrent callers into shared embeddings requests
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_size: int = EMBED_BATCH_MAX_SIZE
+    ):
+        """
+        Args:
+            embed: Coroutine function embedding a list of texts with one request
+            window_ms: Longest time the first text of a batch waits for others
+            max_size: Texts per request
+        """
+        self._embed = embed
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.texts = 0
+        self.failed = 0
+        self.batch_sizes: Counter = Counter()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in the next batched request
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embedding vectors, in the order of texts
+        """
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # State left by a previous event loop (e.g. between test runs) cannot be awaited here
+            self._loop, self._pending, self._timer = loop, [], None
+
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Callers asking for the same text share one input
+        texts = list(dict.fromkeys(text for text, future in batch if not future.done()))
+        if not texts:
+            return
+        self.requests += 1
+        self.texts += len(texts)
+        self.batch_sizes[len(texts)] += 1
+        try:
+            vectors = dict(zip(texts, await self._embed(texts)))
+        except Exception as e:
+            self.failed += 1
+            logger.error("Error in batched embeddings request", error=str(e), batch_size=len(texts))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": EMBED_BATCHING_ENABLED,
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+            "requests": self.requests,
+            "texts": self.texts,
+            "failed": self.failed,
+            "mean_batch_size": round(self.texts / self.requests, 2) if self.requests else 0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items()))
+        }
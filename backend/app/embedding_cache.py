@@ -0,0 +1,255 @@
+# backend/app/embedding_cache.py
+import os
+import time
+import queue
+import atexit
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import structlog
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence
+
+# Maximum number of vectors kept in memory (0 disables the cache)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# Seconds a cached vector stays valid (0 keeps it until evicted)
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# Optional SQLite file that keeps vectors across restarts, e.g. app/data/embedding_cache.db
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+# Most vectors written to the SQLite file in one transaction
+EMBEDDING_CACHE_WRITE_BATCH = 500
+# Seconds the process waits at exit for queued vectors to be written
+EMBEDDING_CACHE_EXIT_FLUSH_TIMEOUT = 10.0
+
+# Configure logging
+logger = structlog.get_logger()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalise text for cache lookups: case-insensitive, whitespace collapsed
+    """
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    """
+    Key of an embedding: the model name plus a digest of the normalised text
+    """
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embedding vectors with TTL expiry and an optional
+    on-disk SQLite store. Vectors are kept as float32 arrays to save memory.
+
+    The SQLite store never blocks the event loop: get_many_async reads the
+    misses of the memory cache in a worker thread with one query, and put
+    only queues the vector for a writer thread, which stores whatever has
+    queued up in one transaction.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL,
+                 path: str = EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # Reads share a connection with clear(); the writer thread has its own
+        self._db_lock = threading.Lock()
+        self._writes: "queue.Queue[tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path and self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # WAL lets lookups read while the writer thread commits
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, created_at REAL)"
+            )
+            if ttl > 0:
+                self._db.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - ttl,))
+            self._db.commit()
+            self._writer = threading.Thread(target=self._write_loop, name="embedding-cache-writer", daemon=True)
+            self._writer.start()
+            # The writer is a daemon thread: give it a moment to finish the queue when the process exits
+            atexit.register(self.flush, EMBEDDING_CACHE_EXIT_FLUSH_TIMEOUT)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, vector: array, created_at: float):
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_from_disk(self, keys: List[str]) -> Dict[str, tuple]:
+        """
+        Vectors stored on disk for keys, with one query; runs outside the memory lock
+        """
+        if self._db is None or not keys:
+            return {}
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({', '.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+        found = {}
+        for key, blob, created_at in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            found[key] = (vector, created_at)
+        return found
+
+    def _lookup_memory(self, keys: List[str]) -> List[Optional[List[float]]]:
+        with self._lock:
+            results = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self._expired(entry[1]):
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                results.append(entry[0].tolist() if entry is not None else None)
+            return results
+
+    def _fill_from_disk(self, keys: List[str], results: List[Optional[List[float]]], found: Dict[str, tuple]):
+        with self._lock:
+            for i, key in enumerate(keys):
+                if results[i] is not None:
+                    continue
+                entry = found.get(key)
+                if entry is not None and not self._expired(entry[1]):
+                    self._remember(key, entry[0], entry[1])
+                    self.disk_hits += 1
+                    results[i] = entry[0].tolist()
+                else:
+                    self.misses += 1
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Cached embeddings for texts, None for misses; reads the disk store in the calling thread
+        """
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [cache_key(model, text) for text in texts]
+        results = self._lookup_memory(keys)
+        found = self._load_from_disk([key for key, result in zip(keys, results) if result is None])
+        self._fill_from_disk(keys, results, found)
+        return results
+
+    async def get_many_async(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        As get_many, with the disk store read in a worker thread instead of on the event loop
+        """
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [cache_key(model, text) for text in texts]
+        results = self._lookup_memory(keys)
+        missing = [key for key, result in zip(keys, results) if result is None]
+        found = await asyncio.to_thread(self._load_from_disk, missing) if missing and self._db is not None else {}
+        self._fill_from_disk(keys, results, found)
+        return results
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        Cached embedding for text, or None
+        """
+        return self.get_many(model, [text])[0]
+
+    def put(self, model: str, text: str, embedding: Sequence[float]):
+        """
+        Store an embedding in memory and queue it for the disk store, if configured
+        """
+        if not self.enabled:
+            return
+        key = cache_key(model, text)
+        vector = array("f", embedding)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, vector, created_at)
+        if self._writer is not None:
+            self._writes.put((key, vector.tobytes(), created_at))
+
+    def _write_loop(self):
+        connection = sqlite3.connect(self.path)
+        while True:
+            rows = [self._writes.get()]
+            while len(rows) < EMBEDDING_CACHE_WRITE_BATCH:
+                try:
+                    rows.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)", rows
+                    )
+            except Exception as e:
+                # Losing cached vectors only costs embeddings requests; the thread must keep draining
+                logger.error("Error writing embeddings to the disk cache", error=str(e), vectors=len(rows))
+            finally:
+                for _ in rows:
+                    self._writes.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued vector is in the disk store
+
+        Returns:
+            False if vectors were still queued after `timeout` seconds
+        """
+        if self._writer is None:
+            return True
+        with self._writes.all_tasks_done:
+            return self._writes.all_tasks_done.wait_for(lambda: not self._writes.unfinished_tasks, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "persistent": self._db is not None,
+            "queued_writes": self._writes.qsize(),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+# Process-wide cache shared by every caller of get_embeddings
+embedding_cache = EmbeddingCache()
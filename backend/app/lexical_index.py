@@ -0,0 +1,268 @@
+# backend/app/lexical_index.py
+"""
+In-process BM25 index over the knowledge base chunks.
+
+Embedding search is weak on exact identifiers such as article numbers, law
+references ("Lei 23/2007") and form names. This index scores the same chunks
+lexically so the two rankings can be merged with reciprocal rank fusion. It is
+built from Chroma on startup and updated incrementally on upload and delete.
+"""
+import os
+import re
+import math
+import time
+import heapq
+import threading
+import unicodedata
+import structlog
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Configure logging
+logger = structlog.get_logger()
+
+# Merge BM25 and vector results in rag.chat
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "false").lower() == "true"
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Reciprocal rank fusion constant: higher values flatten the contribution of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Records fetched per request while loading the index from Chroma
+LEXICAL_INDEX_LOAD_BATCH = int(os.getenv("LEXICAL_INDEX_LOAD_BATCH", "1000"))
+
+# Identifiers like 23/2007, 2.º or 12-A stay one token; everything else splits on non-word characters
+TOKEN_PATTERN = re.compile(r"\d+(?:[/.\-]\d+)*(?:-[a-z])?|\w+")
+# "23-2007" and "23.2007" are written for "23/2007"
+NUMBER_SEPARATOR = re.compile(r"(?<=\d)[.\-](?=\d)")
+
+STOPWORDS = frozenset("""
+a o as os e de do da dos das em no na nos nas um uma uns umas para por pelo pela pelos pelas com
+sem que se ao aos à às ou não mais como é ser foi são ter tem há the an and or of to in on for is
+are be was it this that with by at from as what how do does can i my me you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-case, accent-free terms of a text without stopwords
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [
+        NUMBER_SEPARATOR.sub("/", token) for token in TOKEN_PATTERN.findall(text)
+        if token not in STOPWORDS
+    ]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Merge ranked id lists: each id scores the sum of 1 / (k + rank) over the lists it appears in
+
+    Returns:
+        (id, score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking, start=1):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    Thread-safe BM25 inverted index of chunks, keyed by their Chroma ids
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # term -> {record id: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+        self.loaded = False
+        self.queries = 0
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def load(self, collection) -> int:
+        """
+        Rebuild the index from every chunk in a Chroma collection
+
+        Args:
+            collection: Sync Chroma collection handle
+
+        Returns:
+            Number of indexed chunks
+        """
+        total = collection.count()
+        # Build a fresh index outside the lock so queries keep being served from the old one
+        fresh = LexicalIndex(self.k1, self.b)
+        for offset in range(0, total, LEXICAL_INDEX_LOAD_BATCH):
+            batch = collection.get(limit=LEXICAL_INDEX_LOAD_BATCH, offset=offset, include=["documents", "metadatas"])
+            fresh._add(batch["ids"], batch["documents"], batch["metadatas"])
+        with self._lock:
+            self._postings, self._lengths = fresh._postings, fresh._lengths
+            self._documents, self._metadatas = fresh._documents, fresh._metadatas
+            self._total_length = fresh._total_length
+            self.loaded = True
+            self.loaded_at = time.time()
+        logger.info("Lexical index loaded from Chroma", records=len(self), terms=len(self._postings))
+        return len(self)
+
+    def _add(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]):
+        for record_id, document, metadata in zip(ids, documents, metadatas):
+            if record_id in self._lengths:
+                self._remove(record_id)
+            terms = Counter(tokenize(document or ""))
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[record_id] = frequency
+            length = sum(terms.values())
+            self._lengths[record_id] = length
+            self._total_length += length
+            self._documents[record_id] = document
+            self._metadatas[record_id] = metadata or {}
+
+    def _remove(self, record_id: str):
+        for term in set(tokenize(self._documents[record_id] or "")):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(record_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(record_id)
+        del self._documents[record_id]
+        del self._metadatas[record_id]
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Index chunks that were just added to Chroma
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._add(ids, documents, metadatas)
+
+    def delete(self, where: Dict[str, Any]):
+        """
+        Mirror a Chroma delete by metadata equality, e.g. {"source": filename}
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            doomed = [
+                record_id for record_id, metadata in self._metadatas.items()
+                if all(metadata.get(key) == value for key, value in where.items())
+            ]
+            for record_id in doomed:
+                self._remove(record_id)
+
+    def clear(self):
+        """
+        Mirror the collection being dropped and recreated empty
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._postings, self._lengths, self._documents, self._metadatas = {}, {}, {}, {}
+            self._total_length = 0
+
+    def query(self, text: str, n_results: int) -> List[Dict[str, Any]]:
+        """
+        Top chunks by BM25 score
+
+        Args:
+            text: Query text
+            n_results: Number of chunks to return
+
+        Returns:
+            List of {"id", "document", "metadata", "score"}, best first
+        """
+        with self._lock:
+            self.queries += 1
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for record_id, frequency in postings.items():
+                    norm = self.k1 * (1.0 - self.b + self.b * self._lengths[record_id] / average_length)
+                    scores[record_id] = scores.get(record_id, 0.0) + idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+            best = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+            return [
+                {"id": record_id, "document": self._documents[record_id],
+                 "metadata": self._metadatas[record_id], "score": score}
+                for record_id, score in best
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": HYBRID_RETRIEVAL,
+            "loaded": self.loaded,
+            "records": len(self._lengths),
+            "terms": len(self._postings),
+            "queries": self.queries,
+            "loaded_at": self.loaded_at
+        }
+
+
+def fuse_results(vector_results: Dict[str, Any], lexical_hits: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+    """
+    Merge a single-query Chroma result with BM25 hits by reciprocal rank fusion
+
+    Args:
+        vector_results: Chroma query result (ids, documents, metadatas, distances, optionally embeddings)
+        lexical_hits: Result of LexicalIndex.query
+        n_results: Number of chunks to keep
+
+    Returns:
+        Result in Chroma's shape. Distances are those of the top n_results vector
+        hits, since lexical-only chunks have none, and are only meant for
+        retrieval confidence scoring. Embeddings, when requested from the vector
+        query, are None for lexical-only chunks.
+    """
+    vector_ids = vector_results.get("ids", [[]])[0]
+    records = {
+        record_id: (document, metadata)
+        for record_id, document, metadata in zip(
+            vector_ids, vector_results.get("documents", [[]])[0], vector_results.get("metadatas", [[]])[0]
+        )
+    }
+    for hit in lexical_hits:
+        records.setdefault(hit["id"], (hit["document"], hit["metadata"]))
+    lexical_ids = [hit["id"] for hit in lexical_hits]
+
+    fused = [record_id for record_id, _ in reciprocal_rank_fusion([vector_ids, lexical_ids])][:n_results]
+    in_vector, in_lexical = set(vector_ids), set(lexical_ids)
+    logger.info(
+        "Hybrid retrieval",
+        both=sum(1 for i in fused if i in in_vector and i in in_lexical),
+        vector_only=sum(1 for i in fused if i not in in_lexical),
+        lexical_only=sum(1 for i in fused if i not in in_vector)
+    )
+    fused_results = {
+        "ids": [fused],
+        "documents": [[records[i][0] for i in fused]],
+        "metadatas": [[records[i][1] for i in fused]],
+        "distances": [list(vector_results.get("distances", [[]])[0][:n_results])]
+    }
+    if vector_results.get("embeddings") is not None:
+        embeddings = dict(zip(vector_ids, vector_results["embeddings"][0]))
+        fused_results["embeddings"] = [[embeddings.get(i) for i in fused]]
+    return fused_results
+
+
+# Process-wide lexical index of the knowledge base collection
+lexical_index = LexicalIndex()
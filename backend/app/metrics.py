@@ -0,0 +1,164 @@
+# backend/app/metrics.py
+"""
+Per-stage latency, token and error metrics.
+
+Stages are timed with `timed(stage)` and recorded in Prometheus histograms,
+served by the /metrics endpoint. Inside `track_request(operation)` the stage
+timings of the current request are also collected and logged as one
+"Request timings" line when the request ends.
+"""
+import time
+import structlog
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Configure logging
+logger = structlog.get_logger()
+
+# Upstream calls take from milliseconds (cache, SQLite) to tens of seconds (completions)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_DURATION = Histogram(
+    "rag_request_duration_seconds", "End-to-end duration of an operation",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("rag_requests_total", "Operations by outcome", ["operation", "outcome"])
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds", "Duration of a stage of an operation",
+    ["operation", "stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Exceptions raised by a stage", ["operation", "stage"])
+TOKENS = Counter("rag_tokens_total", "Tokens reported by the OpenAI API", ["model", "stage", "kind"])
+DB_QUERY_DURATION = Histogram(
+    "rag_db_query_duration_seconds", "Duration of a SQL statement",
+    ["statement"], buckets=LATENCY_BUCKETS
+)
+
+# Breakdown of the request being handled: operation name, stage -> seconds, tokens
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("rag_request_timings", default=None)
+
+
+def _operation() -> str:
+    current = _current.get()
+    return current["operation"] if current else "background"
+
+
+@contextmanager
+def track_request(operation: str, **fields) -> Iterator[Dict[str, Any]]:
+    """
+    Time an operation and log the stage breakdown collected while it runs
+
+    Args:
+        operation: Operation name, e.g. "chat" or "index_file"
+        fields: Extra fields for the log line, e.g. session_id
+
+    Yields:
+        The fields dict, which the caller may add to before the line is logged.
+        Setting "outcome" there overrides the default "ok" for operations that
+        report failure without raising.
+    """
+    current = {"operation": operation, "stages": {}, "tokens": {}}
+    token = _current.set(current)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield fields
+        outcome = fields.pop("outcome", "ok")
+    finally:
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        REQUEST_DURATION.labels(operation).observe(elapsed)
+        REQUESTS.labels(operation, outcome).inc()
+        logger.info(
+            "Request timings",
+            operation=operation,
+            outcome=outcome,
+            total_ms=round(elapsed * 1000, 1),
+            **{f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in current["stages"].items()},
+            **{f"{kind}_tokens": count for kind, count in current["tokens"].items()},
+            **fields
+        )
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a stage of the current operation; exceptions are counted and re-raised
+    """
+    operation = _operation()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(operation, stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.labels(operation, stage).observe(elapsed)
+        current = _current.get()
+        if current is not None:
+            current["stages"][stage] = current["stages"].get(stage, 0.0) + elapsed
+
+
+def record_usage(stage: str, model: str, usage: Any):
+    """
+    Count the tokens of an OpenAI response
+
+    Args:
+        stage: Stage that made the call, e.g. "completion" or "embedding"
+        model: Model name
+        usage: The response's usage object (may be None)
+    """
+    if usage is None:
+        return
+    current = _current.get()
+    # Prompt tokens served from the provider's prompt cache (billed at a discount)
+    details = getattr(usage, "prompt_tokens_details", None)
+    counts = {
+        "prompt": getattr(usage, "prompt_tokens", None),
+        "completion": getattr(usage, "completion_tokens", None),
+        "cached_prompt": getattr(details, "cached_tokens", None)
+    }
+    for kind, count in counts.items():
+        if not count:
+            continue
+        TOKENS.labels(model, stage, kind).inc(count)
+        if current is not None:
+            key = f"{stage}_{kind}"
+            current["tokens"][key] = current["tokens"].get(key, 0) + count
+
+
+def instrument_engine(engine):
+    """
+    Time every SQL statement run through a SQLAlchemy engine
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_DURATION.labels((statement.split(None, 1) or ["?"])[0].upper()).observe(elapsed)
+        current = _current.get()
+        if current is not None:
+            current["stages"]["sql"] = current["stages"].get("sql", 0.0) + elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        STAGE_ERRORS.labels(_operation(), "sql").inc()
+
+
+def render_metrics():
+    """
+    Body and content type of the Prometheus exposition
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
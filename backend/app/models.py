@@ -1,10 +1,10 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from app.database import Base
 import json
 import datetime
 from enum import Enum
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -24,6 +24,20 @@ class ChatResponse(BaseModel):
     session_id: str = Field(..., description="Session ID for conversation tracking")
     confidence_score: Optional[float] = None
 
+class StructuredAnswer(BaseModel):
+    """
+    Answer and self-assessed confidence returned by a single structured completion
+    """
+    answer: str = Field(..., description="Answer to the user query")
+    confidence: float = Field(..., description="Confidence in the answer from 0 to 100")
+    confidence_reason: str = Field(..., description="Short justification of the confidence score")
+
+    @field_validator("confidence")
+    @classmethod
+    def clamp_confidence(cls, value: float) -> float:
+        # An out-of-range score is clamped like the judge's, not a reason to discard the answer
+        return max(0.0, min(100.0, value))
+
 class ConversationStatus(str, Enum):
     WAITING_FOR_MANUAL = "waiting_for_manual"
     WAITING_FOR_USER = "waiting_for_user"
@@ -37,20 +51,30 @@ class MessageType(str, Enum):
 # Use them in your models like this:
 class Conversation(Base):
     __tablename__ = "conversations"
+    # The conversation list pages by recency, optionally within one status
+    __table_args__ = (
+        Index("ix_conversations_updated_at_id", "updated_at", "id"),
+        Index("ix_conversations_status_updated_at_id", "status", "updated_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     # Change this line
-    status = Column(String, default=ConversationStatus.WAITING_FOR_USER.value)
+    status = Column(String, default=ConversationStatus.WAITING_FOR_USER.value, index=True)
     user_phone = Column(String, nullable=True)
     user_name = Column(String, nullable=True)
+    # Running summary of older turns and the id of the last message folded into it
+    summary = Column(Text, nullable=True)
+    summarized_until_id = Column(Integer, nullable=True)
     
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
 class Message(Base):
     __tablename__ = "messages"
+    # History is loaded per conversation in timestamp order
+    __table_args__ = (Index("ix_messages_conversation_id_timestamp", "conversation_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
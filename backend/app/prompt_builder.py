@@ -0,0 +1,192 @@
+# backend/app/prompt_builder.py
+import os
+import math
+import structlog
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# Configure logging
+logger = structlog.get_logger()
+
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+# Maximum input tokens of a chat completion (system prompt, summary, history, context and query)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+# Tokens kept free for retrieved chunks while history is being added
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "1500"))
+
+# Where retrieved context goes: "system" fills the system prompt's {context},
+# "prefix_cache" keeps the system prompt and history identical between turns and
+# sends the context in a message just before the query, so the provider's
+# automatic prompt caching can reuse the conversation prefix
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "system").lower()
+# Replaces {context} in the system prompt with the prefix_cache layout
+PROMPT_CONTEXT_NOTE = os.getenv("PROMPT_CONTEXT_NOTE", "(the context is provided right before each question)")
+# Message carrying the context with the prefix_cache layout
+PROMPT_CONTEXT_MESSAGE = os.getenv("PROMPT_CONTEXT_MESSAGE", "Context for the next question:\n\n{context}")
+
+# Chat format overhead: tokens added around every message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+CHUNK_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """
+    tiktoken encoding for a model, or None if tiktoken or its data files are unavailable
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("tiktoken unavailable, estimating tokens from characters", model=model, error=str(e))
+        return None
+
+
+def count_tokens(text: str, model: str = MODEL_NAME) -> int:
+    """
+    Number of tokens in text for the chat model
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = MODEL_NAME) -> str:
+    """
+    Cut text down to at most max_tokens tokens
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+@dataclass
+class Prompt:
+    """
+    Messages for a chat completion and what was left out to fit the budget
+    """
+    messages: List[Dict[str, str]]
+    context: str
+    chunk_indexes: List[int]
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def build_prompt(
+    system_template: str,
+    history: List[Dict[str, str]],
+    query: str,
+    chunks: List[str],
+    budget: int = PROMPT_TOKEN_BUDGET,
+    context_min_tokens: int = CONTEXT_MIN_TOKENS,
+    model: str = MODEL_NAME,
+    session_id: Optional[str] = None,
+    summary_message: Optional[Dict[str, str]] = None,
+    layout: str = PROMPT_LAYOUT
+) -> Prompt:
+    """
+    Assemble the chat messages within a token budget
+
+    The system prompt, the conversation summary and the query are always sent.
+    The remaining budget goes to the newest conversation turns first (leaving
+    context_min_tokens for context), then to retrieved chunks in rank order. A chunk that does not fit
+    is skipped, except the top-ranked one, which is truncated rather than dropped.
+
+    With the "prefix_cache" layout the messages are system prompt, summary,
+    history, context, query: everything before the context is what the
+    previous turn sent, plus that turn's query and answer.
+
+    Args:
+        system_template: System prompt with a {context} placeholder
+        history: Previous messages in chronological order
+        query: Current user query
+        chunks: Retrieved chunks, best first
+        budget: Maximum input tokens
+        context_min_tokens: Tokens reserved for chunks while adding history
+        model: Chat model, for the tokenizer
+        session_id: Session ID, for logging
+        summary_message: Summary of turns older than history, sent after the system prompt
+        layout: "system" or "prefix_cache", see PROMPT_LAYOUT
+
+    Returns:
+        Prompt with the messages, the context actually used and token usage by section
+    """
+    prefix_cache = layout == "prefix_cache"
+    if prefix_cache:
+        system_content = system_template.replace("{context}", PROMPT_CONTEXT_NOTE)
+        system_tokens = (
+            count_tokens(system_content, model)
+            + count_tokens(PROMPT_CONTEXT_MESSAGE.replace("{context}", ""), model)
+            + 2 * TOKENS_PER_MESSAGE
+        )
+    else:
+        system_tokens = count_tokens(system_template.replace("{context}", ""), model) + TOKENS_PER_MESSAGE
+    query_tokens = count_tokens(query, model) + TOKENS_PER_MESSAGE
+    summary_tokens = count_tokens(summary_message["content"], model) + TOKENS_PER_MESSAGE if summary_message else 0
+    remaining = budget - system_tokens - summary_tokens - query_tokens - TOKENS_PER_REPLY
+
+    # Newest turns first, stopping at the first one that no longer fits
+    history_budget = max(0, remaining - context_min_tokens)
+    history_tokens = 0
+    kept_history: List[Dict[str, str]] = []
+    for message in reversed(history):
+        tokens = count_tokens(message["content"], model) + TOKENS_PER_MESSAGE
+        if history_tokens + tokens > history_budget:
+            break
+        kept_history.append(message)
+        history_tokens += tokens
+    kept_history.reverse()
+    remaining -= history_tokens
+
+    # Highest-ranked chunks next
+    separator_tokens = count_tokens(CHUNK_SEPARATOR, model)
+    context_tokens = 0
+    selected: List[str] = []
+    chunk_indexes: List[int] = []
+    for index, chunk in enumerate(chunks):
+        tokens = count_tokens(chunk, model) + (separator_tokens if selected else 0)
+        if context_tokens + tokens <= remaining:
+            selected.append(chunk)
+            chunk_indexes.append(index)
+            context_tokens += tokens
+        elif index == 0 and remaining > 0:
+            selected.append(truncate_to_tokens(chunk, remaining, model))
+            chunk_indexes.append(index)
+            context_tokens += count_tokens(selected[0], model)
+    context = CHUNK_SEPARATOR.join(selected)
+
+    if prefix_cache:
+        messages = [{"role": "system", "content": system_content}]
+    else:
+        messages = [{"role": "system", "content": system_template.replace("{context}", context)}]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(kept_history)
+    if prefix_cache and context:
+        messages.append({"role": "system", "content": PROMPT_CONTEXT_MESSAGE.replace("{context}", context)})
+    messages.append({"role": "user", "content": query})
+
+    usage = {
+        "budget": budget,
+        "system": system_tokens,
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "context": context_tokens,
+        "query": query_tokens,
+        "total": system_tokens + summary_tokens + history_tokens + context_tokens + query_tokens + TOKENS_PER_REPLY,
+        "history_messages": len(kept_history),
+        "history_messages_dropped": len(history) - len(kept_history),
+        "chunks": len(chunk_indexes),
+        "chunks_dropped": len(chunks) - len(chunk_indexes)
+    }
+    logger.info("Prompt token usage", session_id=session_id, layout=layout, **usage)
+    return Prompt(messages=messages, context=context, chunk_indexes=chunk_indexes, usage=usage)
@@ -1,17 +1,38 @@
 # backend/app/rag.py
 import os
+import re
 import uuid
+import asyncio
 import structlog
 from fastapi import Request, Depends, HTTPException
-from sqlalchemy.orm import Session
-from openai import OpenAI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from openai import AsyncOpenAI
 from .database import get_db
 
 from app.models import Conversation, Message
-from .models import ChatRequest, ChatResponse
-from .chunk_and_index import get_chroma_client, get_embeddings
+from .models import ChatRequest, ChatResponse, StructuredAnswer
+from .chunk_and_index import get_async_collection, reset_collection_handles, get_embeddings_async
+from .answer_cache import answer_cache, CachedAnswer
+from .session_cache import session_cache
+from .turn_writer import TurnWriter, PendingTurn, WriteBehindTimeout, CHAT_PERSISTENCE_MODE
+from .embedding_cache import normalize_text
+from .single_flight import SingleFlight
+from .metrics import track_request, timed, record_usage
+from .prompt_builder import build_prompt
+from .summarizer import conversation_summarizer, summary_message
+from .lexical_index import lexical_index, fuse_results, HYBRID_RETRIEVAL, HYBRID_CANDIDATES
+from .vector_index import vector_index, LOCAL_VECTOR_INDEX, VECTOR_INDEX_THREAD_MIN
+from .context_selection import select_context, cut_results, MMR_ENABLED, MMR_CANDIDATES
+from .confidence import retrieval_confidence, mean_token_logprob, CONFIDENCE_USE_LOGPROBS
+from .confidence_worker import ConfidenceWorker, ConfidenceJob, CONFIDENCE_EVALUATION_MODE, status_for_confidence
 import datetime
 import json
+from functools import partial
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from chromadb.errors import NotFoundError
 
 # Configure logging
 logger = structlog.get_logger()
@@ -33,6 +54,9 @@ TOP_K = int(os.getenv("TOP_K", "5"))
 
 CONTEXT_MEMORY = int(os.getenv("CONTEXT_MEMORY", "20"))
 
+# Identical first-turn questions arriving while one is being answered wait for and share its answer
+CHAT_COALESCING = os.getenv("CHAT_COALESCING", "true").lower() == "true"
+
 # System prompt template
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", 
                          "You are an expert assistant. Use the following context to answer:\n\n{context}\n\nAnswer conversationally. If you don't know the answer based on the provided context, say so.")
@@ -49,17 +73,532 @@ Consider these factors:
 First explain your reasoning, then output only a number between 0-100 on the final line.
 """)
 INCLUDE_CONFIDENCE_REASON = os.getenv("INCLUDE_CONFIDENCE_REASON", "false").lower() == "true"
+
+# How answers are scored: "judge" runs a second completion over query, context and answer,
+# "structured" has the main completion return the answer and its confidence as one JSON object,
+# "retrieval" scores from retrieval distances (and optionally token logprobs) with no extra call
+CONFIDENCE_STRATEGY = os.getenv("CONFIDENCE_STRATEGY", "judge").lower()
+STRUCTURED_CONFIDENCE_PROMPT = os.getenv("STRUCTURED_CONFIDENCE_PROMPT", """
+Reply with a JSON object with these fields:
+- "answer": your answer to the user
+- "confidence": your confidence in that answer from 0 to 100, considering how directly the context addresses the query, whether the information is complete or partial, whether the sources contradict each other and how specific your answer is
+- "confidence_reason": one short sentence explaining the confidence score
+""")
+# Extra completion tokens for the JSON wrapper and reason, so the answer keeps its MAX_TOKENS budget
+STRUCTURED_EXTRA_TOKENS = int(os.getenv("STRUCTURED_EXTRA_TOKENS", "96"))
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "answer_with_confidence",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "answer": {"type": "string"},
+                "confidence": {"type": "number"},
+                "confidence_reason": {"type": "string"}
+            },
+            "required": ["answer", "confidence", "confidence_reason"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# The "answer" string of a structured reply whose JSON is broken further on
+STRUCTURED_ANSWER_FIELD = re.compile(r'"answer"\s*:\s*("(?:[^"\\]|\\.)*")')
+
 EXPOSE_CONFIDENCE_SCORE = os.getenv("EXPOSE_CONFIDENCE_SCORE", "false").lower() == "true"
 
 ENABLE_DATABASE_STORAGE = os.getenv("ENABLE_DATABASE_STORAGE", "true").lower() == "true"
 
-# Configure OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Configure OpenAI client (async so a chat turn never blocks the event loop)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+@dataclass
+class ChatTurn:
+   """
+   State of a chat turn between retrieval and answer generation
+   """
+   query: str
+   session_id: str
+   conversation: Optional[Conversation]
+   context: str
+   sources: List[str]
+   messages: List[Dict[str, str]]
+   distances: List[float]
+   query_embedding: List[float]
+   first_turn: bool
+   kb_version: int
+   cached_answer: Optional[CachedAnswer] = None
+   # Messages not yet folded into the conversation summary, before this turn
+   unsummarized_messages: int = 0
+
+
+async def _vector_query(query_embedding: List[float], n_results: int) -> Dict[str, Any]:
+   """
+   Retrieve the closest chunks with a single Chroma request
+
+   If the collection was dropped or recreated since the handle was cached,
+   the handle is refreshed and the query retried once. When the local vector
+   index replica is loaded, it answers instead and Chroma is not contacted.
+   With MMR_ENABLED the chunk embeddings are returned as well.
+   """
+   if LOCAL_VECTOR_INDEX and vector_index.loaded:
+       if len(vector_index) < VECTOR_INDEX_THREAD_MIN:
+           return vector_index.query(query_embedding, n_results, MMR_ENABLED)
+       # NumPy releases the GIL, so large scans do not stall other requests
+       return await asyncio.to_thread(vector_index.query, query_embedding, n_results, MMR_ENABLED)
+   
+   include = ["documents", "metadatas", "distances"]
+   if MMR_ENABLED:
+       include.append("embeddings")
+   
+   for attempt in range(2):
+       collection = await get_async_collection()
+       try:
+           return await collection.query(
+               query_embeddings=[query_embedding],
+               n_results=n_results,
+               include=include
+           )
+       except NotFoundError:
+           if attempt:
+               raise
+           logger.warning("Chroma collection handle is stale, refreshing", collection=COLLECTION_NAME)
+           reset_collection_handles()
+
+
+async def query_collection(
+   query_embedding: List[float],
+   query_text: Optional[str] = None,
+   session_id: Optional[str] = None
+) -> Dict[str, Any]:
+   """
+   Retrieve the TOP_K most relevant chunks, or MMR_CANDIDATES with MMR_ENABLED
+
+   With HYBRID_RETRIEVAL, HYBRID_CANDIDATES vector hits are merged with as many
+   BM25 hits for query_text by reciprocal rank fusion. The in-process BM25
+   lookup runs while the vector request is in flight. Vector hits below the
+   similarity cutoff are dropped first; when none is left the question is
+   off-topic and the BM25 hits are not used either.
+   """
+   n_results = max(TOP_K, MMR_CANDIDATES) if MMR_ENABLED else TOP_K
+   if not (HYBRID_RETRIEVAL and lexical_index.loaded and query_text):
+       return cut_results(await _vector_query(query_embedding, n_results), session_id)
+   
+   vector_task = asyncio.create_task(_vector_query(query_embedding, max(n_results, HYBRID_CANDIDATES)))
+   await asyncio.sleep(0)  # let the vector request go out first
+   lexical_hits = lexical_index.query(query_text, HYBRID_CANDIDATES)
+   vector_results = cut_results(await vector_task, session_id)
+   if not vector_results["documents"][0]:
+       lexical_hits = []
+   return fuse_results(vector_results, lexical_hits, n_results)
+
+
+async def load_conversation(session_id: str, db: AsyncSession) -> Tuple[Optional[Conversation], List[Message], Optional[str]]:
+   """
+   Get or create the conversation and load the history sent with the next turn
+   
+   Args:
+       session_id: Session ID of the conversation
+       db: Database session
+       
+   Returns:
+       Tuple of (conversation, messages not yet summarized in chronological order, summary),
+       with no conversation and empty history when database storage is disabled. Messages
+       served from the session cache are CachedMessage copies with id, role and content.
+   """
+   # A session that was read or saved recently is answered from memory
+   if ENABLE_DATABASE_STORAGE:
+       # Turns of this session still queued for write-behind are written first
+       await turn_writer.wait_for(session_id)
+       state = session_cache.get(session_id)
+       if state is not None:
+           conversation = state.conversation()
+           # Attached without a query, so finish_chat can update it
+           db.add(conversation)
+           return conversation, list(state.messages), state.summary
+   cache_version = session_cache.version
+   
+   # Get or create conversation in database only if database storage is enabled
+   conversation = None
+   if ENABLE_DATABASE_STORAGE:
+       conversation = await db.scalar(select(Conversation).where(Conversation.session_id == session_id))
+       if not conversation:
+           conversation = Conversation(session_id=session_id)
+           db.add(conversation)
+           await db.commit()
+           await db.refresh(conversation)
+   
+   # Initialize messages_history as empty
+   messages_history = []
+   
+   # Get conversation history from database only if database storage is enabled.
+   # Messages already folded into the conversation summary are not loaded again.
+   summary = None
+   if ENABLE_DATABASE_STORAGE and conversation:
+       summary = conversation.summary
+       history_query = select(Message).where(Message.conversation_id == conversation.id)
+       if conversation.summarized_until_id:
+           history_query = history_query.where(Message.id > conversation.summarized_until_id)
+       messages_history = list((await db.scalars(
+           history_query
+           .order_by(Message.timestamp.desc())
+           .limit(CONTEXT_MEMORY * 2)  # Get pairs of messages
+       )).all())
+       messages_history.reverse()  # Reverse to get chronological order
+       # End the read transaction, so no pooled connection is held while the answer is generated
+       await db.commit()
+       session_cache.store(conversation, messages_history, cache_version)
+   
+   return conversation, messages_history, summary
+
+
+async def prepare_chat(query: str, session_id: str, db: AsyncSession) -> ChatTurn:
+   """
+   Load the conversation, retrieve context and build the OpenAI messages for a turn
+   
+   Args:
+       query: User query
+       session_id: Session ID of the conversation
+       db: Database session
+       
+   Returns:
+       ChatTurn ready to be sent to the chat completion API
+   """
+   with timed("load_conversation"):
+       conversation, messages_history, summary = await load_conversation(session_id, db)
+   return await retrieve_context(query, session_id, conversation, messages_history, summary)
+
+
+async def retrieve_context(
+   query: str,
+   session_id: str,
+   conversation: Optional[Conversation],
+   messages_history: List[Message],
+   summary: Optional[str]
+) -> ChatTurn:
+   """
+   Embed the query, retrieve context and build the OpenAI messages for a turn
+   
+   Args:
+       query: User query
+       session_id: Session ID of the conversation
+       conversation: Conversation returned by load_conversation
+       messages_history: History returned by load_conversation
+       summary: Conversation summary returned by load_conversation
+       
+   Returns:
+       ChatTurn ready to be sent to the chat completion API
+   """
+   # Get embedding for the query
+   with timed("embedding"):
+       query_embedding = (await get_embeddings_async([query]))[0]
+   kb_version = answer_cache.kb_version(COLLECTION_NAME)
+   
+   # A first-turn question close enough to an earlier one reuses its answer
+   first_turn = not messages_history and not summary
+   if first_turn:
+       cached_answer = answer_cache.lookup(COLLECTION_NAME, query_embedding)
+       if cached_answer:
+           logger.info("Answer cache hit", session_id=session_id, cached_query=cached_answer.query[:50])
+           return ChatTurn(
+               query=query,
+               session_id=session_id,
+               conversation=conversation,
+               context=cached_answer.context,
+               sources=cached_answer.sources,
+               messages=[],
+               distances=[],
+               query_embedding=query_embedding,
+               first_turn=True,
+               kb_version=kb_version,
+               cached_answer=cached_answer
+           )
+   
+   # Query Chroma for relevant chunks through the cached collection handle
+   with timed("retrieval"):
+       results = await query_collection(query_embedding, query, session_id)
+   
+   # Extract documents, their sources and distances
+   documents = results.get("documents", [[]])[0]
+   metadatas = results.get("metadatas", [[]])[0]
+   distances = results.get("distances", [[]])[0]
+   
+   # Drop near-duplicates and overlap from the over-fetched candidates and keep TOP_K diverse chunks
+   if MMR_ENABLED:
+       embeddings = results.get("embeddings")
+       selection = select_context(
+           query_embedding,
+           list(documents),
+           list(metadatas),
+           embeddings[0] if embeddings is not None else None,
+           TOP_K,
+           session_id=session_id
+       )
+       documents, metadatas = selection.documents, selection.metadatas
+       # Confidence is calibrated on the distances of the TOP_K nearest chunks
+       distances = distances[:TOP_K]
+   
+   # Fit system prompt, newest turns and highest-ranked chunks into the token budget
+   prompt = build_prompt(
+       SYSTEM_PROMPT,
+       [{"role": msg.role, "content": msg.content} for msg in messages_history],
+       query,
+       list(documents),
+       session_id=session_id,
+       summary_message=summary_message(summary) if summary else None
+   )
+   current_context = prompt.context
+   openai_messages = prompt.messages
+   
+   # Get sources of the chunks that made it into the prompt
+   sources = [metadatas[i].get("source", "unknown") for i in prompt.chunk_indexes]
+   unique_sources = list(set(sources))
+   
+   return ChatTurn(
+       query=query,
+       session_id=session_id,
+       conversation=conversation,
+       context=current_context,
+       sources=unique_sources,
+       messages=openai_messages,
+       distances=list(distances),
+       query_embedding=query_embedding,
+       first_turn=first_turn,
+       kb_version=kb_version,
+       unsummarized_messages=len(messages_history)
+   )
+
+
+def _cached_answer_scored(entry: CachedAnswer, confidence_score: float, confidence_reason: str):
+   """
+   Score a cached answer evaluated in the background; one sent to manual review is no longer served
+   """
+   entry.set_confidence(confidence_score, confidence_reason)
+   if confidence_score < CONFIDENCE_THRESHOLD:
+       answer_cache.discard(COLLECTION_NAME, entry)
+       logger.info("Dropped cached answer below confidence threshold", cached_query=entry.query[:50],
+                   confidence_score=confidence_score)
+
+
+async def finish_chat(
+   turn: ChatTurn,
+   answer: str,
+   db: AsyncSession,
+   evaluate_inline: Optional[bool] = None,
+   confidence: Optional[Tuple[float, str]] = None
+) -> ChatResponse:
+   """
+   Score the generated answer, persist the turn and build the response
+   
+   In background mode the answer is saved unscored and queued on the confidence
+   worker, which fills in the score and conversation status after the response
+   has been sent. Without database storage there is nothing to update later,
+   so background mode skips the evaluation.
+   
+   Args:
+       turn: ChatTurn returned by prepare_chat
+       answer: Generated answer, including RESPONSE_PREFIX if configured
+       db: Database session
+       evaluate_inline: Score before returning; defaults to CONFIDENCE_EVALUATION_MODE
+       confidence: (score, reason) already produced with the answer, skips evaluation
+       
+   Returns:
+       ChatResponse with answer, sources and session_id
+   """
+   if evaluate_inline is None:
+       evaluate_inline = CONFIDENCE_EVALUATION_MODE != "background"
+   
+   # A cached answer keeps the score it was given the first time
+   cached = turn.cached_answer
+   if confidence is None and cached is not None and cached.confidence_score is not None:
+       confidence = (cached.confidence_score, cached.confidence_reason)
+   
+   # Evaluate confidence in the answer unless it came with it
+   confidence_score, confidence_reason = confidence if confidence is not None else (None, None)
+   if confidence is None and evaluate_inline:
+       confidence_score, confidence_reason = await evaluate_confidence(
+           query=turn.query,
+           context=turn.context,
+           answer=answer,
+           client=client
+       )
+   
+   # Remember first-turn answers for near-duplicate questions, except ones sent to manual review
+   cache_entry = None
+   if turn.first_turn and cached is None and (confidence_score is None or confidence_score >= CONFIDENCE_THRESHOLD):
+       cache_entry = CachedAnswer(
+           query=turn.query,
+           answer=answer,
+           sources=turn.sources,
+           context=turn.context,
+           confidence_score=confidence_score,
+           confidence_reason=confidence_reason
+       )
+       answer_cache.store(COLLECTION_NAME, turn.kb_version, turn.query_embedding, cache_entry)
+   
+   # Only save to database if database storage is enabled
+   conversation = turn.conversation
+   if ENABLE_DATABASE_STORAGE and conversation and CHAT_PERSISTENCE_MODE == "write_behind":
+       if confidence_score is not None:
+           logger.info(f"Confidence score: {confidence_score}")
+       # Durable in the spill file once submit returns; written to the database with other turns
+       with timed("save_turn"):
+           await turn_writer.submit(PendingTurn(
+               conversation_id=conversation.id,
+               session_id=turn.session_id,
+               query=turn.query,
+               answer=answer,
+               sources=turn.sources,
+               confidence_score=confidence_score,
+               confidence_reason=confidence_reason if INCLUDE_CONFIDENCE_REASON else None,
+               status=status_for_confidence(confidence_score) if confidence_score is not None else None,
+               timestamp=datetime.datetime.utcnow(),
+               context=turn.context if confidence_score is None else None,
+               unsummarized_messages=turn.unsummarized_messages,
+               on_result=partial(_cached_answer_scored, cache_entry) if cache_entry else None
+           ))
+   elif ENABLE_DATABASE_STORAGE and conversation:
+       # Save user message to database
+       user_message = Message(
+           conversation_id=conversation.id,
+           role="user",
+           content=turn.query,
+           sources=None
+       )
+       db.add(user_message)
+       
+       # Save assistant message to database
+       assistant_message = Message(
+           conversation_id=conversation.id,
+           role="assistant",
+           content=answer,
+           sources=json.dumps(turn.sources) if turn.sources else None,
+           confidence_score=confidence_score,
+           confidence_reason=confidence_reason if INCLUDE_CONFIDENCE_REASON else None
+       )
+       db.add(assistant_message)
+       
+       if confidence_score is not None:
+           logger.info(f"Confidence score: {confidence_score}")
+           # Update conversation status based on confidence threshold
+           conversation.status = status_for_confidence(confidence_score)
+           
+       # Update conversation timestamp
+       conversation.updated_at = datetime.datetime.utcnow()
+       with timed("save_turn"):
+           await db.flush()
+           assistant_message_id = assistant_message.id
+           await db.commit()
+       session_cache.record_turn(
+           turn.session_id,
+           conversation.id,
+           [user_message, assistant_message],
+           CONTEXT_MEMORY * 2,
+           status=conversation.status,
+           updated_at=conversation.updated_at
+       )
+       
+       if confidence_score is None:
+           confidence_worker.submit(ConfidenceJob(
+               message_id=assistant_message_id,
+               conversation_id=conversation.id,
+               query=turn.query,
+               context=turn.context,
+               answer=answer,
+               on_result=partial(_cached_answer_scored, cache_entry) if cache_entry else None
+           ))
+       
+       # Fold older turns into the running summary once history grows long
+       conversation_summarizer.maybe_schedule(conversation.id, turn.unsummarized_messages + 2)
+   
+   # Return response with optional confidence score
+   response_data = {
+       "answer": answer,
+       "sources": turn.sources,
+       "session_id": turn.session_id
+   }
+   
+   if EXPOSE_CONFIDENCE_SCORE:
+       response_data["confidence_score"] = confidence_score
+       
+   return ChatResponse(**response_data)
+
+
+def _completion_params(turn: ChatTurn, structured: bool = False) -> Dict[str, Any]:
+   """
+   Keyword arguments for the answer completion call
+   
+   Args:
+       turn: ChatTurn returned by prepare_chat
+       structured: Ask for a StructuredAnswer JSON object instead of plain text
+   """
+   params = {
+       "model": MODEL_NAME,
+       "messages": turn.messages,
+       "temperature": TEMPERATURE,
+       "max_tokens": MAX_TOKENS,
+       "top_p": TOP_P,
+       "frequency_penalty": FREQUENCY_PENALTY,
+       "presence_penalty": PRESENCE_PENALTY
+   }
+   if structured:
+       system_message = turn.messages[0]
+       params["messages"] = [
+           {"role": "system", "content": f"{system_message['content']}\n\n{STRUCTURED_CONFIDENCE_PROMPT}"}
+       ] + turn.messages[1:]
+       params["max_tokens"] = MAX_TOKENS + STRUCTURED_EXTRA_TOKENS
+       params["response_format"] = STRUCTURED_RESPONSE_FORMAT
+   elif CONFIDENCE_STRATEGY == "retrieval" and CONFIDENCE_USE_LOGPROBS:
+       params["logprobs"] = True
+   return params
+
+
+def parse_structured_answer(content: str) -> Tuple[Optional[str], Optional[Tuple[float, str]]]:
+   """
+   Validate a structured completion against the StructuredAnswer schema
+   
+   The JSON itself is never the answer. When the reply fails validation, its
+   "answer" field is used if it is complete, or the whole reply if it is plain
+   text rather than JSON; that answer has no score and is evaluated like a
+   "judge" answer. A reply with no usable answer (e.g. JSON truncated inside
+   the answer) gives None, and the caller asks for a plain completion instead.
+   
+   Returns:
+       Tuple of (answer or None, (confidence_score, confidence_reason) or None)
+   """
+   try:
+       parsed = StructuredAnswer.model_validate_json(content or "")
+       return parsed.answer, (parsed.confidence, parsed.confidence_reason)
+   except ValidationError as e:
+       logger.error("Structured answer failed validation", error=str(e))
+   
+   text = (content or "").strip()
+   if text and not text.startswith(("{", "[")):
+       return text, None
+   answer = None
+   try:
+       data = json.loads(text)
+       answer = data.get("answer") if isinstance(data, dict) else None
+   except ValueError:
+       # Truncated or otherwise broken JSON: take the answer string only if it was closed
+       match = STRUCTURED_ANSWER_FIELD.search(text)
+       if match:
+           try:
+               answer = json.loads(match.group(1))
+           except ValueError:
+               pass
+   if isinstance(answer, str) and answer.strip():
+       return answer, None
+   return None, None
+
 
 async def chat(
    request: Request, 
    chat_request: ChatRequest,
-   db: Session = Depends(get_db)
+   db: AsyncSession = Depends(get_db),
+   evaluate_inline: Optional[bool] = None
 ) -> ChatResponse:
    """
    Chat endpoint logic
@@ -68,6 +607,8 @@ async def chat(
        request: FastAPI Request object
        chat_request: ChatRequest object with query and optional session_id
        db: Database session
+       evaluate_inline: Wait for the confidence score (e.g. for the WhatsApp
+           manual-review gate); defaults to CONFIDENCE_EVALUATION_MODE
        
    Returns:
        ChatResponse with answer, sources and session_id
@@ -77,144 +618,201 @@ async def chat(
    
    logger.info("Chat request", session_id=session_id, query_length=len(query))
    
-   try:
-       # Get or create conversation in database only if database storage is enabled
-       conversation = None
-       if ENABLE_DATABASE_STORAGE:
-           conversation = db.query(Conversation).filter(Conversation.session_id == session_id).first()
-           if not conversation:
-               conversation = Conversation(session_id=session_id)
-               db.add(conversation)
-               db.commit()
-               db.refresh(conversation)
-       
-       # Get embedding for the query
-       query_embedding = get_embeddings([query])[0]
-       
-       # Connect to Chroma and get collection
-       chroma_client = get_chroma_client()
-       collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-       
-       # Query Chroma for relevant chunks
-       results = collection.query(
-           query_embeddings=[query_embedding],
-           n_results=TOP_K,
-           include=["documents", "metadatas"]
-       )
-       
-       # Extract documents and their sources
-       documents = results.get("documents", [[]])[0]
-       metadatas = results.get("metadatas", [[]])[0]
-       
-       # Join chunks for context
-       current_context = "\n\n".join(documents)
+   with track_request("chat", session_id=session_id) as timing:
+       try:
+           with timed("load_conversation"):
+               conversation, messages_history, summary = await load_conversation(session_id, db)
        
-       # Get sources
-       sources = [meta.get("source", "unknown") for meta in metadatas]
-       unique_sources = list(set(sources))
+           # Identical first-turn questions in flight at the same time share one pipeline run
+           if CHAT_COALESCING and not messages_history and not summary:
+               key = (COLLECTION_NAME, answer_cache.kb_version(COLLECTION_NAME), normalize_text(query))
+               (turn, answer, confidence), shared = await chat_coalescer.run(
+                   key, partial(_answer_first_turn, query, session_id, evaluate_inline)
+               )
+               # Each session still gets its own messages and status
+               turn = replace(turn, query=query, session_id=session_id, conversation=conversation)
+               timing["coalesced"] = shared
+               if shared and turn.cached_answer is None:
+                   # Stored in the answer cache by the request that generated it
+                   turn.cached_answer = CachedAnswer(
+                       query=turn.query,
+                       answer=answer,
+                       sources=turn.sources,
+                       context=turn.context
+                   )
+               return await finish_chat(turn, answer, db, evaluate_inline=evaluate_inline, confidence=confidence)
        
-       # Initialize messages_history as empty
-       messages_history = []
+           turn = await retrieve_context(query, session_id, conversation, messages_history, summary)
+           if turn.cached_answer:
+               return await finish_chat(turn, turn.cached_answer.answer, db, evaluate_inline=evaluate_inline)
        
-       # Get conversation history from database only if database storage is enabled
-       if ENABLE_DATABASE_STORAGE and conversation:
-           messages_history = (
-               db.query(Message)
-               .filter(Message.conversation_id == conversation.id)
-               .order_by(Message.timestamp.desc())
-               .limit(CONTEXT_MEMORY * 2)  # Get pairs of messages
-               .all()
-           )
-           messages_history.reverse()  # Reverse to get chronological order
-       
-       # Prepare messages for OpenAI
-       openai_messages = [
-           {"role": "system", "content": SYSTEM_PROMPT.replace("{context}", current_context)}
-       ]
-       
-       # Add conversation history
-       for msg in messages_history:
-           openai_messages.append({"role": msg.role, "content": msg.content})
-       
-       # Add current query
-       openai_messages.append({"role": "user", "content": query})
-       
-       # Call OpenAI chat completion
-       response = client.chat.completions.create(
-           model=MODEL_NAME,
-           messages=openai_messages,
-           temperature=TEMPERATURE,
-           max_tokens=MAX_TOKENS,
-           top_p=TOP_P,
-           frequency_penalty=FREQUENCY_PENALTY,
-           presence_penalty=PRESENCE_PENALTY
-       )
+           answer, confidence = await generate_answer(turn)
+           return await finish_chat(turn, answer, db, evaluate_inline=evaluate_inline, confidence=confidence)
        
-       # Extract response
-       answer = response.choices[0].message.content
+       except WriteBehindTimeout:
+           # Answered with 503 by the API
+           raise
+       except Exception as e:
+           logger.error("Error in chat endpoint", error=str(e), session_id=session_id)
+           raise HTTPException(status_code=500, detail=str(e))
 
-       if RESPONSE_PREFIX:
-           answer = f"{answer}\n\n{RESPONSE_PREFIX}"
-           
-       # Evaluate confidence in the answer
-       confidence_score, confidence_reason = await evaluate_confidence(
-           query=query,
-           context=current_context,
-           answer=answer,
-           client=client
+
+async def generate_answer(turn: ChatTurn) -> Tuple[str, Optional[Tuple[float, str]]]:
+   """
+   Call the chat completion for a prepared turn
+   
+   Returns:
+       Tuple of (answer including RESPONSE_PREFIX, (score, reason) when the
+       confidence strategy produces one with the answer, else None)
+   """
+   structured = CONFIDENCE_STRATEGY == "structured"
+   with timed("completion"):
+       response = await client.chat.completions.create(**_completion_params(turn, structured=structured))
+   record_usage("completion", MODEL_NAME, response.usage)
+   
+   # Extract response
+   answer = response.choices[0].message.content
+   confidence = None
+   if structured:
+       answer, confidence = parse_structured_answer(answer)
+       if answer is None:
+           # Nothing to show from the structured reply: ask for plain text, scored by the judge
+           with timed("completion"):
+               response = await client.chat.completions.create(**_completion_params(turn))
+           record_usage("completion", MODEL_NAME, response.usage)
+           answer = response.choices[0].message.content
+   elif CONFIDENCE_STRATEGY == "retrieval":
+       logprobs = response.choices[0].logprobs
+       confidence = retrieval_confidence(
+           turn.distances,
+           mean_token_logprob(logprobs.content if logprobs else None)
        )
+
+   if RESPONSE_PREFIX:
+       answer = f"{answer}\n\n{RESPONSE_PREFIX}"
+   
+   return answer, confidence
+
+
+async def _answer_first_turn(
+   query: str,
+   session_id: str,
+   evaluate_inline: Optional[bool]
+) -> Tuple[ChatTurn, str, Optional[Tuple[float, str]]]:
+   """
+   Retrieve, generate and, if requested, score the answer to a first-turn question
+   
+   Runs once for all identical questions coalesced with it, so it touches no
+   conversation or database session.
+   
+   Returns:
+       Tuple of (turn without conversation, answer, (score, reason) or None)
+   """
+   turn = await retrieve_context(query, session_id, None, [], None)
+   cached = turn.cached_answer
+   if cached:
+       confidence = None
+       if cached.confidence_score is not None:
+           confidence = (cached.confidence_score, cached.confidence_reason)
+       return turn, cached.answer, confidence
+   
+   answer, confidence = await generate_answer(turn)
+   if evaluate_inline is None:
+       evaluate_inline = CONFIDENCE_EVALUATION_MODE != "background"
+   if confidence is None and evaluate_inline:
+       confidence = await evaluate_confidence(query=query, context=turn.context, answer=answer, client=client)
+   return turn, answer, confidence
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+   """
+   Format a Server-Sent Events message
+   """
+   return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def chat_stream(
+   request: Request, 
+   chat_request: ChatRequest,
+   db: AsyncSession = Depends(get_db)
+) -> AsyncIterator[str]:
+   """
+   Streaming variant of chat that yields Server-Sent Events
+   
+   Events, in order:
+       sources: {"sources": [...], "session_id": ...} right after retrieval
+       token: {"text": ...} for every piece of the answer as it is generated
+       confidence: {"confidence_score": ..., "session_id": ...} once the turn is saved
+   An error event with {"detail": ...} replaces the remaining events on failure.
+   Tokens are streamed as plain text, so the "structured" confidence strategy
+   falls back to the judge evaluation here; "retrieval" works unchanged.
+   
+   Args:
+       request: FastAPI Request object
+       chat_request: ChatRequest object with query and optional session_id
+       db: Database session
+   """
+   query = chat_request.query
+   session_id = chat_request.session_id or str(uuid.uuid4())
+   
+   logger.info("Chat stream request", session_id=session_id, query_length=len(query))
+   
+   with track_request("chat_stream", session_id=session_id):
+       try:
+           turn = await prepare_chat(query, session_id, db)
+           yield _sse_event("sources", {"sources": turn.sources, "session_id": session_id})
        
-       # Only save to database if database storage is enabled
-       if ENABLE_DATABASE_STORAGE and conversation:
-           # Save user message to database
-           user_message = Message(
-               conversation_id=conversation.id,
-               role="user",
-               content=query,
-               sources=None
-           )
-           db.add(user_message)
-           
-           # Save assistant message to database
-           assistant_message = Message(
-               conversation_id=conversation.id,
-               role="assistant",
-               content=answer,
-               sources=json.dumps(unique_sources) if unique_sources else None,
-               confidence_score=confidence_score,
-               confidence_reason=confidence_reason if INCLUDE_CONFIDENCE_REASON else None
+           if turn.cached_answer:
+               yield _sse_event("token", {"text": turn.cached_answer.answer})
+               response = await finish_chat(turn, turn.cached_answer.answer, db, evaluate_inline=True)
+               yield _sse_event("confidence", {
+                   "confidence_score": response.confidence_score,
+                   "session_id": session_id
+               })
+               return
+       
+           # Stream the completion, forwarding tokens as they arrive
+           stream = await client.chat.completions.create(
+               **_completion_params(turn), stream=True, stream_options={"include_usage": True}
            )
-           db.add(assistant_message)
-           
-           logger.info(f"Confidence score: {confidence_score}")
-           # Update conversation status based on confidence threshold
-           if confidence_score < CONFIDENCE_THRESHOLD:
-               conversation.status = "waiting_for_manual"
-           else:
-               conversation.status = "waiting_for_user"
-               
-           # Update conversation timestamp
-           conversation.updated_at = datetime.datetime.utcnow()
-           db.commit()
-       
-       # Return response with optional confidence score
-       response_data = {
-           "answer": answer,
-           "sources": unique_sources,
-           "session_id": session_id
-       }
-       
-       if EXPOSE_CONFIDENCE_SCORE:
-           response_data["confidence_score"] = confidence_score
-           
-       return ChatResponse(**response_data)
+           parts = []
+           token_logprobs = []
+           async for chunk in stream:
+               # The last chunk has no choices and carries the token usage
+               if getattr(chunk, "usage", None):
+                   record_usage("completion", MODEL_NAME, chunk.usage)
+               if not chunk.choices:
+                   continue
+               choice = chunk.choices[0]
+               if choice.logprobs and choice.logprobs.content:
+                   token_logprobs.extend(choice.logprobs.content)
+               text = choice.delta.content
+               if text:
+                   parts.append(text)
+                   yield _sse_event("token", {"text": text})
+       
+           if RESPONSE_PREFIX:
+               suffix = f"\n\n{RESPONSE_PREFIX}"
+               parts.append(suffix)
+               yield _sse_event("token", {"text": suffix})
        
-   except Exception as e:
-       logger.error("Error in chat endpoint", error=str(e), session_id=session_id)
-       raise HTTPException(status_code=500, detail=str(e))
+           confidence = None
+           if CONFIDENCE_STRATEGY == "retrieval":
+               confidence = retrieval_confidence(turn.distances, mean_token_logprob(token_logprobs))
+       
+           # The answer has already been delivered, so scoring inline only delays the final event
+           response = await finish_chat(turn, "".join(parts), db, evaluate_inline=True, confidence=confidence)
+           yield _sse_event("confidence", {
+               "confidence_score": response.confidence_score,
+               "session_id": session_id
+           })
+       
+       except Exception as e:
+           logger.error("Error in chat stream endpoint", error=str(e), session_id=session_id)
+           yield _sse_event("error", {"detail": str(e)})
 
     
-async def evaluate_confidence(query: str, context: str, answer: str, client: OpenAI) -> tuple[float, str]:
+async def evaluate_confidence(query: str, context: str, answer: str, client: AsyncOpenAI) -> tuple[float, str]:
     """
     Evaluate confidence in RAG answer using LLM self-assessment
     
@@ -227,11 +825,13 @@ async def evaluate_confidence(query: str, context: str, answer: str, client: Ope
             {"role": "user", "content": f"QUERY: {query}\n\nCONTEXT USED: {context}\n\nGENERATED ANSWER: {answer}\n\n{CONFIDENCE_PROMPT}"}
         ]
         
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=eval_messages,
-            temperature=0.1  # Lower temperature for consistent evaluation
-        )
+        with timed("confidence"):
+            response = await client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=eval_messages,
+                temperature=0.1  # Lower temperature for consistent evaluation
+            )
+        record_usage("confidence", MODEL_NAME, response.usage)
         
         reasoning = response.choices[0].message.content
         
@@ -249,4 +849,39 @@ async def evaluate_confidence(query: str, context: str, answer: str, client: Ope
         return confidence_score, reasoning
     except Exception as e:
         logger.error(f"Error evaluating confidence: {str(e)}")
-        return 50.0, f"Error evaluating confidence: {str(e)}"
\ No newline at end of file
+        return 50.0, f"Error evaluating confidence: {str(e)}"
+
+
+# Background scorer used when CONFIDENCE_EVALUATION_MODE is "background"
+confidence_worker = ConfidenceWorker(partial(evaluate_confidence, client=client))
+
+
+def _turn_written(turn: PendingTurn, user_message: Message, assistant_message: Message):
+   """
+   What finish_chat does after its commit, for a turn written by the write-behind queue
+   """
+   session_cache.record_turn(
+       turn.session_id,
+       turn.conversation_id,
+       [user_message, assistant_message],
+       CONTEXT_MEMORY * 2,
+       status=turn.status,
+       updated_at=turn.timestamp
+   )
+   if turn.confidence_score is None:
+       confidence_worker.submit(ConfidenceJob(
+           message_id=assistant_message.id,
+           conversation_id=turn.conversation_id,
+           query=turn.query,
+           context=turn.context or "",
+           answer=turn.answer,
+           on_result=turn.on_result
+       ))
+   conversation_summarizer.maybe_schedule(turn.conversation_id, turn.unsummarized_messages + 2)
+
+
+# Queue of finished turns used when CHAT_PERSISTENCE_MODE is "write_behind"
+turn_writer = TurnWriter(on_saved=_turn_written)
+
+# Shares the pipeline between identical first-turn questions in flight
+chat_coalescer = SingleFlight("chat")
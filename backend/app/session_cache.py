@@ -0,0 +1,220 @@
+# backend/app/session_cache.py
+import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.models import Conversation
+
+# Conversations whose state is kept in memory (0 disables the cache)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "5000"))
+# Seconds a cached conversation is trusted before it is read from the database again
+# (0 never); bounds how long changes made by other processes go unnoticed
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "600"))
+
+
+@dataclass
+class CachedMessage:
+    """
+    The fields of a stored message that the next prompt needs
+    """
+    id: int
+    role: str
+    content: str
+
+
+@dataclass
+class SessionState:
+    """
+    Conversation row and the newest unsummarized messages of a session
+    """
+    conversation_id: int
+    session_id: str
+    status: Optional[str]
+    summary: Optional[str]
+    summarized_until_id: Optional[int]
+    created_at: Optional[datetime.datetime]
+    updated_at: Optional[datetime.datetime]
+    messages: List[CachedMessage] = field(default_factory=list)
+    cached_at: float = field(default_factory=time.time)
+
+    def conversation(self) -> Conversation:
+        """
+        A detached Conversation with the cached values
+
+        Added to a session it becomes persistent without being loaded, and
+        changes made to it are flushed as an UPDATE.
+        """
+        conversation = Conversation(
+            id=self.conversation_id,
+            session_id=self.session_id,
+            status=self.status,
+            summary=self.summary,
+            summarized_until_id=self.summarized_until_id,
+            created_at=self.created_at,
+            updated_at=self.updated_at
+        )
+        make_transient_to_detached(conversation)
+        return conversation
+
+
+class SessionCache:
+    """
+    Size-bounded LRU cache of conversation state, keyed by session ID
+
+    Filled when a conversation is read from the database and updated
+    write-through when a chat turn is saved, so the next turn of the session
+    reads its history from memory. Writers that change a conversation outside
+    the chat path invalidate it. Changes made by other processes are only
+    picked up after SESSION_CACHE_TTL.
+    """
+
+    def __init__(self, max_entries: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._sessions: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a read that raced with one is not stored
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _drop(self, session_id: str):
+        state = self._entries.pop(session_id, None)
+        if state is not None:
+            self._sessions.pop(state.conversation_id, None)
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """
+        Cached state of a session, or None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is not None and self.ttl > 0 and time.time() - state.cached_at > self.ttl:
+                self._drop(session_id)
+                self.expirations += 1
+                state = None
+            if state is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return state
+
+    def store(self, conversation: Conversation, messages: Sequence[Any], version: int):
+        """
+        Remember a conversation and its history as just read from the database
+
+        Args:
+            conversation: Conversation row
+            messages: Unsummarized history in chronological order
+            version: Value of `version` taken before the read; if a conversation
+                was invalidated since, the read may be stale and is not stored
+        """
+        if not self.enabled:
+            return
+        state = SessionState(
+            conversation_id=conversation.id,
+            session_id=conversation.session_id,
+            status=conversation.status,
+            summary=conversation.summary,
+            summarized_until_id=conversation.summarized_until_id,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            messages=[CachedMessage(m.id, m.role, m.content) for m in messages]
+        )
+        with self._lock:
+            if version != self.version:
+                return
+            self._drop(state.session_id)
+            self._entries[state.session_id] = state
+            self._sessions[state.conversation_id] = state.session_id
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._sessions.pop(evicted.conversation_id, None)
+                self.evictions += 1
+
+    def record_turn(
+        self,
+        session_id: str,
+        conversation_id: int,
+        messages: Sequence[Any],
+        history_limit: int,
+        status: Optional[str] = None,
+        updated_at: Optional[datetime.datetime] = None
+    ):
+        """
+        Write-through after a turn was committed: new status and messages
+
+        Args:
+            session_id: Session ID of the conversation
+            conversation_id: ID of the conversation row
+            messages: Messages saved by the turn, with their IDs
+            history_limit: Newest messages to keep, as many as a history read loads
+            status: Conversation status as saved, None if the turn left it unchanged
+            updated_at: Conversation timestamp as saved
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._entries.get(session_id)
+            # Not cached (or invalidated meanwhile): the next turn reads the database
+            if state is None or state.conversation_id != conversation_id:
+                return
+            if status is not None:
+                state.status = status
+            if updated_at is not None:
+                state.updated_at = updated_at
+            state.messages.extend(CachedMessage(m.id, m.role, m.content) for m in messages)
+            state.messages = state.messages[-history_limit:] if history_limit > 0 else []
+
+    def invalidate(self, conversation_id: int):
+        """
+        Forget a conversation changed outside the chat path, e.g. its status or summary
+        """
+        with self._lock:
+            self.version += 1
+            session_id = self._sessions.get(conversation_id)
+            if session_id is not None:
+                self._drop(session_id)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Process-wide cache shared by chat, the WhatsApp webhook and the background writers
+session_cache = SessionCache()
@@ -0,0 +1,61 @@
+# backend/app/single_flight.py
+import asyncio
+import structlog
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Configure logging
+logger = structlog.get_logger()
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving while it is in
+    flight wait for it and share its result (or its exception)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await call(), or the identical call already in flight for key
+
+        The call runs in its own task, so a caller that is cancelled (e.g. a
+        client that disconnects) does not cancel it for the others.
+
+        Args:
+            key: Identity of the call
+            call: Coroutine function producing the result
+
+        Returns:
+            Tuple of (result, shared), shared being True for callers that joined a running call
+        """
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            logger.info("Coalesced with in-flight request", single_flight=self.name)
+        else:
+            self.executions += 1
+            task = asyncio.create_task(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "failed": self.failed
+        }
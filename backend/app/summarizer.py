@@ -0,0 +1,195 @@
+# backend/app/summarizer.py
+import os
+import asyncio
+import structlog
+from typing import Dict, Any, List, Optional, Set
+
+from openai import AsyncOpenAI
+
+from sqlalchemy import select, update
+
+from .database import AsyncSessionLocal, ENABLE_DATABASE_STORAGE
+from .metrics import track_request, timed, record_usage
+from .models import Conversation, Message
+from .session_cache import session_cache
+
+# Configure logging
+logger = structlog.get_logger()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+
+# Fold older turns into a running summary once a conversation has this many unsummarized messages (0 disables)
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "16"))
+# Most recent messages that are always sent verbatim and never folded
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "6"))
+SUMMARY_MODEL_NAME = os.getenv("SUMMARY_MODEL_NAME", MODEL_NAME)
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+SUMMARY_PROMPT = os.getenv("SUMMARY_PROMPT", """
+You maintain a running summary of a customer support conversation.
+Update the existing summary with the new messages. Keep the user's situation, their questions,
+the facts and answers already given, and anything still unresolved. Drop greetings and repetition.
+Reply with the updated summary only, in the language of the conversation.
+""")
+
+SUMMARY_ENABLED = SUMMARY_TRIGGER_MESSAGES > 0 and ENABLE_DATABASE_STORAGE
+
+# Configure OpenAI client
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    """
+    Chat message carrying the summary of the earlier conversation
+    """
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+async def summarize(previous_summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """
+    Fold messages into a conversation summary
+
+    Args:
+        previous_summary: Current summary, if any
+        messages: Messages to fold in, oldest first
+
+    Returns:
+        Updated summary
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    with timed("summary"):
+        response = await client.chat.completions.create(
+            model=SUMMARY_MODEL_NAME,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"}
+            ],
+            temperature=0.0,
+            max_tokens=SUMMARY_MAX_TOKENS
+        )
+    record_usage("summary", SUMMARY_MODEL_NAME, response.usage)
+    return response.choices[0].message.content.strip()
+
+
+class ConversationSummarizer:
+    """
+    Updates conversation summaries in the background, at most one job per
+    conversation at a time and SUMMARY_WORKERS jobs overall
+    """
+
+    def __init__(self, workers: int = SUMMARY_WORKERS):
+        self.workers = workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.updated = 0
+        self.failed = 0
+
+    def maybe_schedule(self, conversation_id: int, unsummarized: int):
+        """
+        Start a summary update if the conversation has grown past the trigger
+
+        Args:
+            conversation_id: Conversation to summarize
+            unsummarized: Messages not yet folded into the summary, including the new turn
+        """
+        if not SUMMARY_ENABLED or unsummarized < SUMMARY_TRIGGER_MESSAGES or conversation_id in self._pending:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        self._pending.add(conversation_id)
+        task = asyncio.create_task(self._run(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Let running updates finish for up to `timeout` seconds, then cancel them
+        """
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": SUMMARY_ENABLED,
+            "in_progress": len(self._pending),
+            "updated": self.updated,
+            "failed": self.failed
+        }
+
+    async def _run(self, conversation_id: int):
+        try:
+            async with self._semaphore:
+                # Its own operation, not the chat request that scheduled it
+                with track_request("summarize", conversation_id=conversation_id):
+                    await self.update(conversation_id)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Error updating conversation summary", error=str(e), conversation_id=conversation_id)
+        finally:
+            self._pending.discard(conversation_id)
+
+    async def update(self, conversation_id: int) -> bool:
+        """
+        Fold all but the last SUMMARY_KEEP_MESSAGES unsummarized messages into the summary
+
+        Returns:
+            True if the summary was updated
+        """
+        async with AsyncSessionLocal() as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                return False
+            previous_summary = conversation.summary
+            summarized_until_id = conversation.summarized_until_id
+            query = select(Message).where(Message.conversation_id == conversation_id)
+            if summarized_until_id:
+                query = query.where(Message.id > summarized_until_id)
+            messages = (await db.scalars(query.order_by(Message.id))).all()
+            fold = messages[:-SUMMARY_KEEP_MESSAGES] if SUMMARY_KEEP_MESSAGES else messages
+            fold = [{"id": m.id, "role": m.role, "content": m.content} for m in fold]
+            if len(messages) < SUMMARY_TRIGGER_MESSAGES or not fold:
+                return False
+
+        # No session is held open during the completion
+        summary = await summarize(previous_summary, fold)
+
+        async with AsyncSessionLocal() as db:
+            # Only apply on top of the summary this one was built from, and leave
+            # updated_at alone so summarizing does not reorder the conversation list
+            unchanged = (
+                Conversation.summarized_until_id.is_(None) if summarized_until_id is None
+                else Conversation.summarized_until_id == summarized_until_id
+            )
+            result = await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, unchanged)
+                .values({
+                    Conversation.summary: summary,
+                    Conversation.summarized_until_id: fold[-1]["id"],
+                    Conversation.updated_at: Conversation.updated_at
+                })
+                .execution_options(synchronize_session=False)
+            )
+            updated = result.rowcount
+            await db.commit()
+
+        if updated:
+            # Cached history still holds the messages just folded into the summary
+            session_cache.invalidate(conversation_id)
+            self.updated += 1
+            logger.info(
+                "Conversation summary updated",
+                conversation_id=conversation_id,
+                folded_messages=len(fold),
+                summary_length=len(summary)
+            )
+        return bool(updated)
+
+
+# Process-wide summarizer
+conversation_summarizer = ConversationSummarizer()
@@ -0,0 +1,482 @@
+# backend/app/turn_writer.py
+import os
+import json
+import time
+import uuid
+import asyncio
+import datetime
+import structlog
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, Any, List, Optional
+
+from sqlalchemy import select, update
+
+from .database import AsyncSessionLocal
+from .models import Conversation, Message
+
+# Configure logging
+logger = structlog.get_logger()
+
+# "sync" commits every turn before the response is sent, "write_behind" queues
+# finished turns and writes them in batched transactions
+CHAT_PERSISTENCE_MODE = os.getenv("CHAT_PERSISTENCE_MODE", "sync").lower()
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+# Queued turns are appended here before the response is sent and replayed on the next start
+WRITE_BEHIND_SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "app/data/write_behind.jsonl")
+# fsync the spill file before responding; without it a queued turn survives a crash of the
+# process but not of the machine
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "true").lower() == "true"
+# The spill file is rewritten with only the queued turns once it grows past this size
+WRITE_BEHIND_SPILL_MAX_BYTES = int(os.getenv("WRITE_BEHIND_SPILL_MAX_BYTES", str(8 * 1024 * 1024)))
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "10"))
+# Seconds a reader waits for queued turns before the request fails with 503
+WRITE_BEHIND_WAIT_TIMEOUT = float(os.getenv("WRITE_BEHIND_WAIT_TIMEOUT", "5"))
+# Writes of a turn before it is set aside; it stays in the spill file and is retried on the next start
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "10"))
+# Longest pause between retries of a failed write
+WRITE_BEHIND_RETRY_MAX_DELAY = 5.0
+
+
+class WriteBehindTimeout(Exception):
+    """
+    Queued chat turns were not written to the database in time
+    """
+
+
+@dataclass
+class PendingTurn:
+    """
+    A finished chat turn waiting to be written: the question, the answer and the conversation update
+    """
+    conversation_id: int
+    session_id: str
+    query: str
+    answer: str
+    sources: Optional[List[str]]
+    confidence_score: Optional[float]
+    confidence_reason: Optional[str]
+    # New conversation status, None to leave it unchanged
+    status: Optional[str]
+    timestamp: datetime.datetime
+    # Retrieved context, kept when the answer still has to be scored after saving
+    context: Optional[str] = None
+    # Messages not yet folded into the conversation summary, before this turn
+    unsummarized_messages: int = 0
+    turn_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # Read back from the spill file after a restart; may already be in the database
+    recovered: bool = False
+    # Failed writes of this turn since the process started; not spilled
+    attempts: int = 0
+    # Called with (confidence_score, confidence_reason) once the answer is scored; not spilled
+    on_result: Optional[Callable[[float, str], None]] = field(default=None, repr=False)
+
+    def to_json(self) -> str:
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name not in ("on_result", "recovered", "attempts")}
+        data["timestamp"] = self.timestamp.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, line: str) -> "PendingTurn":
+        data = json.loads(line)
+        data["timestamp"] = datetime.datetime.fromisoformat(data["timestamp"])
+        return cls(recovered=True, **data)
+
+
+class TurnWriter:
+    """
+    Write-behind queue for chat turns
+
+    submit() appends the turn to a local spill file and returns once the line
+    is on disk; concurrent submits share one fsync. A background task writes
+    the queued turns to the database in one transaction per batch, every
+    `interval` seconds or as soon as `batch_size` turns are queued, then
+    calls `on_saved` with the stored messages. Turns found in the spill file
+    at start are written again, skipping any that reached the database
+    before the file was cleared.
+
+    Readers that must see a session's latest turns call wait_for(), which
+    flushes immediately if that session has unwritten turns and gives up
+    after `wait_timeout`. After a failed write the turns of the batch are
+    retried one at a time with growing pauses, so one bad turn cannot hold
+    back the others; a turn that fails `max_attempts` times is set aside,
+    logged and kept in the spill file for the next start.
+    """
+
+    def __init__(
+        self,
+        on_saved: Optional[Callable[[PendingTurn, Message, Message], None]] = None,
+        interval: float = WRITE_BEHIND_INTERVAL_MS / 1000,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        spill_path: str = WRITE_BEHIND_SPILL_PATH,
+        fsync: bool = WRITE_BEHIND_FSYNC,
+        spill_max_bytes: int = WRITE_BEHIND_SPILL_MAX_BYTES,
+        wait_timeout: float = WRITE_BEHIND_WAIT_TIMEOUT,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS
+    ):
+        self.on_saved = on_saved
+        self.interval = interval
+        self.batch_size = batch_size
+        self.spill_path = spill_path
+        self.fsync = fsync
+        self.spill_max_bytes = spill_max_bytes
+        self.wait_timeout = wait_timeout
+        self.max_attempts = max_attempts
+        self._pending: List[PendingTurn] = []
+        # Turns that failed max_attempts times; kept in the spill file but no longer retried
+        self._set_aside: List[PendingTurn] = []
+        # Turns per session that are queued or in the batch being written
+        self._unwritten: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wake: Optional[asyncio.Event] = None
+        self._written: Optional[asyncio.Condition] = None
+        self._fd: Optional[int] = None
+        # Spill lines appended and known to be on disk, for sharing fsyncs
+        self._appended = 0
+        self._synced = 0
+        # Lines in the spill file
+        self._spill_lines = 0
+        self._syncing: Optional[asyncio.Future] = None
+        # Spill file rewrite in progress; submit() waits for it before appending
+        self._rewriting: Optional[asyncio.Future] = None
+        self._saved_turns = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._recovered = 0
+        self._skipped_duplicates = 0
+        self._max_batch = 0
+        self._total_lag = 0.0
+        self._max_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """
+        Open the spill file, queue the turns left in it and start the flush task
+        """
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._written = asyncio.Condition()
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        # Turns set aside earlier are read back from the spill file and retried
+        self._set_aside, self._spill_lines = [], 0
+        if os.path.exists(self.spill_path):
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._spill_lines += 1
+                    # A line cut short by a crash was never acknowledged
+                    try:
+                        self._queue(PendingTurn.from_json(line))
+                    except (ValueError, TypeError, KeyError):
+                        continue
+            self._recovered = len(self._pending)
+        self._fd = os.open(self.spill_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            "Turn writer started",
+            interval_ms=round(self.interval * 1000, 1),
+            batch_size=self.batch_size,
+            recovered_turns=self._recovered
+        )
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT):
+        """
+        Write the queued turns for up to `timeout` seconds, then stop; the rest stay in the spill file
+        """
+        if not self.running:
+            return
+        try:
+            await self.wait_for(timeout=timeout)
+        except WriteBehindTimeout:
+            logger.warning("Turn writer stopped with unwritten turns", queued=len(self._pending))
+        # On Python < 3.12 wait_for can swallow the cancel when the wake event fires at the same time,
+        # so the loop also checks the flag
+        self._stopping = True
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._rewriting is not None:
+            await asyncio.wait({self._rewriting})
+        if self._syncing is not None:
+            await asyncio.gather(self._syncing, return_exceptions=True)
+        os.close(self._fd)
+        self._fd = None
+
+    def _queue(self, turn: PendingTurn):
+        self._pending.append(turn)
+        self._unwritten[turn.session_id] = self._unwritten.get(turn.session_id, 0) + 1
+
+    async def submit(self, turn: PendingTurn):
+        """
+        Queue a turn; returns once it is in the spill file
+        """
+        if not self.running:
+            self.start()
+        # A line appended to the file being replaced would be lost
+        while self._rewriting is not None:
+            # wait() neither raises the rewrite's error nor cancels it when the caller is cancelled
+            await asyncio.wait({self._rewriting})
+        os.write(self._fd, (turn.to_json() + "\n").encode("utf-8"))
+        self._appended += 1
+        self._spill_lines += 1
+        self._queue(turn)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        if self.fsync:
+            await self._sync(self._appended)
+
+    async def _sync(self, line: int):
+        # Group commit: one fsync covers every line appended before it started
+        while self._synced < line:
+            if self._syncing is None:
+                self._syncing = asyncio.ensure_future(self._fsync())
+            await asyncio.shield(self._syncing)
+
+    async def _fsync(self):
+        target = self._appended
+        try:
+            await asyncio.to_thread(os.fsync, self._fd)
+            self._synced = max(self._synced, target)
+        finally:
+            self._syncing = None
+
+    def has_unwritten(self, session_id: Optional[str] = None) -> bool:
+        if session_id is None:
+            return bool(self._pending) or any(self._unwritten.values())
+        return self._unwritten.get(session_id, 0) > 0
+
+    async def wait_for(self, session_id: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        Wait until the queued turns of a session (or of all sessions) are in the database
+
+        Args:
+            session_id: Session to wait for, None for every queued turn
+            timeout: Seconds to wait, `wait_timeout` if None
+
+        Raises:
+            WriteBehindTimeout: The turns were not written in time, e.g. while the database is down
+        """
+        if not self.running or not self.has_unwritten(session_id):
+            return
+        # A reader is waiting: flush now rather than at the next interval
+        self._wake.set()
+        try:
+            async with self._written:
+                await asyncio.wait_for(
+                    self._written.wait_for(lambda: not self.has_unwritten(session_id)),
+                    timeout=self.wait_timeout if timeout is None else timeout
+                )
+        except asyncio.TimeoutError:
+            raise WriteBehindTimeout(
+                f"Chat turns of {session_id or 'all sessions'} are not written yet, try again later"
+            )
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._pending:
+                if not await self._flush():
+                    # Leave the turns queued and retry after a pause that doubles with every attempt
+                    attempts = self._pending[0].attempts
+                    await asyncio.sleep(min(self.interval * 2 ** (attempts - 1), WRITE_BEHIND_RETRY_MAX_DELAY))
+                    break
+
+    async def _flush(self) -> bool:
+        # Turns of a failed batch are retried one at a time, to find the one that fails
+        size = 1 if self._pending[0].attempts else self.batch_size
+        batch, self._pending = self._pending[:size], self._pending[size:]
+        started = time.monotonic()
+        try:
+            saved = await self._write(batch)
+        except Exception as e:
+            self._failed_batches += 1
+            logger.error("Error writing queued chat turns", error=str(e), turns=len(batch))
+            for turn in batch:
+                turn.attempts += 1
+            if batch[0].attempts >= self.max_attempts:
+                # Only a turn that already failed is written alone, so this batch is that turn
+                await self._put_aside(batch[0], e)
+                return True
+            self._pending[:0] = batch
+            return False
+
+        for turn in batch:
+            self._unwritten[turn.session_id] -= 1
+            if not self._unwritten[turn.session_id]:
+                del self._unwritten[turn.session_id]
+        self._batches += 1
+        self._saved_turns += len(saved)
+        self._max_batch = max(self._max_batch, len(batch))
+        for turn, user_message, assistant_message in saved:
+            lag = (datetime.datetime.utcnow() - turn.timestamp).total_seconds()
+            self._total_lag += lag
+            self._max_lag = max(self._max_lag, lag)
+            if self.on_saved:
+                try:
+                    self.on_saved(turn, user_message, assistant_message)
+                except Exception as e:
+                    logger.error("Error after saving chat turn", error=str(e), session_id=turn.session_id)
+        async with self._written:
+            self._written.notify_all()
+        try:
+            await self._trim_spill()
+        except OSError as e:
+            logger.error("Error trimming the write-behind spill file", error=str(e), path=self.spill_path)
+        logger.debug("Chat turns written", turns=len(batch), ms=round((time.monotonic() - started) * 1000, 1))
+        return True
+
+    async def _put_aside(self, turn: PendingTurn, error: Exception):
+        """
+        Stop retrying a turn and release its readers; it stays in the spill file
+        """
+        self._set_aside.append(turn)
+        self._unwritten[turn.session_id] -= 1
+        if not self._unwritten[turn.session_id]:
+            del self._unwritten[turn.session_id]
+        logger.error(
+            "Chat turn set aside after repeated write failures",
+            error=str(error),
+            session_id=turn.session_id,
+            turn_id=turn.turn_id,
+            attempts=turn.attempts,
+            spill_path=self.spill_path
+        )
+        async with self._written:
+            self._written.notify_all()
+
+    async def _write(self, batch: List[PendingTurn]) -> List[tuple]:
+        """
+        Insert the messages of a batch and update its conversations in one transaction
+        """
+        saved = []
+        conversations: Dict[int, Dict[Any, Any]] = {}
+        async with AsyncSessionLocal() as db:
+            for turn in batch:
+                if turn.recovered and await self._already_written(db, turn):
+                    self._skipped_duplicates += 1
+                    continue
+                user_message = Message(
+                    conversation_id=turn.conversation_id,
+                    role="user",
+                    content=turn.query,
+                    sources=None,
+                    timestamp=turn.timestamp
+                )
+                assistant_message = Message(
+                    conversation_id=turn.conversation_id,
+                    role="assistant",
+                    content=turn.answer,
+                    sources=json.dumps(turn.sources) if turn.sources else None,
+                    # Keep the answer after the question when history is ordered by timestamp
+                    timestamp=turn.timestamp + datetime.timedelta(microseconds=1),
+                    confidence_score=turn.confidence_score,
+                    confidence_reason=turn.confidence_reason
+                )
+                db.add_all([user_message, assistant_message])
+                saved.append((turn, user_message, assistant_message))
+                values = conversations.setdefault(turn.conversation_id, {})
+                values[Conversation.updated_at] = turn.timestamp
+                if turn.status is not None:
+                    values[Conversation.status] = turn.status
+            for conversation_id, values in conversations.items():
+                await db.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .values(values)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return saved
+
+    @staticmethod
+    async def _already_written(db, turn: PendingTurn) -> bool:
+        return await db.scalar(
+            select(Message.id)
+            .where(
+                Message.conversation_id == turn.conversation_id,
+                Message.role == "user",
+                Message.timestamp == turn.timestamp,
+                Message.content == turn.query
+            )
+            .limit(1)
+        ) is not None
+
+    async def _trim_spill(self):
+        """
+        Empty the spill file once every turn is written, or rewrite it with the unwritten ones when it grows
+
+        Turns that were set aside are kept in the file, so the next start retries them.
+        """
+        if self.has_unwritten():
+            rewrite = os.fstat(self._fd).st_size >= self.spill_max_bytes
+        elif self._set_aside:
+            rewrite = self._spill_lines > len(self._set_aside)
+        else:
+            # Replaying a line that survived the truncation is harmless, so no fsync
+            os.ftruncate(self._fd, 0)
+            self._spill_lines = 0
+            return
+        if rewrite:
+            # Shielded: stop() lets a started rewrite finish rather than leave it half done
+            self._rewriting = asyncio.ensure_future(self._rewrite_spill())
+            await asyncio.shield(self._rewriting)
+
+    async def _rewrite_spill(self):
+        """
+        Replace the spill file with one holding only the set-aside and queued turns
+        """
+        try:
+            # An append acknowledged before the rewrite started may still be waiting for its fsync
+            while self._syncing is not None:
+                await asyncio.shield(self._syncing)
+            # Taken after the wait, so it includes every acknowledged turn; submit() holds new ones back
+            turns = self._set_aside + self._pending
+            await asyncio.to_thread(self._write_spill_file, turns)
+            # No fsync may be running on the descriptor that is closed
+            while self._syncing is not None:
+                await asyncio.shield(self._syncing)
+            os.close(self._fd)
+            self._fd = os.open(self.spill_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self._spill_lines = len(turns)
+            # Every unwritten turn is in the new file, which is on disk
+            self._synced = self._appended
+        finally:
+            self._rewriting = None
+
+    def _write_spill_file(self, turns: List[PendingTurn]):
+        temp_path = f"{self.spill_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(turn.to_json() + "\n" for turn in turns)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.spill_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": CHAT_PERSISTENCE_MODE,
+            "running": self.running,
+            "queued": len(self._pending),
+            "unwritten_sessions": len(self._unwritten),
+            "batch_size": self.batch_size,
+            "interval_ms": round(self.interval * 1000, 1),
+            "fsync": self.fsync,
+            "saved_turns": self._saved_turns,
+            "batches": self._batches,
+            "avg_batch": round(self._saved_turns / self._batches, 2) if self._batches else 0.0,
+            "max_batch": self._max_batch,
+            "failed_batches": self._failed_batches,
+            "set_aside_turns": len(self._set_aside),
+            "recovered_turns": self._recovered,
+            "skipped_duplicates": self._skipped_duplicates,
+            "avg_lag_seconds": round(self._total_lag / self._saved_turns, 3) if self._saved_turns else 0.0,
+            "max_lag_seconds": round(self._max_lag, 3)
+        }
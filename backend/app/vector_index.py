@@ -0,0 +1,343 @@
+# backend/app/vector_index.py
+"""
+In-process replica of the knowledge base collection for local retrieval.
+
+Chroma stays the source of truth. The replica holds every chunk's embedding in
+one contiguous float32 matrix (optionally memory-mapped from a snapshot on
+disk) next to id, document and metadata lists, and answers top-k queries with
+a single matrix-vector product instead of an HTTP round trip. It is loaded
+from Chroma on startup and kept in sync by the indexing and delete paths.
+
+The snapshot is only reused when its content fingerprint (a digest of every
+record's id, document and metadata) matches the collection, which is read
+without its embeddings to compare. Changes made through the app are written
+to the snapshot in the background, at most once every
+VECTOR_INDEX_SNAPSHOT_DELAY seconds.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import structlog
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .confidence import CHROMA_DISTANCE_SPACE
+
+# Configure logging
+logger = structlog.get_logger()
+
+# Serve chat retrieval from the local replica instead of querying Chroma
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "false").lower() == "true"
+# Optional directory for a snapshot that is memory-mapped on startup, e.g. app/data/vector_index
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "")
+# Records fetched per request while loading the replica from Chroma
+VECTOR_INDEX_LOAD_BATCH = int(os.getenv("VECTOR_INDEX_LOAD_BATCH", "1000"))
+# Above this many records queries run in a worker thread instead of on the event loop
+VECTOR_INDEX_THREAD_MIN = int(os.getenv("VECTOR_INDEX_THREAD_MIN", "5000"))
+# Seconds after a change before the snapshot is rewritten; later changes share the write
+VECTOR_INDEX_SNAPSHOT_DELAY = float(os.getenv("VECTOR_INDEX_SNAPSHOT_DELAY", "5"))
+
+
+def content_fingerprint(ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]) -> str:
+    """
+    Digest of a collection's records that does not depend on their order
+    """
+    digest = hashlib.sha256()
+    for record_id, document, metadata in sorted(zip(ids, documents, metadatas), key=lambda record: record[0]):
+        digest.update(json.dumps([record_id, document, metadata or {}], sort_keys=True).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class VectorIndex:
+    """
+    Thread-safe brute-force vector index mirroring one Chroma collection
+
+    Distances are computed in the collection's space (CHROMA_DISTANCE_SPACE),
+    so results are interchangeable with a Chroma query.
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_PATH, distance_space: str = CHROMA_DISTANCE_SPACE,
+                 snapshot_delay: float = VECTOR_INDEX_SNAPSHOT_DELAY):
+        self.path = path
+        self.distance_space = distance_space
+        self.snapshot_delay = snapshot_delay
+        self._lock = threading.Lock()
+        # Serializes snapshot writes, which run outside _lock
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_timer: Optional[threading.Timer] = None
+        # Bumped by every change, so a snapshot written meanwhile is known to be stale
+        self._version = 0
+        self._saved_version = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self.collection_id: Optional[str] = None
+        self.loaded = False
+        self.memory_mapped = False
+        self.queries = 0
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ──────── Loading and persistence ────────
+
+    def load(self, collection) -> int:
+        """
+        Build the replica from a Chroma collection, reusing the disk snapshot
+        when its content fingerprint matches the collection
+
+        Args:
+            collection: Sync Chroma collection handle
+
+        Returns:
+            Number of records in the replica
+        """
+        collection_id = str(collection.id)
+        expected = collection.count()
+        snapshot = None
+        if self.path:
+            # Documents and metadata are enough to tell whether the snapshot is current
+            records = self._fetch(collection, expected, ["documents", "metadatas"])
+            snapshot = self._read_snapshot(collection_id, content_fingerprint(*records))
+        if snapshot is not None:
+            ids, documents, metadatas, matrix = snapshot
+            source = "snapshot"
+        else:
+            ids, documents, metadatas, embeddings = self._fetch(collection, expected, ["documents", "metadatas", "embeddings"])
+            matrix = self._as_matrix(embeddings)
+            source = "Chroma"
+        with self._lock:
+            self.collection_id = collection_id
+            self._replace(ids, documents, metadatas, matrix)
+            self.memory_mapped = snapshot is not None and matrix is not None
+            if snapshot is not None:
+                self._saved_version = self._version
+            self.loaded = True
+            self.loaded_at = time.time()
+        if snapshot is None:
+            self.save_snapshot()
+        logger.info(f"Vector index loaded from {source}", records=len(ids), path=self.path or None)
+        return len(ids)
+
+    @staticmethod
+    def _fetch(collection, expected: int, include: List[str]) -> tuple:
+        columns = {"ids": []}
+        columns.update({field: [] for field in include})
+        for offset in range(0, expected, VECTOR_INDEX_LOAD_BATCH):
+            batch = collection.get(limit=VECTOR_INDEX_LOAD_BATCH, offset=offset, include=include)
+            for field, values in columns.items():
+                values.extend(batch[field])
+        return tuple(columns.values())
+
+    def _snapshot_files(self):
+        return os.path.join(self.path, "embeddings.npy"), os.path.join(self.path, "records.json")
+
+    def _read_snapshot(self, collection_id: str, fingerprint: str) -> Optional[tuple]:
+        """
+        (ids, documents, metadatas, memory-mapped matrix) of the snapshot, or None if it is missing or stale
+        """
+        matrix_file, records_file = self._snapshot_files()
+        if not (os.path.exists(matrix_file) and os.path.exists(records_file)):
+            return None
+        with open(records_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if records.get("collection_id") != collection_id or records.get("fingerprint") != fingerprint:
+            return None
+        matrix = np.load(matrix_file, mmap_mode="r") if records["ids"] else None
+        if matrix is not None and len(matrix) != len(records["ids"]):
+            return None
+        return records["ids"], records["documents"], records["metadatas"], matrix
+
+    def save_snapshot(self):
+        """
+        Write the replica to the snapshot directory now, if it changed since the last write
+
+        The state is copied under the lock and written outside it, so queries
+        and updates are not held up by the disk.
+        """
+        if not self.path:
+            return
+        with self._snapshot_lock:
+            with self._lock:
+                if self._version == self._saved_version:
+                    return
+                version, collection_id = self._version, self.collection_id
+                matrix, ids, documents, metadatas = self._matrix, self._ids, self._documents, self._metadatas
+            os.makedirs(self.path, exist_ok=True)
+            matrix_file, records_file = self._snapshot_files()
+            # Write to temporary files first so a crash never leaves a half-written snapshot
+            np.save(matrix_file + ".tmp.npy", matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32))
+            with open(records_file + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "collection_id": collection_id,
+                    "fingerprint": content_fingerprint(ids, documents, metadatas),
+                    "ids": ids,
+                    "documents": documents,
+                    "metadatas": metadatas
+                }, f)
+            os.replace(matrix_file + ".tmp.npy", matrix_file)
+            os.replace(records_file + ".tmp", records_file)
+            with self._lock:
+                self._saved_version = version
+                # Serve from the page cache instead of the heap unless the replica changed meanwhile
+                if self._version == version and matrix is not None:
+                    self._matrix = np.load(matrix_file, mmap_mode="r")
+                    self.memory_mapped = True
+
+    def _schedule_snapshot(self):
+        """
+        Save the snapshot after snapshot_delay; changes made before then share the write
+        """
+        if not self.path or (self._snapshot_timer is not None and self._snapshot_timer.is_alive()):
+            return
+        self._snapshot_timer = threading.Timer(self.snapshot_delay, self._save_scheduled_snapshot)
+        self._snapshot_timer.daemon = True
+        self._snapshot_timer.start()
+
+    def flush_snapshot(self):
+        """
+        Write a pending snapshot now instead of waiting for its timer, e.g. on shutdown
+        """
+        timer = self._snapshot_timer
+        if timer is not None:
+            timer.cancel()
+        self.save_snapshot()
+
+    def _save_scheduled_snapshot(self):
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            # The next load falls back to Chroma when the snapshot does not match
+            logger.error("Error saving vector index snapshot", error=str(e), path=self.path)
+
+    # ──────── Updates ────────
+
+    @staticmethod
+    def _as_matrix(embeddings: Sequence[Sequence[float]]) -> Optional[np.ndarray]:
+        if len(embeddings) == 0:
+            return None
+        return np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+
+    def _replace(self, ids, documents, metadatas, matrix: Optional[np.ndarray]):
+        self._ids = list(ids)
+        self._documents = list(documents)
+        self._metadatas = list(metadatas)
+        self._matrix = matrix if matrix is not None and len(matrix) else None
+        self._sq_norms = np.einsum("ij,ij->i", self._matrix, self._matrix) if self._matrix is not None else None
+        self.memory_mapped = False
+        self._version += 1
+
+    def add(self, ids: List[str], documents: List[str], embeddings: Sequence[Sequence[float]],
+            metadatas: List[Dict[str, Any]]):
+        """
+        Mirror records that were just added to Chroma
+        """
+        if not self.loaded:
+            return
+        vectors = self._as_matrix(embeddings)
+        if vectors is None:
+            return
+        with self._lock:
+            matrix = vectors if self._matrix is None else np.concatenate([self._matrix, vectors])
+            self._replace(self._ids + list(ids), self._documents + list(documents),
+                          self._metadatas + list(metadatas), matrix)
+            self._schedule_snapshot()
+
+    def delete(self, where: Dict[str, Any]):
+        """
+        Mirror a Chroma delete by metadata equality, e.g. {"source": filename}
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            keep = [
+                i for i, metadata in enumerate(self._metadatas)
+                if not all((metadata or {}).get(key) == value for key, value in where.items())
+            ]
+            if len(keep) == len(self._ids):
+                return
+            matrix = self._matrix[keep] if self._matrix is not None and keep else None
+            self._replace([self._ids[i] for i in keep], [self._documents[i] for i in keep],
+                          [self._metadatas[i] for i in keep], matrix)
+            self._schedule_snapshot()
+
+    def clear(self, collection_id: Optional[str] = None):
+        """
+        Mirror the collection being dropped and recreated empty
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self.collection_id = collection_id
+            self._replace([], [], [], None)
+            self._schedule_snapshot()
+
+    # ──────── Queries ────────
+
+    def query(self, query_embedding: Sequence[float], n_results: int, include_embeddings: bool = False) -> Dict[str, Any]:
+        """
+        Top-k nearest chunks, in the same shape as a single-query Chroma result
+
+        Args:
+            query_embedding: Embedding of the query
+            n_results: Number of chunks to return
+            include_embeddings: Also return the chunk embeddings
+
+        Returns:
+            Dictionary with ids, documents, metadatas and distances (and embeddings)
+        """
+        with self._lock:
+            self.queries += 1
+            matrix, sq_norms = self._matrix, self._sq_norms
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+        if matrix is None:
+            empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+            if include_embeddings:
+                empty["embeddings"] = [[]]
+            return empty
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        dots = matrix @ query
+        if self.distance_space == "cosine":
+            norms = np.sqrt(sq_norms) * np.linalg.norm(query)
+            distances = 1.0 - dots / np.where(norms > 0, norms, 1.0)
+        else:
+            # Squared euclidean distance, as reported by Chroma
+            distances = np.maximum(sq_norms - 2.0 * dots + float(query @ query), 0.0)
+
+        k = min(n_results, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        results = {
+            "ids": [[ids[i] for i in top]],
+            "documents": [[documents[i] for i in top]],
+            "metadatas": [[metadatas[i] for i in top]],
+            "distances": [[float(distances[i]) for i in top]],
+        }
+        if include_embeddings:
+            results["embeddings"] = [np.array(matrix[top])]
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": LOCAL_VECTOR_INDEX,
+            "loaded": self.loaded,
+            "records": len(self._ids),
+            "dimensions": int(self._matrix.shape[1]) if self._matrix is not None else 0,
+            "memory_mapped": self.memory_mapped,
+            "snapshot_pending": self._version != self._saved_version if self.path else False,
+            "distance_space": self.distance_space,
+            "queries": self.queries,
+            "loaded_at": self.loaded_at
+        }
+
+
+# Process-wide replica of the knowledge base collection
+vector_index = VectorIndex()
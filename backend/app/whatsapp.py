@@ -2,17 +2,22 @@
 import os
 import json
 import hmac
+import asyncio
 import hashlib
-import requests
+import httpx
 import logging
 import fnmatch
 from typing import Dict, Any, Optional
 from fastapi import APIRouter, Request, HTTPException, Depends, Header, Response
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import get_db
-from .models import ChatRequest, ChatResponse
-from .rag import chat as rag_chat
+from .models import ChatRequest, ChatResponse, Conversation, ConversationStatus
+from .rag import chat as rag_chat, turn_writer
+from .turn_writer import WriteBehindTimeout
+from .session_cache import session_cache
+from .metrics import track_request, timed
 from pydantic import BaseModel
 from .database import ENABLE_DATABASE_STORAGE
 
@@ -25,6 +30,13 @@ WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
 WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
 WHATSAPP_VERSION = os.getenv("WHATSAPP_VERSION", "v17.0")
 WHATSAPP_NUMBER_FILTER = os.getenv("WHATSAPP_NUMBER_FILTER", "")
+# Base URL of the Graph API (a local stand-in in load tests)
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com").rstrip("/")
+# Seconds to wait for a Graph API call before giving up on a message part
+WHATSAPP_SEND_TIMEOUT = float(os.getenv("WHATSAPP_SEND_TIMEOUT", "10"))
+
+# Shared Graph API client, so parts and messages reuse pooled connections
+_graph_client: Optional[httpx.AsyncClient] = None
 
 # Models for WhatsApp API
 class WhatsAppTextMessage(BaseModel):
@@ -44,6 +56,20 @@ def is_whatsapp_configured():
    """Check if WhatsApp integration is properly configured"""
    return all([WHATSAPP_TOKEN, WHATSAPP_APP_SECRET, WHATSAPP_PHONE_ID])
 
+def get_graph_client() -> httpx.AsyncClient:
+   """Shared async client for the Graph API, created on first use"""
+   global _graph_client
+   if _graph_client is None:
+       _graph_client = httpx.AsyncClient(timeout=WHATSAPP_SEND_TIMEOUT)
+   return _graph_client
+
+async def close_graph_client():
+   """Close the Graph API client's pooled connections when the app shuts down"""
+   global _graph_client
+   if _graph_client is not None:
+       await _graph_client.aclose()
+   _graph_client = None
+
 # Initialize router with prefix
 router = APIRouter(prefix="/api/whatsapp", tags=["whatsapp"])
 
@@ -120,11 +146,11 @@ async def verify_webhook(
 @router.post("/webhook")
 async def receive_message(
    request: Request, 
-   db: Session = Depends(get_db),
+   db: AsyncSession = Depends(get_db),
    _: bool = Depends(verify_whatsapp_config)
 ):
     # Verify signature and parse request body (keep existing code)
-    await verify_signature(request)
+    await verify_signature(request, request.headers.get("X-Hub-Signature-256"))
     body = await request.json()
     logger.debug(f"Received webhook: {json.dumps(body, indent=2)}")
     
@@ -167,11 +193,17 @@ async def receive_message(
                 session_id=session_id
             )
             
-            # Get response from RAG system
-            chat_response = await rag_chat(request, chat_request, db)
+            # Get response from RAG system; the manual-review gate below needs the score now
+            chat_response = await rag_chat(request, chat_request, db, evaluate_inline=True)
             
             if ENABLE_DATABASE_STORAGE:
-                conversation = db.query(Conversation).filter(Conversation.session_id == session_id).first()
+                # The turn was just saved, so its status is usually still cached
+                await turn_writer.wait_for(session_id)
+                conversation = session_cache.get(session_id)
+                if conversation is None:
+                    conversation = await db.scalar(select(Conversation).where(Conversation.session_id == session_id))
+                    # Release the connection before the Graph API calls
+                    await db.commit()
                 
                 if conversation and conversation.status != ConversationStatus.WAITING_FOR_MANUAL.value:
                     # Send response back to WhatsApp
@@ -186,6 +218,9 @@ async def receive_message(
         
         return {"status": "success"}
     
+    except WriteBehindTimeout:
+        # 503, so the Graph API delivers the message again later
+        raise
     except Exception as e:
         logger.error(f"Error processing WhatsApp message: {str(e)}", exc_info=True)
         return {"status": "error", "message": str(e)}
@@ -196,7 +231,7 @@ async def send_whatsapp_message(to: str, text: str):
        logger.warning("WhatsApp integration not configured, skipping message send")
        return {"status": "skipped", "reason": "not_configured"}
    
-   url = f"https://graph.facebook.com/{WHATSAPP_VERSION}/{WHATSAPP_PHONE_ID}/messages"
+   url = f"{WHATSAPP_API_URL}/{WHATSAPP_VERSION}/{WHATSAPP_PHONE_ID}/messages"
    
    headers = {
        "Content-Type": "application/json",
@@ -231,27 +266,30 @@ async def send_whatsapp_message(to: str, text: str):
            messages.append(remaining_text)
    
    # Send each part of the message
+   client = get_graph_client()
    responses = []
-   for msg_part in messages:
-       message = WhatsAppMessage(
-           to=to,
-           text=WhatsAppTextMessage(body=msg_part)
-       )
-       
-       try:
-           response = requests.post(url, headers=headers, data=message.json())
-           response.raise_for_status()
-           responses.append(response.json())
-           
-           # Slight delay to prevent rate limiting
-           import asyncio
-           await asyncio.sleep(0.5)
+   with track_request("whatsapp_send", parts=len(messages)) as timing:
+       for msg_part in messages:
+           message = WhatsAppMessage(
+               to=to,
+               text=WhatsAppTextMessage(body=msg_part)
+           )
            
-       except Exception as e:
-           logger.error(f"Error sending WhatsApp message: {str(e)}")
-           if hasattr(e, 'response') and e.response:
-               logger.error(f"Response: {e.response.text}")
-           responses.append({"error": str(e)})
+           try:
+               with timed("graph_api"):
+                   response = await client.post(url, headers=headers, content=message.json())
+                   response.raise_for_status()
+               responses.append(response.json())
+               
+               # Slight delay to prevent rate limiting
+               await asyncio.sleep(0.5)
+               
+           except Exception as e:
+               logger.error(f"Error sending WhatsApp message: {str(e)}")
+               if isinstance(e, httpx.HTTPStatusError):
+                   logger.error(f"Response: {e.response.text}")
+               responses.append({"error": str(e)})
+               timing["outcome"] = "error"
    
    return responses
 
@@ -269,7 +307,7 @@ async def whatsapp_status():
 @router.post("/test-webhook")
 async def test_webhook(
     payload: TestWebhookPayload,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Test endpoint with explicit schema for webhook testing"""
     # Skip signature verification for testing
@@ -288,7 +326,7 @@ async def test_webhook(
         chat_request = ChatRequest(query=message_text, session_id=session_id)
         
         # Get response
-        chat_response = await rag_chat(None, chat_request, db)
+        chat_response = await rag_chat(None, chat_request, db, evaluate_inline=True)
         
         # Return the response that would be sent
         return {
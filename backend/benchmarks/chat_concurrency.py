@@ -0,0 +1,213 @@
+# backend/benchmarks/chat_concurrency.py
+"""
+Concurrency benchmark for rag.chat against the stub OpenAI and Chroma servers.
+
+Fires a number of chat turns at a fixed concurrency through a single event loop
+(what one uvicorn worker sees) and reports requests/sec and latency percentiles.
+
+To compare against another revision, point --app-dir at its backend directory:
+    git worktree add /tmp/before <commit>
+    python -m benchmarks.chat_concurrency --app-dir /tmp/before/backend
+    python -m benchmarks.chat_concurrency
+
+Conversations are not stored unless --database is given, which stores them
+in a fresh SQLite file (or --database-url) as a deployment would.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import tempfile
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+from benchmarks.stub_servers import fake_embedding
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_DOCUMENTS = [
+    "A residence permit must be renewed before it expires at the immigration office.",
+    "Family reunification requires proof of accommodation and means of subsistence.",
+    "The residence card is issued to family members of EU citizens.",
+    "Naturalization requires five years of legal residence and knowledge of Portuguese.",
+    "A criminal record certificate must be issued by the country of origin.",
+]
+
+QUESTIONS = [
+    "How do I renew my residence permit?",
+    "What do I need for family reunification?",
+    "Who can get a residence card?",
+    "How many years of residence for naturalization?",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_stub_servers(args):
+    """
+    Run the stubs in a separate process so they do not compete with the
+    code under test for the GIL
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.stub_servers",
+            "--openai-port", str(args.openai_port),
+            "--chroma-port", str(args.chroma_port),
+            "--chat-latency-ms", str(args.chat_latency_ms),
+            "--embed-latency-ms", str(args.embed_latency_ms),
+            "--chroma-latency-ms", str(args.chroma_latency_ms),
+            # Optional settings, only in benchmarks that expose them
+            "--chat-tokens-per-second", str(getattr(args, "chat_tokens_per_second", 0)),
+            "--embed-tokens-per-second", str(getattr(args, "embed_tokens_per_second", 0)),
+            "--whatsapp-latency-ms", str(getattr(args, "whatsapp_latency_ms", 100)),
+            "--prefill-tokens-per-second", str(getattr(args, "prefill_tokens_per_second", 0)),
+        ],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 20
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.chroma_port}/api/v2/heartbeat", timeout=1)
+            return process
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("Stub servers did not start")
+            time.sleep(0.1)
+
+
+def seed_collection(chroma_url, collection_name):
+    """Insert a handful of documents into the stub Chroma collection"""
+    import chromadb
+    from urllib.parse import urlparse
+
+    parsed = urlparse(chroma_url)
+    collection = chromadb.HttpClient(host=parsed.hostname, port=parsed.port).get_or_create_collection(collection_name)
+    collection.add(
+        ids=[str(uuid.uuid4()) for _ in SAMPLE_DOCUMENTS],
+        documents=list(SAMPLE_DOCUMENTS),
+        metadatas=[{"source": f"doc{i}.txt", "chunk_index": 0, "total_chunks": 1} for i in range(len(SAMPLE_DOCUMENTS))],
+        embeddings=[fake_embedding(doc) for doc in SAMPLE_DOCUMENTS],
+    )
+
+
+def open_session():
+    """
+    Database session of the revision under test: AsyncSession, or the sync
+    Session of revisions before the async persistence layer
+    """
+    from app import database
+    factory = getattr(database, "AsyncSessionLocal", None) or database.SessionLocal
+    return factory()
+
+
+async def close_session(db):
+    result = db.close()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def run_load(total_requests, concurrency, distinct=False):
+    from app import rag
+    from app.models import ChatRequest
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            db = open_session()
+            started = time.perf_counter()
+            try:
+                query = QUESTIONS[i % len(QUESTIONS)]
+                if distinct:
+                    query = f"{query} (variant {i})"
+                await rag.chat(None, ChatRequest(query=query, session_id=f"bench-{i}"), db)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            finally:
+                await close_session(db)
+
+    # Warm up connections and imports
+    await one(-1)
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total_requests / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rag.chat concurrency against stub servers")
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="Backend directory containing the app package")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chroma-latency-ms", type=float, default=10)
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    parser.add_argument("--distinct", action="store_true", help="Make every question unique, so none is answered from cache")
+    parser.add_argument("--database", action="store_true", help="Store conversations, as with ENABLE_DATABASE_STORAGE=true")
+    parser.add_argument("--database-url", help="Database for --database (default: a new SQLite file)")
+    args = parser.parse_args()
+    args.app_dir = os.path.abspath(args.app_dir)
+
+    stubs = start_stub_servers(args)
+    chroma_url = f"http://127.0.0.1:{args.chroma_port}"
+
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "CHROMA_SERVER_URL": chroma_url,
+        "ENABLE_DATABASE_STORAGE": "true" if args.database else "false",
+    })
+    if args.database:
+        database_dir = tempfile.mkdtemp(prefix="chat_concurrency_")
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(database_dir, 'bench.db')}"
+        # The app creates ./app/app/data for its default database
+        os.chdir(database_dir)
+
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    try:
+        seed_collection(chroma_url, os.getenv("COLLECTION_NAME", "kb_default"))
+        if args.database:
+            import app.models  # registers the tables
+            from app.database import init_db
+            init_db()
+        result = asyncio.run(run_load(args.requests, args.concurrency, args.distinct))
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+    result["app_dir"] = os.path.abspath(args.app_dir)
+    result["database"] = os.environ.get("DATABASE_URL") if args.database else None
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
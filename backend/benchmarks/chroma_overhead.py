@@ -0,0 +1,145 @@
+# backend/benchmarks/chroma_overhead.py
+"""
+Micro-benchmark of the Chroma work done per request, against the stub Chroma server.
+
+Compares, for the chat retrieval (async) and the knowledge base endpoints (sync):
+    per_request_client  new client + get_or_create_collection + operation (the old code path)
+    shared_client       shared client + get_or_create_collection + operation
+    cached_handle       shared client and cached collection handle, operation only
+
+and reports milliseconds and Chroma HTTP requests per call.
+
+    python -m benchmarks.chroma_overhead --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+from types import SimpleNamespace
+
+from benchmarks.chat_concurrency import BACKEND_DIR, QUESTIONS, seed_collection, start_stub_servers
+from benchmarks.stub_servers import fake_embedding
+
+
+def chroma_requests(chroma_url):
+    with urllib.request.urlopen(f"{chroma_url}/stub/stats") as response:
+        return json.load(response)["requests"]
+
+
+def measure(chroma_url, iterations, run_one):
+    """
+    Time `iterations` calls of a synchronous callable
+
+    Returns:
+        Dictionary with ms and Chroma requests per call
+    """
+    run_one(0)  # warm up
+    requests_before = chroma_requests(chroma_url)
+    started = time.perf_counter()
+    for i in range(iterations):
+        run_one(i)
+    elapsed = time.perf_counter() - started
+    return {
+        "ms_per_call": round(elapsed / iterations * 1000, 3),
+        "chroma_requests_per_call": round((chroma_requests(chroma_url) - requests_before) / iterations, 2),
+    }
+
+
+def async_cases(host, port, collection_name):
+    import chromadb
+    from app import chunk_and_index, rag
+
+    embeddings = [fake_embedding(question) for question in QUESTIONS]
+    include = ["documents", "metadatas", "distances"]
+
+    async def per_request_client(i):
+        client = await chromadb.AsyncHttpClient(host=host, port=port)
+        collection = await client.get_or_create_collection(name=collection_name)
+        await collection.query(query_embeddings=[embeddings[i % len(embeddings)]], n_results=rag.TOP_K, include=include)
+
+    async def shared_client(i):
+        client = await chunk_and_index.get_async_chroma_client()
+        collection = await client.get_or_create_collection(name=collection_name)
+        await collection.query(query_embeddings=[embeddings[i % len(embeddings)]], n_results=rag.TOP_K, include=include)
+
+    async def cached_handle(i):
+        await rag.query_collection(embeddings[i % len(embeddings)])
+
+    return {
+        "per_request_client": per_request_client,
+        "shared_client": shared_client,
+        "cached_handle": cached_handle,
+    }
+
+
+def sync_cases(host, port, collection_name):
+    import chromadb
+    from app import chunk_and_index
+
+    def per_request_client(i):
+        client = chromadb.HttpClient(host=host, port=port)
+        client.get_or_create_collection(name=collection_name).count()
+
+    def shared_client(i):
+        chunk_and_index.get_chroma_client().get_or_create_collection(name=collection_name).count()
+
+    def cached_handle(i):
+        chunk_and_index.with_collection(lambda collection: collection.count())
+
+    return {
+        "per_request_client": per_request_client,
+        "shared_client": shared_client,
+        "cached_handle": cached_handle,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-request Chroma overhead against the stub server")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--chroma-latency-ms", type=float, default=0)
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    args = parser.parse_args()
+
+    stubs = start_stub_servers(SimpleNamespace(
+        openai_port=args.openai_port,
+        chroma_port=args.chroma_port,
+        chat_latency_ms=0,
+        embed_latency_ms=0,
+        chroma_latency_ms=args.chroma_latency_ms,
+    ))
+    chroma_url = f"http://127.0.0.1:{args.chroma_port}"
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "CHROMA_SERVER_URL": chroma_url,
+        "ENABLE_DATABASE_STORAGE": "false",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+    collection_name = os.getenv("COLLECTION_NAME", "kb_default")
+
+    result = {"iterations": args.iterations, "chroma_latency_ms": args.chroma_latency_ms}
+    try:
+        seed_collection(chroma_url, collection_name)
+        loop = asyncio.new_event_loop()
+        result["chat_query"] = {
+            name: measure(chroma_url, args.iterations, lambda i, case=case: loop.run_until_complete(case(i)))
+            for name, case in async_cases("127.0.0.1", args.chroma_port, collection_name).items()
+        }
+        loop.close()
+        result["kb_endpoint"] = {
+            name: measure(chroma_url, args.iterations, case)
+            for name, case in sync_cases("127.0.0.1", args.chroma_port, collection_name).items()
+        }
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# backend/benchmarks/db_writes.py
+"""
+Concurrent chat writes against the SQLite storage profile.
+
+Drives the persistence half of a chat turn directly, with no OpenAI or Chroma
+involved: rag.load_conversation reads the history, a pause stands in for the
+completion, and rag.finish_chat saves the question and answer and updates the
+conversation. Many sessions run at once on one event loop, on top of a
+database already holding --history-conversations conversations, so the
+history query has a realistic table to search.
+
+Each profile runs in its own process with a fresh database file, since the
+SQLITE_* settings are read at import:
+
+    baseline       rollback journal, synchronous=FULL, no composite/status indexes
+    indexed        as baseline with the indexes
+    wal            WAL, synchronous=NORMAL, indexes, one pooled connection
+    wal_pool4      as wal with four pooled connections
+    session_cache  as wal with the session cache, so history is read from memory
+    write_behind   as session_cache with CHAT_PERSISTENCE_MODE=write_behind
+
+The other profiles run with SESSION_CACHE_SIZE=0.
+
+    python -m benchmarks.db_writes --sessions 100 --turns 10 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.chat_concurrency import BACKEND_DIR, percentile
+
+ROLLBACK = {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_POOL_SIZE": "1"}
+WAL = {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "SQLITE_POOL_SIZE": "1"}
+PROFILES = {
+    "baseline": dict(ROLLBACK, SESSION_CACHE_SIZE="0"),
+    "indexed": dict(ROLLBACK, SESSION_CACHE_SIZE="0"),
+    "wal": dict(WAL, SESSION_CACHE_SIZE="0"),
+    "wal_pool4": dict(WAL, SQLITE_POOL_SIZE="4", SESSION_CACHE_SIZE="0"),
+    "session_cache": dict(WAL, SESSION_CACHE_SIZE="5000"),
+    "write_behind": dict(WAL, SESSION_CACHE_SIZE="5000", CHAT_PERSISTENCE_MODE="write_behind"),
+}
+# Profiles measured without the indexes added by the schema migrations
+WITHOUT_INDEXES = {"baseline"}
+INDEXES = ["ix_messages_conversation_id_timestamp", "ix_conversations_status"]
+
+
+def seed_history(engine, conversations, messages_per_conversation):
+    """
+    Fill the database with earlier conversations, interleaved in time as real traffic is
+    """
+    import datetime
+    from app.models import Conversation, Message
+
+    now = datetime.datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(Conversation.__table__.insert(), [
+            {"id": c + 1, "session_id": f"history-{c}", "created_at": now, "updated_at": now,
+             "status": "waiting_for_user"}
+            for c in range(conversations)
+        ])
+        rows = []
+        for m in range(messages_per_conversation):
+            for c in range(conversations):
+                rows.append({
+                    "conversation_id": c + 1, "role": "user" if m % 2 == 0 else "assistant",
+                    "content": f"Earlier message {m} of conversation {c}",
+                    "timestamp": now - datetime.timedelta(seconds=(messages_per_conversation - m) * conversations - c),
+                    "message_type": "auto",
+                })
+        connection.execute(Message.__table__.insert(), rows)
+
+
+def history_query_plan(engine):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE conversation_id = 1 ORDER BY timestamp DESC LIMIT 10"
+        )).all()
+    return " / ".join(row[-1] for row in rows)
+
+
+async def run_sessions(sessions, turns, concurrency, think_seconds):
+    from app.database import AsyncSessionLocal, close_db
+    from app.rag import ChatTurn, finish_chat, load_conversation, turn_writer
+
+    semaphore = asyncio.Semaphore(concurrency)
+    load_latencies, save_latencies, errors = [], [], {}
+
+    async def turn(session_id, t):
+        async with semaphore:
+            try:
+                async with AsyncSessionLocal() as db:
+                    started = time.perf_counter()
+                    conversation, history, summary = await load_conversation(session_id, db)
+                    load_latencies.append(time.perf_counter() - started)
+                    await asyncio.sleep(think_seconds)
+                    chat_turn = ChatTurn(
+                        query=f"Question {t} of {session_id}", session_id=session_id, conversation=conversation,
+                        context="", sources=["kb.txt"], messages=[], distances=[], query_embedding=[],
+                        first_turn=False, kb_version=0, unsummarized_messages=len(history),
+                    )
+                    started = time.perf_counter()
+                    await finish_chat(chat_turn, f"Answer {t} for {session_id}", db, confidence=(90.0, "bench"))
+                    save_latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    async def session(s):
+        # Turns of one conversation are sequential, as a user waits for each answer
+        for t in range(turns):
+            await turn(f"bench-{s}", t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(s) for s in range(sessions)))
+    # Queued turns count as done once they are in the database
+    await turn_writer.wait_for()
+    elapsed = time.perf_counter() - started
+    writer = turn_writer.stats()
+    await turn_writer.stop()
+    await close_db()
+
+    def ms(values, fraction):
+        return round(percentile(values, fraction) * 1000, 2) if values else None
+
+    return {
+        "turns": sessions * turns,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(sessions * turns / elapsed, 2),
+        "load_p50_ms": ms(load_latencies, 0.50),
+        "load_p95_ms": ms(load_latencies, 0.95),
+        "save_p50_ms": ms(save_latencies, 0.50),
+        "save_p95_ms": ms(save_latencies, 0.95),
+        "save_mean_ms": round(statistics.mean(save_latencies) * 1000, 2) if save_latencies else None,
+        "write_batches": writer["batches"],
+    }
+
+
+def run_child(args):
+    from sqlalchemy import text
+    from app.database import engine, init_db
+
+    init_db()
+    if args.child in WITHOUT_INDEXES:
+        with engine.begin() as connection:
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    seed_history(engine, args.history_conversations, args.history_messages)
+    result = {"profile": args.child, "settings": PROFILES[args.child], "indexes": args.child not in WITHOUT_INDEXES}
+    with engine.connect() as connection:
+        result["journal_mode"] = connection.execute(text("PRAGMA journal_mode")).scalar()
+    result["history_query_plan"] = history_query_plan(engine)
+    result.update(asyncio.run(run_sessions(args.sessions, args.turns, args.concurrency, args.think_ms / 1000)))
+    return result
+
+
+def run_profile(args, profile):
+    """
+    Run one profile in a child process with a fresh database and return its result
+    """
+    workdir = tempfile.mkdtemp(prefix="db_writes_")
+    output = os.path.join(workdir, "result.json")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        ENABLE_DATABASE_STORAGE="true",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'db_writes.db')}",
+        SUMMARY_TRIGGER_MESSAGES="1000000",
+        PYTHONPATH=f"{os.path.abspath(args.app_dir)}{os.pathsep}{BACKEND_DIR}",
+        **PROFILES[profile],
+    )
+    command = [
+        sys.executable, "-m", "benchmarks.db_writes", "--child", profile, "--child-output", output,
+        "--sessions", str(args.sessions), "--turns", str(args.turns), "--concurrency", str(args.concurrency),
+        "--think-ms", str(args.think_ms), "--history-conversations", str(args.history_conversations),
+        "--history-messages", str(args.history_messages),
+    ]
+    subprocess.run(
+        command, cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL, check=True,
+    )
+    with open(output) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent chat writes for SQLite storage profiles")
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="Backend directory containing the app package")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--sessions", type=int, default=100, help="Conversations written at the same time")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per conversation")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--think-ms", type=float, default=50, help="Pause between history read and save")
+    parser.add_argument("--history-conversations", type=int, default=5000, help="Conversations already stored")
+    parser.add_argument("--history-messages", type=int, default=20, help="Messages per stored conversation")
+    parser.add_argument("--verbose", action="store_true", help="Show the backend's output")
+    parser.add_argument("--child", choices=list(PROFILES), help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(args)
+        with open(args.child_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for profile in args.profiles:
+        result = run_profile(args, profile)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+    print(json.dumps({"app_dir": os.path.abspath(args.app_dir), "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# backend/benchmarks/embedding_batching.py
+"""
+Load test of query embedding micro-batching against the stub servers.
+
+Fires chat turns with distinct questions (so neither cache answers) at a fixed
+concurrency, once per batching window, and reports throughput, latency, the
+number of embeddings requests the stub received and the batch size
+distribution. Each window runs in a fresh process because the batching
+settings are read at import time.
+
+    python -m benchmarks.embedding_batching --windows 0 2 5 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.chat_concurrency import (
+    BACKEND_DIR, QUESTIONS, close_session, open_session, percentile, seed_collection, start_stub_servers
+)
+
+
+def stub_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stub/stats") as response:
+        return json.loads(response.read())
+
+
+async def run_load(total_requests, concurrency):
+    from app import rag
+    from app.chunk_and_index import embedding_batcher
+    from app.models import ChatRequest
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            query = f"{QUESTIONS[i % len(QUESTIONS)]} (variant {i})"
+            db = open_session()
+            started = time.perf_counter()
+            try:
+                await rag.chat(None, ChatRequest(query=query, session_id=f"batch-{i}"), db)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            finally:
+                await close_session(db)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "requests_per_s": round(total_requests / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+        "batcher": embedding_batcher.stats(),
+    }
+
+
+def run_child(args):
+    sys.path.insert(0, BACKEND_DIR)
+    print(json.dumps(asyncio.run(run_load(args.requests, args.concurrency))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure query embedding batching under concurrent chat load")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10], help="Batching windows in ms, 0 disables")
+    parser.add_argument("--max-size", type=int, default=64)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chroma-latency-ms", type=float, default=10)
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    stubs = start_stub_servers(args)
+    chroma_url = f"http://127.0.0.1:{args.chroma_port}"
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1",
+        CHROMA_SERVER_URL=chroma_url,
+        ENABLE_DATABASE_STORAGE="false",
+        EMBEDDING_CACHE_SIZE="0",
+        EMBEDDING_CACHE_PATH="",
+        ANSWER_CACHE_SIZE="0",
+        EMBED_BATCH_MAX_SIZE=str(args.max_size),
+    )
+    results = []
+    try:
+        seed_collection(chroma_url, os.getenv("COLLECTION_NAME", "kb_default"))
+        for window in args.windows:
+            before = stub_stats(args.openai_port)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_batching", "--child",
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+                cwd=BACKEND_DIR, env=dict(env, EMBED_BATCH_WINDOW_MS=str(window)),
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            after = stub_stats(args.openai_port)
+            result["window_ms"] = window
+            result["embeddings_requests"] = after["embeddings_requests"] - before["embeddings_requests"]
+            result["embeddings_inputs"] = after["embeddings_inputs"] - before["embeddings_inputs"]
+            results.append(result)
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+    print(json.dumps({"concurrency": args.concurrency, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
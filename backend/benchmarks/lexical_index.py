@@ -0,0 +1,101 @@
+# backend/benchmarks/lexical_index.py
+"""
+Benchmark of the in-process BM25 index on the knowledge base files.
+
+Chunks kb_files/clean and kb_files/raw the way index_file does, builds the
+index, then times lookups for the questions in kb_files/qa_v3.txt and
+incremental add/delete of one file. Runs fully offline.
+
+    python -m benchmarks.lexical_index --iterations 1000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import uuid
+
+from benchmarks.chat_concurrency import BACKEND_DIR, percentile
+
+KB_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "kb_files")
+
+
+def load_chunks():
+    from app.chunk_and_index import chunk_text
+
+    ids, documents, metadatas = [], [], []
+    for folder in ("clean", "raw"):
+        directory = os.path.join(KB_DIR, folder)
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith((".txt", ".md")):
+                continue
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                chunks = chunk_text(f.read())
+            for i, chunk in enumerate(chunks):
+                ids.append(str(uuid.uuid4()))
+                documents.append(chunk)
+                metadatas.append({"source": filename, "chunk_index": i, "total_chunks": len(chunks)})
+    return ids, documents, metadatas
+
+
+def load_questions():
+    with open(os.path.join(KB_DIR, "qa_v3.txt"), "r", encoding="utf-8") as f:
+        return re.findall(r"Question:\s*(.+)", f.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure BM25 index build and lookup time on the knowledge base")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["ENABLE_DATABASE_STORAGE"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+    from app.lexical_index import LexicalIndex
+
+    ids, documents, metadatas = load_chunks()
+    questions = load_questions() + ["Lei 23/2007 artigo 88", "article 122 of Law 23-2007"]
+
+    index = LexicalIndex()
+    index.loaded = True
+    started = time.perf_counter()
+    index.add(ids, documents, metadatas)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    for i in range(args.iterations):
+        started = time.perf_counter()
+        index.query(questions[i % len(questions)], args.candidates)
+        latencies.append(time.perf_counter() - started)
+
+    # Incremental update: remove and re-add the largest source
+    source = max(set(m["source"] for m in metadatas), key=lambda s: sum(1 for m in metadatas if m["source"] == s))
+    rows = [i for i, m in enumerate(metadatas) if m["source"] == source]
+    started = time.perf_counter()
+    index.delete({"source": source})
+    delete_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    index.add([ids[i] for i in rows], [documents[i] for i in rows], [metadatas[i] for i in rows])
+    add_ms = (time.perf_counter() - started) * 1000
+
+    example = index.query("Lei 23/2007 artigo 88", 3)
+    print(json.dumps({
+        "chunks": len(ids),
+        "terms": index.stats()["terms"],
+        "build_ms": round(build_ms, 2),
+        "query_p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "query_p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+        "query_max_ms": round(max(latencies) * 1000, 4),
+        "delete_source_ms": round(delete_ms, 2),
+        "add_source_ms": round(add_ms, 2),
+        "updated_source": source,
+        "updated_chunks": len(rows),
+        "example_query": "Lei 23/2007 artigo 88",
+        "example_top_sources": [hit["metadata"]["source"] for hit in example],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
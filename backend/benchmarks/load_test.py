@@ -0,0 +1,280 @@
+# backend/benchmarks/load_test.py
+"""
+End-to-end load test of the HTTP API against the stub servers.
+
+Starts the stub OpenAI (plus WhatsApp Graph API) and Chroma servers, runs the
+backend with uvicorn in a scratch directory, then drives each scenario at a
+fixed concurrency over HTTP:
+
+    chat       POST /api/chat, a mix of repeated and distinct questions
+    kb_load    POST /api/kb/load, one small file per request
+    whatsapp   POST /api/whatsapp/webhook, signed like Meta's deliveries
+
+Latency percentiles, throughput and error rates per scenario are written as
+JSON, together with the revision that was tested, so runs can be compared:
+
+    python -m benchmarks.load_test --output before.json --app-dir /tmp/before/backend
+    python -m benchmarks.load_test --output after.json
+    python -m benchmarks.load_test --compare before.json after.json
+
+Extra backend settings can be passed with --env NAME=VALUE.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+
+import httpx
+
+from benchmarks.chat_concurrency import BACKEND_DIR, QUESTIONS, percentile, seed_collection, start_stub_servers
+
+SCENARIOS = ("chat", "kb_load", "whatsapp")
+WHATSAPP_SECRET = "load-test-secret"
+
+
+def git_revision(directory):
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=directory, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_backend(args, workdir, env):
+    """
+    Run the API with uvicorn; kb_files and the SQLite database go to workdir
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=workdir,
+        env=dict(env, PYTHONPATH=os.path.abspath(args.app_dir)),
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/api/confidence/status", timeout=1)
+            return process
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("Backend did not start, rerun with --verbose")
+            time.sleep(0.2)
+
+
+def chat_request(i, distinct_ratio):
+    # Broadcast-style traffic: most users ask one of a few questions, the rest something new
+    question = QUESTIONS[i % len(QUESTIONS)]
+    if (i * 7919) % 100 < distinct_ratio * 100:
+        question = f"{question} (case {i})"
+    return {"method": "POST", "url": "/api/chat", "json": {"query": question, "session_id": f"load-chat-{i}"}}
+
+
+def kb_load_request(i, distinct_ratio):
+    text = f"Document {i}. " + " ".join(QUESTIONS) + f" Reference number {i}.\n"
+    return {"method": "POST", "url": "/api/kb/load", "files": {"files": (f"load_{i}.txt", (text * 20).encode())}}
+
+
+def whatsapp_request(i, distinct_ratio):
+    question = QUESTIONS[i % len(QUESTIONS)]
+    payload = {"entry": [{"changes": [{"value": {"messages": [{
+        "from": f"5550{i:06d}", "id": f"wamid.load{i}", "type": "text", "text": {"body": question}
+    }]}}]}]}
+    body = json.dumps(payload).encode()
+    signature = hmac.new(WHATSAPP_SECRET.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
+    return {
+        "method": "POST", "url": "/api/whatsapp/webhook", "content": body,
+        "headers": {"Content-Type": "application/json", "X-Hub-Signature-256": f"sha256={signature}"},
+    }
+
+
+REQUEST_BUILDERS = {"chat": chat_request, "kb_load": kb_load_request, "whatsapp": whatsapp_request}
+
+
+def is_error(scenario, response):
+    if response.status_code >= 400:
+        return True
+    # Both endpoints answer 200 and report failures in the body
+    body = response.json()
+    if scenario == "whatsapp":
+        return body.get("status") != "success"
+    if scenario == "kb_load":
+        return any(result.get("status") != "success" for result in body.values())
+    return False
+
+
+async def run_scenario(base_url, scenario, total_requests, concurrency, distinct_ratio, timeout):
+    build = REQUEST_BUILDERS[scenario]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(**build(i, distinct_ratio))
+                    latencies.append(time.perf_counter() - started)
+                    statuses[str(response.status_code)] += 1
+                    errors += is_error(scenario, response)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - started
+
+    def ms(value):
+        return round(value * 1000, 1) if latencies else None
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": round(errors / total_requests, 4) if total_requests else 0.0,
+        "status_codes": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total_requests / elapsed, 2) if elapsed else None,
+        "latency_p50_ms": ms(percentile(latencies, 0.50)) if latencies else None,
+        "latency_p95_ms": ms(percentile(latencies, 0.95)) if latencies else None,
+        "latency_p99_ms": ms(percentile(latencies, 0.99)) if latencies else None,
+        "latency_mean_ms": ms(statistics.mean(latencies)) if latencies else None,
+        "latency_max_ms": ms(max(latencies)) if latencies else None,
+    }
+
+
+def compare(before_path, after_path):
+    """
+    Print the change of each scenario's metrics between two result files
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    keys = ("requests_per_s", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "error_rate")
+    report = {"before": before.get("revision"), "after": after.get("revision"), "scenarios": {}}
+    for scenario, result in after["scenarios"].items():
+        previous = before["scenarios"].get(scenario)
+        if not previous:
+            continue
+        report["scenarios"][scenario] = {
+            key: {
+                "before": previous.get(key),
+                "after": result.get(key),
+                "change_pct": round((result[key] - previous[key]) / previous[key] * 100, 1)
+                if previous.get(key) and result.get(key) is not None else None,
+            }
+            for key in keys
+        }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP API against stub OpenAI and Chroma servers")
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="Backend directory containing the app package")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--distinct-ratio", type=float, default=0.5, help="Share of chat questions that are unique")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chroma-latency-ms", type=float, default=10)
+    parser.add_argument("--chat-tokens-per-second", type=float, default=0, help="Completion generation rate, 0 for none")
+    parser.add_argument("--embed-tokens-per-second", type=float, default=0, help="Embedding input rate, 0 for none")
+    parser.add_argument("--whatsapp-latency-ms", type=float, default=100)
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    parser.add_argument("--port", type=int, default=18000, help="Port of the backend under test")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Extra backend setting")
+    parser.add_argument("--output", help="Result file (default: load_test-<revision>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files and exit")
+    parser.add_argument("--verbose", action="store_true", help="Show the backend's output")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    revision = git_revision(args.app_dir)
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1",
+        CHROMA_SERVER_URL=f"http://127.0.0.1:{args.chroma_port}",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        RATE_LIMIT_ENABLED="false",
+        WHATSAPP_TOKEN="load-test-token",
+        WHATSAPP_APP_SECRET=WHATSAPP_SECRET,
+        WHATSAPP_PHONE_ID="load-test-phone",
+        WHATSAPP_API_URL=f"http://127.0.0.1:{args.openai_port}",
+        **extra_env,
+    )
+
+    stubs = start_stub_servers(args)
+    backend = None
+    scenarios = {}
+    try:
+        seed_collection(env["CHROMA_SERVER_URL"], env.get("COLLECTION_NAME", "kb_default"))
+        backend = start_backend(args, workdir, env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        for scenario in args.scenarios:
+            scenarios[scenario] = asyncio.run(run_scenario(
+                base_url, scenario, args.requests, args.concurrency, args.distinct_ratio, args.timeout
+            ))
+            print(f"{scenario}: {json.dumps(scenarios[scenario])}", file=sys.stderr)
+        with urllib.request.urlopen(f"http://127.0.0.1:{args.openai_port}/stub/stats") as response:
+            upstream = json.loads(response.read())
+    finally:
+        if backend:
+            backend.terminate()
+            backend.wait()
+        stubs.terminate()
+        stubs.wait()
+
+    result = {
+        "revision": revision,
+        "app_dir": os.path.abspath(args.app_dir),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "distinct_ratio": args.distinct_ratio,
+            "chat_latency_ms": args.chat_latency_ms,
+            "embed_latency_ms": args.embed_latency_ms,
+            "chroma_latency_ms": args.chroma_latency_ms,
+            "chat_tokens_per_second": args.chat_tokens_per_second,
+            "embed_tokens_per_second": args.embed_tokens_per_second,
+            "whatsapp_latency_ms": args.whatsapp_latency_ms,
+            "env": extra_env,
+        },
+        "scenarios": scenarios,
+        "upstream": upstream,
+    }
+    output = args.output or f"load_test-{revision or 'unknown'}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
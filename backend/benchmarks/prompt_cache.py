@@ -0,0 +1,211 @@
+# backend/benchmarks/prompt_cache.py
+"""
+Prompt caching benchmark: PROMPT_LAYOUT=system vs PROMPT_LAYOUT=prefix_cache.
+
+Runs multi-turn conversations through /api/chat (in process, with SQLite
+history) against the stub servers, once per layout. The stub collection holds
+the chunks of a kb_files directory and the conversations ask the questions
+of the QA files, so the retrieved context changes from turn to turn. The stub OpenAI server
+emulates automatic prompt caching (prefixes of 1024+ tokens, 128-token steps)
+and, with --prefill-tokens-per-second, charges time for the prompt tokens it
+did not find in the cache. The backend's rag_tokens_total counters give the
+prompt and cached prompt tokens of the answer completions.
+
+    python -m benchmarks.prompt_cache --conversations 10 --turns 8
+
+Each layout runs in its own process, since PROMPT_LAYOUT is read at import.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.chat_concurrency import BACKEND_DIR, percentile, start_stub_servers
+from benchmarks.retrieval_eval import KB_DIR, QA_FILES, load_documents, load_questions
+from benchmarks.stub_servers import fake_embedding
+
+LAYOUTS = ("system", "prefix_cache")
+# Stands in for the longer instructions production system prompts carry
+INSTRUCTION = (
+    "Answer only from the provided context and the conversation so far. Quote article numbers when the "
+    "context gives them, keep answers short, and say clearly when the context does not cover the question. "
+)
+
+
+def system_prompt(words):
+    """
+    The default system prompt with about the given number of words of instructions after the context
+    """
+    repeats = max(0, words // len(INSTRUCTION.split()))
+    return (
+        "You are an expert assistant. Use the following context to answer:\n\n{context}\n\n"
+        "Answer conversationally. If you don't know the answer based on the provided context, say so. "
+        + INSTRUCTION * repeats
+    )
+
+
+def seed_knowledge_base(chroma_url, collection_name, kb_dir):
+    """
+    Index the files of kb_dir into the stub Chroma collection with stub embeddings
+    """
+    import chromadb
+    from urllib.parse import urlparse
+    from app.chunk_and_index import chunk_text
+
+    ids, chunks, metadatas = [], [], []
+    for source, text in load_documents(kb_dir).items():
+        pieces = chunk_text(text)
+        for i, piece in enumerate(pieces):
+            ids.append(str(uuid.uuid4()))
+            chunks.append(piece)
+            metadatas.append({"source": source, "chunk_index": i, "total_chunks": len(pieces)})
+    parsed = urlparse(chroma_url)
+    collection = chromadb.HttpClient(host=parsed.hostname, port=parsed.port).get_or_create_collection(collection_name)
+    collection.add(ids=ids, documents=chunks, metadatas=metadatas, embeddings=[fake_embedding(c) for c in chunks])
+
+
+async def run_conversations(layout, conversations, turns, concurrency):
+    import httpx
+    from prometheus_client import REGISTRY
+    from app.api import app
+    from app.rag import MODEL_NAME
+
+    questions = [question for question, _ in load_questions([os.path.join(KB_DIR, name) for name in QA_FILES])]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {turn: [] for turn in range(turns)}
+    errors = 0
+
+    async def conversation(client, c):
+        nonlocal errors
+        async with semaphore:
+            for turn in range(turns):
+                question = questions[(c * turns + turn) % len(questions)]
+                started = time.perf_counter()
+                response = await client.post("/api/chat", json={"query": question, "session_id": f"{layout}-{c}"})
+                latencies[turn].append(time.perf_counter() - started)
+                errors += response.status_code != 200
+
+    def tokens(kind):
+        labels = {"model": MODEL_NAME, "stage": "completion", "kind": kind}
+        return int(REGISTRY.get_sample_value("rag_tokens_total", labels) or 0)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(conversation(client, c) for c in range(conversations)))
+            elapsed = time.perf_counter() - started
+
+    later = [latency for turn in range(1, turns) for latency in latencies[turn]]
+    return {
+        "layout": layout,
+        "requests": conversations * turns,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "first_turn_mean_ms": round(statistics.mean(latencies[0]) * 1000, 1),
+        "later_turns_mean_ms": round(statistics.mean(later) * 1000, 1) if later else None,
+        "later_turns_p95_ms": round(percentile(later, 0.95) * 1000, 1) if later else None,
+        "prompt_tokens": tokens("prompt"),
+        "cached_prompt_tokens": tokens("cached_prompt"),
+    }
+
+
+def run_layout(args, layout):
+    """
+    Run one layout in a child process and return its result
+    """
+    workdir = tempfile.mkdtemp(prefix="prompt_cache_")
+    output = os.path.join(workdir, "result.json")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1",
+        CHROMA_SERVER_URL=f"http://127.0.0.1:{args.chroma_port}",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'prompt_cache.db')}",
+        PROMPT_LAYOUT=layout,
+        SYSTEM_PROMPT=system_prompt(args.instructions_words),
+        RATE_LIMIT_ENABLED="false",
+        # Only the answer completions: no judge call, no summaries, no shared answers
+        CONFIDENCE_STRATEGY="retrieval",
+        SUMMARY_TRIGGER_MESSAGES="1000",
+        CHAT_COALESCING="false",
+        PYTHONPATH=os.path.abspath(args.app_dir),
+    )
+    command = [
+        sys.executable, "-m", "benchmarks.prompt_cache", "--child", layout, "--child-output", output,
+        "--conversations", str(args.conversations), "--turns", str(args.turns),
+        "--concurrency", str(args.concurrency),
+    ]
+    subprocess.run(
+        command,
+        cwd=workdir,
+        env=dict(env, PYTHONPATH=f"{env['PYTHONPATH']}{os.pathsep}{BACKEND_DIR}"),
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+        check=True,
+    )
+    with open(output) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt layouts for provider prompt caching")
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="Backend directory containing the app package")
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--instructions-words", type=int, default=900, help="Length of the padded system prompt")
+    parser.add_argument("--kb-dir", default=os.path.join(KB_DIR, "clean"), help="Directory indexed into the stub collection")
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chroma-latency-ms", type=float, default=10)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000,
+                        help="Uncached prompt processing rate of the stub, 0 for none")
+    parser.add_argument("--input-price", type=float, default=0.15, help="USD per million uncached prompt tokens")
+    parser.add_argument("--cached-input-price", type=float, default=0.075, help="USD per million cached prompt tokens")
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    parser.add_argument("--verbose", action="store_true", help="Show the backend's output")
+    parser.add_argument("--child", choices=LAYOUTS, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    if args.child:
+        result = asyncio.run(run_conversations(args.child, args.conversations, args.turns, args.concurrency))
+        with open(args.child_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for layout in args.layouts:
+        # Fresh stubs, so one layout cannot reuse the other's cached prefixes
+        stubs = start_stub_servers(args)
+        try:
+            seed_knowledge_base(
+                f"http://127.0.0.1:{args.chroma_port}", os.getenv("COLLECTION_NAME", "kb_default"), args.kb_dir
+            )
+            result = run_layout(args, layout)
+        finally:
+            stubs.terminate()
+            stubs.wait()
+        uncached = result["prompt_tokens"] - result["cached_prompt_tokens"]
+        result["cached_ratio"] = round(result["cached_prompt_tokens"] / result["prompt_tokens"], 4) if result["prompt_tokens"] else 0.0
+        result["input_cost_usd"] = round(
+            (uncached * args.input_price + result["cached_prompt_tokens"] * args.cached_input_price) / 1e6, 6
+        )
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    print(json.dumps({"app_dir": os.path.abspath(args.app_dir), "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
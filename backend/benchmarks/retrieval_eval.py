@@ -0,0 +1,248 @@
+# backend/benchmarks/retrieval_eval.py
+"""
+Retrieval quality and cost evaluation on the bundled QA sets.
+
+For every chunk size / overlap combination, indexes a knowledge base
+directory with chunk_text, then runs each question of the QA files through
+the retrieval half of rag.chat: query embedding, nearest-chunk search (the
+in-process replica, which returns the same ranking as Chroma), optional
+hybrid BM25 fusion and MMR selection, and build_prompt. For every TOP_K it
+reports recall@k, MRR, retrieval latency and the context tokens the prompt
+would carry, and recommends the cheapest configuration that keeps recall.
+
+A chunk counts as relevant to a question when it contains at least
+--relevance-threshold of the expected answer's terms. Questions whose answer
+is in no chunk of the corpus are reported and left out of the scores.
+
+Embeddings come from the hashing stub by default, so the command runs
+offline. With --embeddings openai the real model is used through the
+embedding cache; point EMBEDDING_CACHE_PATH at a file and later sweeps reuse
+the vectors without calling the API.
+
+    python -m benchmarks.retrieval_eval --kb-dir ../kb_files/clean \\
+        --chunk-sizes 500 1000 2000 --overlaps 0 200 --top-k 3 5 8
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import uuid
+
+from benchmarks.chat_concurrency import BACKEND_DIR, percentile
+from benchmarks.stub_servers import fake_embedding
+
+KB_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "kb_files")
+QA_FILES = ["qa.txt", "qa_v2.txt", "qa_v3.txt", os.path.join("raw", "qa.txt")]
+QA_PATTERN = re.compile(r"Question:\s*(.+?)\s*\n\s*Answer:\s*(.+)")
+
+
+def load_questions(paths):
+    """
+    (question, answer) pairs of the QA files, duplicates removed
+    """
+    pairs = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for question, answer in QA_PATTERN.findall(f.read()):
+                pairs.setdefault(question.strip(), answer.strip())
+    return list(pairs.items())
+
+
+def load_documents(kb_dir):
+    documents = {}
+    for path in sorted(glob.glob(os.path.join(kb_dir, "*"))):
+        if path.endswith((".txt", ".md")):
+            with open(path, "r", encoding="utf-8") as f:
+                documents[os.path.basename(path)] = f.read()
+    return documents
+
+
+def embed(texts, backend):
+    if backend == "stub":
+        return [fake_embedding(text) for text in texts]
+    from app.chunk_and_index import get_embeddings
+    vectors = []
+    for start in range(0, len(texts), 256):
+        vectors.extend(get_embeddings(texts[start:start + 256]))
+    return vectors
+
+
+def build_indexes(documents, chunk_size, overlap, backend):
+    from app.chunk_and_index import chunk_text
+    from app.lexical_index import LexicalIndex
+    from app.vector_index import VectorIndex
+
+    ids, chunks, metadatas = [], [], []
+    for source, text in documents.items():
+        pieces = chunk_text(text, chunk_size=chunk_size, chunk_overlap=overlap)
+        for i, piece in enumerate(pieces):
+            ids.append(str(uuid.uuid4()))
+            chunks.append(piece)
+            metadatas.append({"source": source, "chunk_index": i, "total_chunks": len(pieces)})
+
+    started = time.perf_counter()
+    embeddings = embed(chunks, backend)
+    embed_seconds = time.perf_counter() - started
+
+    vectors, lexical = VectorIndex(path=""), LexicalIndex()
+    vectors.loaded = lexical.loaded = True
+    vectors.add(ids, chunks, embeddings, metadatas)
+    lexical.add(ids, chunks, metadatas)
+    return ids, chunks, vectors, lexical, embed_seconds
+
+
+def relevant_ids(answer, ids, chunks, threshold):
+    from app.lexical_index import tokenize
+
+    terms = set(tokenize(answer))
+    if not terms:
+        return set()
+    return {
+        record_id for record_id, chunk in zip(ids, chunks)
+        if len(terms & set(tokenize(chunk))) / len(terms) >= threshold
+    }
+
+
+def retrieve(question, query_embedding, vectors, lexical, top_k, args):
+    """
+    Mirror of rag.query_collection and the selection in rag.retrieve_context
+    """
+    from app.context_selection import cut_results, select_context
+    from app.lexical_index import fuse_results
+
+    def cut(results):
+        return cut_results(results, None, args.min_similarity, args.max_gap, args.min_chunks)
+
+    n_results = max(top_k, args.mmr_candidates) if args.mmr else top_k
+    if args.hybrid:
+        results = cut(vectors.query(query_embedding, max(n_results, args.hybrid_candidates), args.mmr))
+        lexical_hits = lexical.query(question, args.hybrid_candidates) if results["documents"][0] else []
+        results = fuse_results(results, lexical_hits, n_results)
+    else:
+        results = cut(vectors.query(query_embedding, n_results, args.mmr))
+    ids = results["ids"][0]
+    documents = results["documents"][0]
+    if args.mmr:
+        embeddings = results.get("embeddings")
+        selection = select_context(
+            query_embedding, list(documents), list(results["metadatas"][0]),
+            embeddings[0] if embeddings is not None else None, top_k
+        )
+        ids = [ids[i] for i in selection.indexes]
+        documents = selection.documents
+    return ids, documents
+
+
+def evaluate(questions, ids, chunks, vectors, lexical, query_embeddings, top_k, args):
+    from app.prompt_builder import build_prompt
+    from app.rag import SYSTEM_PROMPT
+
+    hits, reciprocal_ranks, latencies, context_tokens, answerable = 0, [], [], [], 0
+    chunks_sent = []
+    for (question, answer), query_embedding in zip(questions, query_embeddings):
+        relevant = relevant_ids(answer, ids, chunks, args.relevance_threshold)
+        started = time.perf_counter()
+        retrieved, documents = retrieve(question, query_embedding, vectors, lexical, top_k, args)
+        latencies.append(time.perf_counter() - started)
+        chunks_sent.append(len(documents))
+        context_tokens.append(build_prompt(SYSTEM_PROMPT, [], question, list(documents)).usage["context"])
+        if not relevant:
+            continue
+        answerable += 1
+        rank = next((position for position, record_id in enumerate(retrieved, start=1) if record_id in relevant), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        "top_k": top_k,
+        "answerable_questions": answerable,
+        "recall_at_k": round(hits / answerable, 4) if answerable else None,
+        "mrr": round(statistics.mean(reciprocal_ranks), 4) if reciprocal_ranks else None,
+        "retrieval_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "retrieval_p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "context_tokens_mean": round(statistics.mean(context_tokens), 1),
+        "chunks_mean": round(statistics.mean(chunks_sent), 2),
+        "no_context_questions": chunks_sent.count(0),
+    }
+
+
+def recommend(runs, tolerance):
+    """
+    Cheapest run (fewest context tokens) whose recall is within tolerance of the best
+    """
+    scored = [run for run in runs if run["recall_at_k"] is not None]
+    if not scored:
+        return None
+    best_recall = max(run["recall_at_k"] for run in scored)
+    eligible = [run for run in scored if run["recall_at_k"] >= best_recall - tolerance]
+    return min(eligible, key=lambda run: (run["context_tokens_mean"], -run["recall_at_k"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking and TOP_K and measure retrieval quality on the QA sets")
+    parser.add_argument("--kb-dir", default=os.path.join(KB_DIR, "clean"), help="Directory of .txt/.md files to index")
+    parser.add_argument("--qa", nargs="+", default=[os.path.join(KB_DIR, name) for name in QA_FILES])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 200])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 5, 8])
+    parser.add_argument("--embeddings", choices=["stub", "openai"], default="stub")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 results as with HYBRID_RETRIEVAL")
+    parser.add_argument("--hybrid-candidates", type=int, default=20)
+    parser.add_argument("--mmr", action="store_true", help="Select chunks as with MMR_ENABLED")
+    parser.add_argument("--mmr-candidates", type=int, default=20)
+    parser.add_argument("--min-similarity", type=float, default=0.0, help="As RETRIEVAL_MIN_SIMILARITY")
+    parser.add_argument("--max-gap", type=float, default=0.0, help="As RETRIEVAL_MAX_GAP")
+    parser.add_argument("--min-chunks", type=int, default=1, help="As RETRIEVAL_MIN_CHUNKS")
+    parser.add_argument("--relevance-threshold", type=float, default=0.6,
+                        help="Share of the answer's terms a chunk must contain to be relevant")
+    parser.add_argument("--recall-tolerance", type=float, default=0.02,
+                        help="Recall below the best that is still acceptable for the recommendation")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.embeddings == "stub":
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["ENABLE_DATABASE_STORAGE"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+
+    questions = load_questions(args.qa)
+    documents = load_documents(args.kb_dir)
+    query_embeddings = embed([question for question, _ in questions], args.embeddings)
+
+    runs = []
+    for chunk_size in args.chunk_sizes:
+        for overlap in args.overlaps:
+            if overlap >= chunk_size:
+                continue
+            ids, chunks, vectors, lexical, embed_seconds = build_indexes(documents, chunk_size, overlap, args.embeddings)
+            for top_k in args.top_k:
+                run = {"chunk_size": chunk_size, "overlap": overlap, "chunks": len(chunks),
+                       "embed_s": round(embed_seconds, 3)}
+                run.update(evaluate(questions, ids, chunks, vectors, lexical, query_embeddings, top_k, args))
+                runs.append(run)
+                print(json.dumps(run), file=sys.stderr)
+
+    result = {
+        "kb_dir": os.path.abspath(args.kb_dir),
+        "questions": len(questions),
+        "embeddings": args.embeddings,
+        "hybrid": args.hybrid,
+        "mmr": args.mmr,
+        "min_similarity": args.min_similarity,
+        "max_gap": args.max_gap,
+        "relevance_threshold": args.relevance_threshold,
+        "runs": runs,
+        "recommended": recommend(runs, args.recall_tolerance),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+# backend/benchmarks/stub_servers.py
+"""
+Local stand-ins for the OpenAI and Chroma HTTP APIs used by the benchmarks.
+
+Both servers keep everything in memory and answer with a configurable
+artificial latency, so the backend can be exercised without network access
+or OpenAI credits. The OpenAI stand-in also accepts WhatsApp Cloud API sends
+(POST /{version}/{phone_id}/messages), for WHATSAPP_API_URL.
+
+Latency is a fixed part plus, when a token rate is given, the time to
+process the request's tokens at that rate: prompt tokens for embeddings,
+completion tokens for chat (streamed chunks are paced at the same rate) and,
+with a prefill rate, the chat prompt tokens not found in the prompt cache.
+
+Chat completions emulate the provider's automatic prompt caching: a prompt
+whose first 1024+ tokens repeat an earlier prompt reports the repeated part,
+in 128-token steps, as usage.prompt_tokens_details.cached_tokens.
+
+Usage:
+    python -m benchmarks.stub_servers --openai-port 18001 --chroma-port 18002
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBED_DIMENSIONS = 256
+# Shortest cached prompt prefix and the granularity of cache hits
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+STUB_ANSWER = "According to the knowledge base, you need a valid passport and proof of residence."
+
+
+def fake_embedding(text: str, dimensions: int = EMBED_DIMENSIONS) -> List[float]:
+    """
+    Deterministic bag-of-words embedding (hashing trick), unit normalised.
+    Texts sharing words end up close together, which is enough for retrieval tests.
+    """
+    vector = [0.0] * dimensions
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] % 2 == 0 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def count_words(text: str) -> int:
+    """Rough token count used for the usage payload"""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def cached_prefix_tokens(text: str, seen: set) -> int:
+    """
+    Tokens of the longest block-aligned prefix of text already in seen, which
+    then also records every block prefix of text
+    """
+    tokens = re.findall(r"\w+|[^\w\s]", text)
+    digest = hashlib.sha1()
+    cached = 0
+    for end in range(PROMPT_CACHE_BLOCK_TOKENS, len(tokens) + 1, PROMPT_CACHE_BLOCK_TOKENS):
+        digest.update("\x00".join(tokens[end - PROMPT_CACHE_BLOCK_TOKENS:end]).encode("utf-8"))
+        key = digest.hexdigest()
+        if end >= PROMPT_CACHE_MIN_TOKENS and key in seen:
+            cached = end
+        seen.add(key)
+    return cached
+
+
+# ──────── OpenAI stand-in ────────
+
+def create_openai_app(
+    chat_latency: float = 0.2,
+    embed_latency: float = 0.05,
+    chat_tokens_per_second: float = 0,
+    embed_tokens_per_second: float = 0,
+    whatsapp_latency: float = 0.1,
+    prefill_tokens_per_second: float = 0
+) -> FastAPI:
+    """
+    Build an app implementing /v1/embeddings and /v1/chat/completions
+
+    Args:
+        chat_latency: Seconds to wait before answering a chat completion
+        embed_latency: Seconds to wait before answering an embeddings request
+        chat_tokens_per_second: Completion tokens generated per second (0 for no extra delay)
+        embed_tokens_per_second: Input tokens embedded per second (0 for no extra delay)
+        whatsapp_latency: Seconds to wait before accepting a WhatsApp message
+        prefill_tokens_per_second: Uncached chat prompt tokens processed per second (0 for no extra delay)
+    """
+    app = FastAPI()
+    app.state.stats = {
+        "embeddings_requests": 0, "embeddings_inputs": 0, "chat_requests": 0,
+        "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "whatsapp_messages": 0
+    }
+    app.state.prompt_prefixes = set()
+
+    def token_time(tokens: int, tokens_per_second: float) -> float:
+        return tokens / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    @app.get("/stub/stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        app.state.stats["embeddings_requests"] += 1
+        app.state.stats["embeddings_inputs"] += len(inputs)
+        tokens = sum(count_words(text) for text in inputs)
+        app.state.stats["prompt_tokens"] += tokens
+        await asyncio.sleep(embed_latency + token_time(tokens, embed_tokens_per_second))
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.stats["chat_requests"] += 1
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        prompt_tokens = count_words(prompt)
+        cached_tokens = cached_prefix_tokens(prompt, app.state.prompt_prefixes)
+        await asyncio.sleep(chat_latency + token_time(prompt_tokens - cached_tokens, prefill_tokens_per_second))
+        if "confidence" in prompt.lower() and "GENERATED ANSWER" in prompt:
+            content = "The context directly addresses the question.\n85"
+        elif (body.get("response_format") or {}).get("type") == "json_schema":
+            content = json.dumps({
+                "answer": STUB_ANSWER,
+                "confidence": 85,
+                "confidence_reason": "The context directly addresses the question.",
+            })
+        else:
+            content = STUB_ANSWER
+        completion_tokens = count_words(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        app.state.stats["prompt_tokens"] += prompt_tokens
+        app.state.stats["cached_tokens"] += cached_tokens
+        app.state.stats["completion_tokens"] += completion_tokens
+        if body.get("stream"):
+            return StreamingResponse(stream_completion(body, content, usage), media_type="text/event-stream")
+        await asyncio.sleep(token_time(completion_tokens, chat_tokens_per_second))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub-chat"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    async def stream_completion(body: Dict[str, Any], content: str, usage: Dict[str, Any]):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for piece in re.findall(r"\S+\s*", content):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub-chat"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(token_time(count_words(piece), chat_tokens_per_second) or 0.01)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub-chat"),
+                "choices": [],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/{version}/{phone_id}/messages")
+    async def whatsapp_messages(version: str, phone_id: str, request: Request):
+        body = await request.json()
+        app.state.stats["whatsapp_messages"] += 1
+        await asyncio.sleep(whatsapp_latency)
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+        }
+
+    return app
+
+
+# ──────── Chroma stand-in ────────
+
+def _matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """Support the equality filters the backend uses ({"source": name} / {"$eq": ...})"""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if isinstance(condition, dict):
+            condition = condition.get("$eq")
+        if metadata.get(key) != condition:
+            return False
+    return True
+
+
+def create_chroma_app(query_latency: float = 0.01) -> FastAPI:
+    """
+    Build an app implementing the subset of the Chroma v2 REST API used by chromadb.HttpClient
+
+    Args:
+        query_latency: Seconds to wait before answering each collection request
+    """
+    app = FastAPI()
+    collections: Dict[str, Dict[str, Any]] = {}
+    prefix = "/api/v2/tenants/{tenant}/databases/{database}"
+    app.state.stats = {"requests": 0}
+    app.state.collections = collections
+
+    @app.middleware("http")
+    async def count_requests(request: Request, call_next):
+        if not request.url.path.startswith("/stub/"):
+            app.state.stats["requests"] += 1
+        return await call_next(request)
+
+    @app.exception_handler(HTTPException)
+    async def chroma_error(request: Request, exc: HTTPException):
+        # Same body as the Chroma server, so the client raises its typed errors
+        error = {404: "NotFoundError", 409: "UniqueConstraintError"}.get(exc.status_code, "ChromaError")
+        return JSONResponse(status_code=exc.status_code, content={"error": error, "message": exc.detail})
+
+    @app.get("/stub/stats")
+    async def stats():
+        return app.state.stats
+
+    def collection_model(collection: Dict[str, Any], tenant: str, database: str) -> Dict[str, Any]:
+        return {
+            "id": collection["id"],
+            "name": collection["name"],
+            "metadata": collection["metadata"],
+            "configuration_json": {},
+            "dimension": None,
+            "tenant": tenant,
+            "database": database,
+            "version": 0,
+            "log_position": 0,
+        }
+
+    def by_id(collection_id: str) -> Dict[str, Any]:
+        for collection in collections.values():
+            if collection["id"] == collection_id:
+                return collection
+        raise HTTPException(status_code=404, detail=f"Collection {collection_id} does not exist")
+
+    @app.get("/api/v2/heartbeat")
+    async def heartbeat():
+        return {"nanosecond heartbeat": time.time_ns()}
+
+    @app.get("/api/v2/version")
+    async def version():
+        return "1.0.0"
+
+    @app.get("/api/v2/pre-flight-checks")
+    async def pre_flight_checks():
+        return {"max_batch_size": 5000, "supports_base64_encoding": False}
+
+    @app.get("/api/v2/auth/identity")
+    async def identity():
+        return {"user_id": "", "tenant": "default_tenant", "databases": ["default_database"]}
+
+    @app.get("/api/v2/tenants/{tenant}")
+    async def get_tenant(tenant: str):
+        return {"name": tenant}
+
+    @app.get(prefix)
+    async def get_database(tenant: str, database: str):
+        return {"id": str(uuid.uuid5(uuid.NAMESPACE_DNS, database)), "name": database, "tenant": tenant}
+
+    @app.post(prefix + "/collections")
+    async def create_collection(tenant: str, database: str, request: Request):
+        body = await request.json()
+        name = body["name"]
+        if name in collections:
+            if not body.get("get_or_create"):
+                raise HTTPException(status_code=409, detail=f"Collection {name} already exists")
+        else:
+            collections[name] = {
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "metadata": body.get("metadata"),
+                "ids": [], "documents": [], "metadatas": [], "embeddings": [],
+            }
+        return collection_model(collections[name], tenant, database)
+
+    @app.get(prefix + "/collections/{name}")
+    async def get_collection(tenant: str, database: str, name: str):
+        if name not in collections:
+            raise HTTPException(status_code=404, detail=f"Collection {name} does not exist")
+        return collection_model(collections[name], tenant, database)
+
+    @app.delete(prefix + "/collections/{name}")
+    async def delete_collection(tenant: str, database: str, name: str):
+        if collections.pop(name, None) is None:
+            raise HTTPException(status_code=404, detail=f"Collection {name} does not exist")
+        return {}
+
+    @app.get(prefix + "/collections/{collection_id}/count")
+    async def count(tenant: str, database: str, collection_id: str):
+        return len(by_id(collection_id)["ids"])
+
+    @app.post(prefix + "/collections/{collection_id}/add")
+    async def add(tenant: str, database: str, collection_id: str, request: Request):
+        body = await request.json()
+        collection = by_id(collection_id)
+        size = len(body["ids"])
+        collection["ids"].extend(body["ids"])
+        collection["documents"].extend(body.get("documents") or [None] * size)
+        collection["metadatas"].extend(body.get("metadatas") or [None] * size)
+        collection["embeddings"].extend(body.get("embeddings") or [None] * size)
+        return True
+
+    @app.post(prefix + "/collections/{collection_id}/get")
+    async def get(tenant: str, database: str, collection_id: str, request: Request):
+        body = await request.json()
+        collection = by_id(collection_id)
+        wanted = set(body.get("ids") or [])
+        rows = [
+            i for i, record_id in enumerate(collection["ids"])
+            if (not wanted or record_id in wanted)
+            and _matches_where(collection["metadatas"][i], body.get("where"))
+        ]
+        offset = body.get("offset") or 0
+        limit = body.get("limit")
+        rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+        include = body.get("include") or ["documents", "metadatas"]
+        result: Dict[str, Any] = {"ids": [collection["ids"][i] for i in rows], "include": include}
+        for field in ("documents", "metadatas", "embeddings"):
+            result[field] = [collection[field][i] for i in rows] if field in include else None
+        return result
+
+    @app.post(prefix + "/collections/{collection_id}/delete")
+    async def delete(tenant: str, database: str, collection_id: str, request: Request):
+        body = await request.json()
+        collection = by_id(collection_id)
+        wanted = set(body.get("ids") or [])
+        keep = [
+            i for i, record_id in enumerate(collection["ids"])
+            if not ((not wanted or record_id in wanted)
+                    and _matches_where(collection["metadatas"][i], body.get("where")))
+        ]
+        for field in ("ids", "documents", "metadatas", "embeddings"):
+            collection[field] = [collection[field][i] for i in keep]
+        return None
+
+    @app.post(prefix + "/collections/{collection_id}/query")
+    async def query(tenant: str, database: str, collection_id: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(query_latency)
+        collection = by_id(collection_id)
+        include = body.get("include") or ["documents", "metadatas", "distances"]
+        n_results = body.get("n_results", 10)
+        rows = [
+            i for i in range(len(collection["ids"]))
+            if _matches_where(collection["metadatas"][i], body.get("where"))
+        ]
+        result: Dict[str, Any] = {
+            "ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": [],
+            "include": include,
+        }
+        for query_embedding in body["query_embeddings"]:
+            scored = []
+            for i in rows:
+                embedding = collection["embeddings"][i]
+                scored.append((sum((a - b) ** 2 for a, b in zip(query_embedding, embedding)), i))
+            scored.sort()
+            top = scored[:n_results]
+            result["ids"].append([collection["ids"][i] for _, i in top])
+            result["distances"].append([d for d, _ in top])
+            for field in ("documents", "metadatas", "embeddings"):
+                result[field].append([collection[field][i] for _, i in top])
+        for field in ("documents", "metadatas", "distances", "embeddings"):
+            if field not in include:
+                result[field] = None
+        return result
+
+    return app
+
+
+# ──────── Runners ────────
+
+class StubServer:
+    """Run an ASGI app with uvicorn on a background thread"""
+
+    def __init__(self, app: FastAPI, port: int, host: str = "127.0.0.1"):
+        self.app = app
+        self.url = f"http://{host}:{port}"
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError(f"Stub server on {self.url} did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run stub OpenAI and Chroma servers")
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chroma-latency-ms", type=float, default=10)
+    parser.add_argument("--chat-tokens-per-second", type=float, default=0, help="Completion generation rate, 0 for none")
+    parser.add_argument("--embed-tokens-per-second", type=float, default=0, help="Embedding input rate, 0 for none")
+    parser.add_argument("--whatsapp-latency-ms", type=float, default=100)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0,
+                        help="Uncached prompt processing rate, 0 for none")
+    args = parser.parse_args()
+
+    openai_server = StubServer(
+        create_openai_app(
+            args.chat_latency_ms / 1000,
+            args.embed_latency_ms / 1000,
+            args.chat_tokens_per_second,
+            args.embed_tokens_per_second,
+            args.whatsapp_latency_ms / 1000,
+            args.prefill_tokens_per_second
+        ),
+        args.openai_port
+    ).start()
+    chroma_server = StubServer(create_chroma_app(args.chroma_latency_ms / 1000), args.chroma_port).start()
+    print(f"OpenAI stub: {openai_server.url}/v1")
+    print(f"Chroma stub: {chroma_server.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        openai_server.stop()
+        chroma_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# backend/benchmarks/vector_index.py
+"""
+Benchmark of the local vector index replica against querying Chroma over HTTP.
+
+1. Seeds the stub Chroma server, loads the replica from it and checks that
+   both return the same chunks at the same distances.
+2. Times single-query retrieval through Chroma (cached collection handle) and
+   through replicas of growing size filled with random unit vectors.
+
+The stub Chroma server does no real search work, so its numbers are a lower
+bound for the HTTP round trip; pass --chroma-url to measure a real server.
+
+    python -m benchmarks.vector_index --sizes 1000 10000 50000 --dimensions 1536
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks.chat_concurrency import BACKEND_DIR, QUESTIONS, percentile, seed_collection, start_stub_servers
+from benchmarks.stub_servers import fake_embedding
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "queries_per_s": round(len(latencies) / sum(latencies), 1),
+    }
+
+
+def time_queries(run_one, iterations):
+    run_one(0)  # warm up
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        run_one(i)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def check_consistency(loop):
+    """
+    Replica and Chroma must return the same chunks at the same distances (up to
+    float32 rounding, which can reorder exact ties) for every sample question
+    """
+    from app import chunk_and_index, rag
+    from app.vector_index import VectorIndex
+
+    replica = VectorIndex(path="")
+    chunk_and_index.with_collection(replica.load)
+    mismatches = 0
+    for question in QUESTIONS:
+        embedding = fake_embedding(question)
+        remote = loop.run_until_complete(rag.query_collection(embedding))
+        local = replica.query(embedding, rag.TOP_K)
+        same_ids = set(remote["ids"][0]) == set(local["ids"][0])
+        same_distances = np.allclose(remote["distances"][0], local["distances"][0], atol=1e-4)
+        if not (same_ids and same_distances):
+            mismatches += 1
+    return {"questions": len(QUESTIONS), "mismatches": mismatches, "records": len(replica)}
+
+
+def chroma_latency(loop, iterations):
+    from app import rag
+
+    embeddings = [fake_embedding(question) for question in QUESTIONS]
+    return summarize(time_queries(
+        lambda i: loop.run_until_complete(rag.query_collection(embeddings[i % len(embeddings)])), iterations
+    ))
+
+
+def replica_latency(size, dimensions, top_k, iterations):
+    from app.vector_index import VectorIndex
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    replica = VectorIndex(path="")
+    replica.loaded = True
+    replica.add(
+        [f"id-{i}" for i in range(size)],
+        [f"chunk {i}" for i in range(size)],
+        vectors,
+        [{"source": f"doc{i % 100}.txt", "chunk_index": i} for i in range(size)],
+    )
+    queries = rng.standard_normal((64, dimensions)).astype(np.float32)
+    result = summarize(time_queries(lambda i: replica.query(queries[i % len(queries)], top_k), iterations))
+    result["matrix_mb"] = round(vectors.nbytes / 1e6, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the local vector index replica with Chroma queries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--chroma-url", default=None, help="Real Chroma server to compare against instead of the stub")
+    parser.add_argument("--openai-port", type=int, default=18001)
+    parser.add_argument("--chroma-port", type=int, default=18002)
+    args = parser.parse_args()
+
+    stubs = None
+    chroma_url = args.chroma_url
+    if chroma_url is None:
+        stubs = start_stub_servers(SimpleNamespace(
+            openai_port=args.openai_port, chroma_port=args.chroma_port,
+            chat_latency_ms=0, embed_latency_ms=0, chroma_latency_ms=0,
+        ))
+        chroma_url = f"http://127.0.0.1:{args.chroma_port}"
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "CHROMA_SERVER_URL": chroma_url,
+        "ENABLE_DATABASE_STORAGE": "false",
+        "LOCAL_VECTOR_INDEX": "false",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+
+    from app import rag
+
+    result = {"top_k": rag.TOP_K, "dimensions": args.dimensions, "chroma_url": chroma_url}
+    loop = asyncio.new_event_loop()
+    try:
+        if stubs is not None:
+            seed_collection(chroma_url, os.getenv("COLLECTION_NAME", "kb_default"))
+            result["consistency"] = check_consistency(loop)
+        result["chroma_http"] = chroma_latency(loop, args.iterations)
+        result["replica"] = {
+            str(size): replica_latency(size, args.dimensions, rag.TOP_K, args.iterations) for size in args.sizes
+        }
+    finally:
+        loop.close()
+        if stubs is not None:
+            stubs.terminate()
+            stubs.wait()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
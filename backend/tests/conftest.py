@@ -0,0 +1,48 @@
+# backend/tests/conftest.py
+import os
+import tempfile
+
+# The app reads its configuration at import, so the test environment is set
+# before any test module imports it: a throwaway SQLite database and no
+# network services
+_data_dir = tempfile.mkdtemp(prefix="rag_chatbot_tests_")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_data_dir, 'test.db')}")
+os.environ.setdefault("ENABLE_DATABASE_STORAGE", "true")
+os.environ.setdefault("WRITE_BEHIND_SPILL_PATH", os.path.join(_data_dir, "write_behind.jsonl"))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import asyncio
+
+import pytest
+
+
+def run(coroutine):
+    """
+    Run a coroutine on a fresh event loop and release the pooled connections it opened
+    """
+    from app.database import close_db
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_db()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def database():
+    """
+    Empty conversations and messages tables
+    """
+    from sqlalchemy import delete
+    from app.database import engine, init_db
+    from app.models import Conversation, Message
+
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(delete(Message))
+        connection.execute(delete(Conversation))
+    return engine
@@ -0,0 +1,70 @@
+# backend/tests/test_answer_cache.py
+import pytest
+
+from app.answer_cache import AnswerCache, CachedAnswer
+
+from conftest import run
+
+
+def entry(query):
+    return CachedAnswer(query=query, answer=f"Answer to {query}", sources=["kb.txt"], context="")
+
+
+def test_similar_query_hits_and_other_query_misses():
+    cache = AnswerCache(max_entries=10, threshold=0.95, ttl=0)
+    cache.store("kb", 0, [1.0, 0.0], entry("a"))
+
+    assert cache.lookup("kb", [0.99, 0.05]).query == "a"
+    assert cache.lookup("kb", [0.0, 1.0]) is None
+
+
+def test_answer_from_an_older_knowledge_base_is_not_stored():
+    cache = AnswerCache(max_entries=10, threshold=0.95, ttl=0)
+    version = cache.kb_version("kb")
+    cache.invalidate("kb")
+
+    assert not cache.store("kb", version, [1.0, 0.0], entry("a"))
+    assert cache.lookup("kb", [1.0, 0.0]) is None
+
+
+def test_discard_removes_only_that_entry():
+    cache = AnswerCache(max_entries=10, threshold=0.95, ttl=0)
+    first, second = entry("a"), entry("b")
+    cache.store("kb", 0, [1.0, 0.0], first)
+    cache.store("kb", 0, [0.0, 1.0], second)
+
+    assert cache.discard("kb", first)
+    assert not cache.discard("kb", first)
+    assert cache.lookup("kb", [1.0, 0.0]) is None
+    assert cache.lookup("kb", [0.0, 1.0]) is second
+
+
+@pytest.mark.parametrize("score, served", [(40.0, False), (95.0, True)])
+def test_background_score_decides_whether_the_cached_answer_is_served(database, monkeypatch, score, served):
+    from app import rag
+    from app.database import AsyncSessionLocal
+
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(max_entries=10, threshold=0.95, ttl=0))
+    jobs = []
+    monkeypatch.setattr(rag.confidence_worker, "submit", jobs.append)
+    embedding = [1.0, 0.0, 0.0]
+
+    async def answer_first_turn():
+        async with AsyncSessionLocal() as db:
+            conversation, _, _ = await rag.load_conversation(f"scored-{score}", db)
+            turn = rag.ChatTurn(
+                query="How do I reset my password?", session_id=f"scored-{score}", conversation=conversation,
+                context="", sources=["kb.txt"], messages=[], distances=[], query_embedding=embedding,
+                first_turn=True, kb_version=rag.answer_cache.kb_version(rag.COLLECTION_NAME)
+            )
+            await rag.finish_chat(turn, "Use the reset link.", db, evaluate_inline=False)
+
+    run(answer_first_turn())
+    # Cached unscored, then scored by the confidence worker
+    assert rag.answer_cache.lookup(rag.COLLECTION_NAME, embedding) is not None
+    jobs[0].on_result(score, "judge")
+
+    cached = rag.answer_cache.lookup(rag.COLLECTION_NAME, embedding)
+    assert (cached is not None) == served
+    if served:
+        assert cached.confidence_score == score
@@ -0,0 +1,38 @@
+# backend/tests/test_chroma_clients.py
+import asyncio
+
+from app import chunk_and_index
+
+
+class FakeServer:
+    """
+    The part of Chroma's async server API that releases its HTTP connections
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self):
+        self._server = FakeServer()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_close_chroma_closes_the_sync_and_the_async_client(monkeypatch):
+    sync_client, async_client = FakeClient(), FakeClient()
+    monkeypatch.setattr(chunk_and_index, "_chroma_client", sync_client)
+    monkeypatch.setattr(chunk_and_index, "_async_chroma_client", async_client)
+
+    asyncio.run(chunk_and_index.close_chroma())
+
+    assert sync_client.closed
+    assert async_client._server.closed
+    assert chunk_and_index._chroma_client is None
+    assert chunk_and_index._async_chroma_client is None
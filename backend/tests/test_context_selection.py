@@ -0,0 +1,39 @@
+# backend/tests/test_context_selection.py
+from app.context_selection import select_context
+from app.prompt_builder import count_tokens
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_near_duplicate():
+    documents = ["Refunds take 5 days.", "Refunds take five days.", "Shipping is free over 50 euros."]
+    metadatas = [{"source": "faq.txt"}, {"source": "policy.txt"}, {"source": "shipping.txt"}]
+    embeddings = [[1.0, 0.0], [0.99, 0.14], [0.6, 0.8]]
+
+    selection = select_context([1.0, 0.0], documents, metadatas, embeddings, k=2, lambda_=0.3, dedup_threshold=1.1)
+
+    assert selection.indexes == [0, 2]
+
+
+def test_duplicates_are_dropped_and_counted():
+    documents = ["Refunds take 5 days.", "Refunds take 5 days.", "Shipping is free."]
+    metadatas = [{"source": "a"}, {"source": "b"}, {"source": "c"}]
+    embeddings = [[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]]
+
+    selection = select_context([1.0, 0.0], documents, metadatas, embeddings, k=3)
+
+    assert selection.indexes == [0, 2]
+    assert selection.stats["duplicates_removed"] == 1
+    assert selection.stats["redundant_tokens_removed"] == count_tokens(documents[1])
+
+
+def test_overlap_with_the_previous_chunk_is_trimmed_and_its_tokens_counted():
+    overlap = "Customers can return unused items within thirty days of delivery."
+    documents = [f"Our return policy is simple. {overlap}", f"{overlap} Refunds are issued to the original card."]
+    metadatas = [{"source": "returns.md", "chunk_index": 0}, {"source": "returns.md", "chunk_index": 1}]
+    embeddings = [[1.0, 0.0], [0.0, 1.0]]
+
+    selection = select_context([1.0, 1.0], documents, metadatas, embeddings, k=2)
+
+    assert selection.documents[1] == " Refunds are issued to the original card."
+    assert selection.stats["overlap_chars_trimmed"] == len(overlap)
+    # The tokens of the removed text itself
+    assert selection.stats["redundant_tokens_removed"] == count_tokens(overlap)
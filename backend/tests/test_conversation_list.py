@@ -0,0 +1,94 @@
+# backend/tests/test_conversation_list.py
+import datetime
+
+import httpx
+
+from app.models import Conversation, Message
+
+from conftest import run
+
+NOW = datetime.datetime(2024, 1, 1, 12)
+
+
+def seed(engine, count):
+    """
+    `count` conversations whose updated_at repeats every three rows, with id % 4 messages each
+    """
+    with engine.begin() as connection:
+        connection.execute(Conversation.__table__.insert(), [
+            {
+                "id": i, "session_id": f"s{i}", "created_at": NOW,
+                "updated_at": NOW - datetime.timedelta(seconds=i // 3),
+                "status": "waiting_for_manual" if i % 5 == 0 else "waiting_for_user"
+            }
+            for i in range(1, count + 1)
+        ])
+        connection.execute(Message.__table__.insert(), [
+            {"conversation_id": i, "role": "user", "content": "x", "timestamp": NOW}
+            for i in range(1, count + 1) for _ in range(i % 4)
+        ])
+
+
+def list_pages(**params):
+    from app.api import app
+
+    async def scenario():
+        pages = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            cursor = None
+            while True:
+                query = dict(params, cursor=cursor) if cursor else params
+                response = await client.get("/api/conversations", params=query)
+                assert response.status_code == 200
+                body = response.json()
+                pages.append(body["conversations"])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    return pages
+
+    return run(scenario())
+
+
+def ids(pages):
+    return [int(conversation["session_id"][1:]) for page in pages for conversation in page]
+
+
+def test_pages_cover_every_conversation_once_across_equal_updated_at(database):
+    seed(database, 47)
+
+    pages = list_pages(limit=5)
+
+    assert [len(page) for page in pages] == [5] * 9 + [2]
+    # Newest first; equal timestamps are ordered by id, descending
+    expected = sorted(range(1, 48), key=lambda i: (NOW - datetime.timedelta(seconds=i // 3), i), reverse=True)
+    assert ids(pages) == expected
+
+
+def test_message_counts_and_status_filter(database):
+    seed(database, 30)
+
+    pages = list_pages(limit=4, status="waiting_for_manual")
+    conversations = [conversation for page in pages for conversation in page]
+
+    assert sorted(ids(pages)) == [5, 10, 15, 20, 25, 30]
+    assert all(conversation["status"] == "waiting_for_manual" for conversation in conversations)
+    assert all(conversation["message_count"] == int(conversation["session_id"][1:]) % 4 for conversation in conversations)
+
+
+def test_last_page_has_no_cursor(database):
+    seed(database, 3)
+
+    assert [len(page) for page in list_pages(limit=3)] == [3]
+
+
+def test_invalid_parameters_are_rejected(database):
+    from app.api import app
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [
+                (await client.get("/api/conversations", params=params)).status_code
+                for params in ({"cursor": "not-a-cursor"}, {"limit": 0}, {"status": "unknown"})
+            ]
+
+    assert run(scenario()) == [400, 422, 422]
@@ -0,0 +1,75 @@
+# backend/tests/test_embedding_batcher.py
+import asyncio
+
+import pytest
+
+from app.embedding_batcher import EmbeddingBatcher
+
+
+def test_concurrent_callers_share_one_request():
+    requests = []
+
+    async def embed(texts):
+        requests.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed, window_ms=20, max_size=10)
+        results = await asyncio.gather(batcher.embed(["a"]), batcher.embed(["bb", "a"]), batcher.embed(["ccc"]))
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+
+    assert results == [[[1.0]], [[2.0], [1.0]], [[3.0]]]
+    # Duplicate texts are sent once
+    assert requests == [["a", "bb", "ccc"]]
+    assert batcher.stats()["requests"] == 1
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    requests = []
+
+    async def embed(texts):
+        requests.append(list(texts))
+        return [[0.0] for _ in texts]
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed, window_ms=10_000, max_size=2)
+        return await asyncio.wait_for(batcher.embed(["a", "b"]), timeout=1)
+
+    assert asyncio.run(scenario()) == [[0.0], [0.0]]
+    assert requests == [["a", "b"]]
+
+
+def test_request_error_reaches_every_caller_in_the_batch():
+    async def embed(texts):
+        raise RuntimeError("embeddings unavailable")
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed, window_ms=20, max_size=10)
+        results = await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert batcher.stats()["failed"] == 1
+
+
+def test_next_batch_works_after_a_failed_one():
+    calls = 0
+
+    async def embed(texts):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("transient")
+        return [[1.0] for _ in texts]
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed, window_ms=1, max_size=10)
+        with pytest.raises(RuntimeError):
+            await batcher.embed(["a"])
+        return await batcher.embed(["a"])
+
+    assert asyncio.run(scenario()) == [[1.0]]
@@ -0,0 +1,64 @@
+# backend/tests/test_embedding_cache.py
+import asyncio
+import sqlite3
+import threading
+
+from app.embedding_cache import EmbeddingCache
+
+
+def test_lookup_is_normalised_and_counts_hits():
+    cache = EmbeddingCache(max_entries=10, ttl=0, path="")
+    cache.put("model", "Hello   World", [0.5, 0.25])
+
+    assert cache.get("model", "hello world") == [0.5, 0.25]
+    assert cache.get("other-model", "hello world") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_vectors_survive_a_restart_through_the_disk_store(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(max_entries=10, ttl=0, path=path)
+    for i in range(50):
+        cache.put("model", f"text {i}", [float(i)])
+    cache.flush()
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 50
+
+    restarted = EmbeddingCache(max_entries=10, ttl=0, path=path)
+    assert restarted.get_many("model", ["text 3", "text 49", "missing"]) == [[3.0], [49.0], None]
+    assert restarted.stats()["disk_hits"] == 2
+
+
+def test_async_lookup_reads_the_disk_store_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.db")
+    writer = EmbeddingCache(max_entries=10, ttl=0, path=path)
+    writer.put("model", "on disk", [1.0])
+    writer.flush()
+
+    cache = EmbeddingCache(max_entries=10, ttl=0, path=path)
+    cache.put("model", "in memory", [2.0])
+    load = cache._load_from_disk
+    calls = []
+
+    def recording_load(keys):
+        calls.append((threading.current_thread() is threading.main_thread(), len(keys)))
+        return load(keys)
+
+    monkeypatch.setattr(cache, "_load_from_disk", recording_load)
+
+    results = asyncio.run(cache.get_many_async("model", ["in memory", "on disk", "missing"]))
+
+    assert results == [[2.0], [1.0], None]
+    # One query for both memory misses, not on the event loop's thread
+    assert calls == [(False, 2)]
+
+
+def test_clear_empties_memory_and_disk(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(max_entries=10, ttl=0, path=path)
+    cache.put("model", "text", [1.0])
+    cache.clear()
+
+    assert cache.get("model", "text") is None
+    assert EmbeddingCache(max_entries=10, ttl=0, path=path).get("model", "text") is None
@@ -0,0 +1,81 @@
+# backend/tests/test_index_reload.py
+import asyncio
+import time
+
+import httpx
+from conftest import run
+
+
+def reload_while_polling(monkeypatch, loader_name, reload_path, status_path):
+    """
+    Run a reload whose loader takes 0.3 s and poll a status endpoint meanwhile
+
+    Returns:
+        Tuple of (reload response body, status code of the poll, seconds until the poll was answered)
+    """
+    from app import api
+
+    def slow_load():
+        time.sleep(0.3)
+        return 42
+
+    monkeypatch.setattr(api, loader_name, slow_load)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            started = time.perf_counter()
+            reload = asyncio.create_task(client.post(reload_path))
+            # Let the reload start before polling
+            await asyncio.sleep(0.05)
+            status = await client.get(status_path)
+            latency = time.perf_counter() - started
+            return (await reload).json(), status.status_code, latency
+
+    return run(scenario())
+
+
+def test_vector_index_reload_does_not_block_the_event_loop(monkeypatch):
+    body, status_code, latency = reload_while_polling(
+        monkeypatch, "load_vector_index", "/api/vector-index/reload", "/api/vector-index/status"
+    )
+
+    assert body == {"status": "success", "records": 42}
+    assert status_code == 200
+    assert latency < 0.2
+
+
+def test_lexical_index_reload_does_not_block_the_event_loop(monkeypatch):
+    body, status_code, latency = reload_while_polling(
+        monkeypatch, "load_lexical_index", "/api/lexical-index/reload", "/api/lexical-index/status"
+    )
+
+    assert body == {"status": "success", "records": 42}
+    assert status_code == 200
+    assert latency < 0.2
+
+
+def test_upload_indexes_files_without_blocking_the_event_loop(monkeypatch, tmp_path):
+    from app import api
+
+    def slow_index(file_path):
+        time.sleep(0.3)
+        return True
+
+    monkeypatch.setattr(api, "index_file", slow_index)
+    # Uploads are saved under kb_files/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "kb_files").mkdir()
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            started = time.perf_counter()
+            upload = asyncio.create_task(client.post("/api/kb/load", files={"files": ("faq.txt", b"Opening hours")}))
+            await asyncio.sleep(0.05)
+            status = await client.get("/api/vector-index/status")
+            latency = time.perf_counter() - started
+            return (await upload).json(), status.status_code, latency
+
+    body, status_code, latency = run(scenario())
+    assert body == {"faq.txt": {"status": "success"}}
+    assert status_code == 200
+    assert latency < 0.2
@@ -0,0 +1,74 @@
+# backend/tests/test_lexical_index.py
+from app.lexical_index import LexicalIndex, fuse_results, reciprocal_rank_fusion
+
+
+def test_rrf_rewards_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+
+    assert [record_id for record_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_rrf_scores_follow_rank():
+    fused = dict(reciprocal_rank_fusion([["a", "b"]], k=1))
+
+    assert fused == {"a": 1 / 2, "b": 1 / 3}
+
+
+class FakeCollection:
+    """
+    The part of a Chroma collection that LexicalIndex.load reads
+    """
+
+    def __init__(self, ids, documents):
+        self.ids, self.documents = ids, documents
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, limit, offset, include):
+        return {
+            "ids": self.ids[offset:offset + limit],
+            "documents": self.documents[offset:offset + limit],
+            "metadatas": [{"source": record_id} for record_id in self.ids[offset:offset + limit]],
+        }
+
+
+def test_bm25_prefers_the_rarer_matching_term():
+    index = LexicalIndex()
+    index.load(FakeCollection(
+        ["1", "2", "3"], ["invoice payment due date", "payment methods accepted", "payment payment payment"]
+    ))
+
+    hits = index.query("invoice payment", n_results=3)
+
+    assert hits[0]["id"] == "1"
+    assert {hit["id"] for hit in hits} == {"1", "2", "3"}
+
+
+def test_fuse_results_keeps_chroma_shape_and_lexical_only_chunks():
+    vector_results = {
+        "ids": [["v1", "both"]],
+        "documents": [["vector one", "both doc"]],
+        "metadatas": [[{"source": "v"}, {"source": "b"}]],
+        "distances": [[0.1, 0.2]],
+    }
+    lexical_hits = [
+        {"id": "both", "document": "both doc", "metadata": {"source": "b"}, "score": 3.0},
+        {"id": "l1", "document": "lexical one", "metadata": {"source": "l"}, "score": 1.0},
+    ]
+
+    fused = fuse_results(vector_results, lexical_hits, n_results=3)
+
+    assert fused["ids"] == [["both", "v1", "l1"]]
+    assert fused["documents"] == [["both doc", "vector one", "lexical one"]]
+    assert fused["distances"] == [[0.1, 0.2]]
+
+
+def test_add_and_delete_mirror_the_collection():
+    index = LexicalIndex()
+    index.load(FakeCollection(["1"], ["refund policy"]))
+    index.add(["2"], ["refund window thirty days"], [{"source": "faq.txt"}])
+    index.delete({"source": "1"})
+
+    assert [hit["id"] for hit in index.query("refund", n_results=5)] == ["2"]
@@ -0,0 +1,120 @@
+# backend/tests/test_session_cache.py
+import datetime
+
+from sqlalchemy import update
+
+from app.models import Conversation
+from app.session_cache import CachedMessage, SessionCache
+
+from conftest import run
+
+
+def make_conversation(conversation_id=1, session_id="s1", status="waiting_for_user"):
+    now = datetime.datetime(2024, 1, 1)
+    return Conversation(
+        id=conversation_id, session_id=session_id, status=status, summary=None,
+        summarized_until_id=None, created_at=now, updated_at=now
+    )
+
+
+def test_store_and_get():
+    cache = SessionCache(max_entries=10, ttl=0)
+    cache.store(make_conversation(), [CachedMessage(1, "user", "hi")], cache.version)
+
+    state = cache.get("s1")
+    assert state.conversation_id == 1
+    assert [m.content for m in state.messages] == ["hi"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_read_that_raced_with_an_invalidation_is_not_stored():
+    cache = SessionCache(max_entries=10, ttl=0)
+    version = cache.version
+    # A status change lands between the database read and store()
+    cache.invalidate(1)
+    cache.store(make_conversation(), [], version)
+
+    assert cache.get("s1") is None
+
+
+def test_invalidate_drops_the_conversation():
+    cache = SessionCache(max_entries=10, ttl=0)
+    cache.store(make_conversation(), [], cache.version)
+    cache.invalidate(1)
+
+    assert cache.get("s1") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_record_turn_after_invalidation_is_ignored():
+    cache = SessionCache(max_entries=10, ttl=0)
+    cache.store(make_conversation(), [], cache.version)
+    cache.invalidate(1)
+    cache.record_turn("s1", 1, [CachedMessage(2, "user", "late")], history_limit=10)
+
+    assert cache.get("s1") is None
+
+
+def test_record_turn_keeps_the_newest_messages():
+    cache = SessionCache(max_entries=10, ttl=0)
+    cache.store(make_conversation(), [CachedMessage(1, "user", "a"), CachedMessage(2, "assistant", "b")], cache.version)
+    cache.record_turn(
+        "s1", 1, [CachedMessage(3, "user", "c"), CachedMessage(4, "assistant", "d")],
+        history_limit=3, status="waiting_for_manual"
+    )
+
+    state = cache.get("s1")
+    assert [m.id for m in state.messages] == [2, 3, 4]
+    assert state.status == "waiting_for_manual"
+
+
+def test_least_recently_used_is_evicted():
+    cache = SessionCache(max_entries=2, ttl=0)
+    for i in (1, 2):
+        cache.store(make_conversation(i, f"s{i}"), [], cache.version)
+    cache.get("s1")
+    cache.store(make_conversation(3, "s3"), [], cache.version)
+
+    assert cache.get("s2") is None
+    assert cache.get("s1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_dropped(monkeypatch):
+    cache = SessionCache(max_entries=10, ttl=60)
+    cache.store(make_conversation(), [], cache.version)
+    now = cache.get("s1").cached_at
+    monkeypatch.setattr("app.session_cache.time.time", lambda: now + 61)
+
+    assert cache.get("s1") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_load_conversation_reads_the_database_again_after_invalidation(database):
+    from app.database import AsyncSessionLocal
+    from app.rag import load_conversation
+    from app.session_cache import session_cache
+
+    session_cache.clear()
+
+    async def load():
+        async with AsyncSessionLocal() as db:
+            conversation, history, summary = await load_conversation("cached-session", db)
+            return conversation.id, conversation.status
+
+    async def scenario():
+        conversation_id, _ = await load()
+        assert session_cache.get("cached-session") is not None
+
+        # A writer outside the chat path changes the row and invalidates it
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Conversation).where(Conversation.id == conversation_id).values(status="waiting_for_manual")
+            )
+            await db.commit()
+        session_cache.invalidate(conversation_id)
+
+        return await load()
+
+    _, status = run(scenario())
+    assert status == "waiting_for_manual"
@@ -0,0 +1,68 @@
+# backend/tests/test_structured_answer.py
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import rag
+from app.rag import parse_structured_answer
+
+
+def reply(answer="Open Settings.", confidence=80, reason="In the context"):
+    return json.dumps({"answer": answer, "confidence": confidence, "confidence_reason": reason})
+
+
+def test_valid_reply():
+    assert parse_structured_answer(reply()) == ("Open Settings.", (80.0, "In the context"))
+
+
+@pytest.mark.parametrize("confidence, clamped", [(101, 100.0), (250.5, 100.0), (-3, 0.0)])
+def test_out_of_range_confidence_is_clamped(confidence, clamped):
+    assert parse_structured_answer(reply(confidence=confidence)) == ("Open Settings.", (clamped, "In the context"))
+
+
+def test_unusable_confidence_keeps_the_answer_without_a_score():
+    assert parse_structured_answer(reply(confidence="high")) == ("Open Settings.", None)
+
+
+def test_reply_truncated_after_the_answer_keeps_the_answer():
+    truncated = reply(answer='Say "yes"\nthen confirm.')[:-25]
+
+    assert parse_structured_answer(truncated) == ('Say "yes"\nthen confirm.', None)
+
+
+@pytest.mark.parametrize("content", [reply()[:20], "", "{}", '{"answer": ""}', "[1, 2]"])
+def test_reply_without_a_complete_answer_gives_none(content):
+    assert parse_structured_answer(content) == (None, None)
+
+
+def test_plain_text_reply_is_the_answer():
+    assert parse_structured_answer("Open Settings.") == ("Open Settings.", None)
+
+
+def test_unusable_structured_reply_falls_back_to_a_plain_completion(monkeypatch):
+    calls = []
+
+    async def create(**params):
+        calls.append(params)
+        content = reply()[:20] if len(calls) == 1 else "Open Settings, then Privacy."
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), logprobs=None)], usage=None
+        )
+
+    monkeypatch.setattr(rag, "CONFIDENCE_STRATEGY", "structured")
+    monkeypatch.setattr(rag, "RESPONSE_PREFIX", "")
+    monkeypatch.setattr(rag, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    turn = rag.ChatTurn(
+        query="How do I hide my profile?", session_id="s1", conversation=None, context="",
+        sources=[], messages=[{"role": "system", "content": "Answer from the context."}], distances=[],
+        query_embedding=[], first_turn=True, kb_version=0
+    )
+
+    answer, confidence = asyncio.run(rag.generate_answer(turn))
+
+    assert answer == "Open Settings, then Privacy."
+    # Scored by the judge in finish_chat
+    assert confidence is None
+    assert "response_format" in calls[0] and "response_format" not in calls[1]
@@ -0,0 +1,198 @@
+# backend/tests/test_turn_writer.py
+import asyncio
+import datetime
+import os
+import time
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.models import Conversation, Message
+from app.turn_writer import PendingTurn, TurnWriter, WriteBehindTimeout
+
+from conftest import run
+
+
+@pytest.fixture
+def conversation_id(database):
+    now = datetime.datetime.utcnow()
+    with database.begin() as connection:
+        connection.execute(Conversation.__table__.insert(), [
+            {"id": 1, "session_id": "s1", "created_at": now, "updated_at": now, "status": "waiting_for_user"}
+        ])
+    return 1
+
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "write_behind.jsonl")
+
+
+def make_turn(query, conversation_id=1, session_id="s1"):
+    return PendingTurn(
+        conversation_id=conversation_id, session_id=session_id, query=query, answer=f"Answer to {query}",
+        sources=["kb.txt"], confidence_score=90.0, confidence_reason="judge", status="waiting_for_user",
+        timestamp=datetime.datetime.utcnow()
+    )
+
+
+def stored_queries(engine):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(Message.content).where(Message.role == "user").order_by(Message.id)
+        ).scalars().all()
+
+
+def spilled_queries(spill_path):
+    with open(spill_path, encoding="utf-8") as f:
+        return [PendingTurn.from_json(line).query for line in f]
+
+
+def test_submitted_turns_are_written_and_the_spill_file_emptied(database, conversation_id, spill_path):
+    writer = TurnWriter(interval=0.01, spill_path=spill_path)
+
+    async def scenario():
+        writer.start()
+        for query in ("q1", "q2"):
+            await writer.submit(make_turn(query))
+        await writer.wait_for("s1")
+        await writer.stop()
+
+    run(scenario())
+    assert stored_queries(database) == ["q1", "q2"]
+    assert spilled_queries(spill_path) == []
+
+
+def test_replay_skips_turns_that_already_reached_the_database(database, conversation_id, spill_path):
+    written, queued = make_turn("written"), make_turn("queued")
+    writer = TurnWriter(interval=0.01, spill_path=spill_path)
+
+    async def write_one():
+        writer.start()
+        await writer.submit(written)
+        await writer.wait_for()
+        await writer.stop()
+
+    run(write_one())
+    # A crash before the spill file was emptied leaves the written turn in it, next to one never written,
+    # and cuts the last line short
+    with open(spill_path, "w", encoding="utf-8") as f:
+        f.write(written.to_json() + "\n" + queued.to_json() + "\n" + queued.to_json()[:20])
+
+    replay = TurnWriter(interval=0.01, spill_path=spill_path)
+
+    async def restart():
+        replay.start()
+        await replay.wait_for()
+        stats = replay.stats()
+        await replay.stop()
+        return stats
+
+    stats = run(restart())
+    assert stored_queries(database) == ["written", "queued"]
+    assert stats["recovered_turns"] == 2
+    assert stats["skipped_duplicates"] == 1
+
+
+def test_a_turn_submitted_during_a_spill_rewrite_is_kept_in_the_new_file(
+    database, conversation_id, spill_path, monkeypatch
+):
+    # Every flush rewrites the spill file, and every fsync takes long enough to submit during it
+    writer = TurnWriter(interval=60, spill_path=spill_path, fsync=True, spill_max_bytes=0)
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.1)
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+
+    async def scenario():
+        writer.start()
+        first = asyncio.create_task(writer.submit(make_turn("q1")))
+        await asyncio.sleep(0.02)
+        # The rewrite waits for the fsync of q1, and q2 is submitted meanwhile
+        rewrite = asyncio.create_task(writer._trim_spill())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(writer.submit(make_turn("q2")))
+        await asyncio.gather(first, rewrite, second)
+        spilled = spilled_queries(spill_path)
+        await writer.stop()
+        return spilled
+
+    assert run(scenario()) == ["q1", "q2"]
+    assert stored_queries(database) == ["q1", "q2"]
+
+
+def test_a_turn_that_keeps_failing_is_set_aside_without_blocking_the_others(
+    database, conversation_id, spill_path, monkeypatch
+):
+    writer = TurnWriter(interval=0.001, spill_path=spill_path, max_attempts=3)
+    write = writer._write
+
+    async def failing_write(batch):
+        if any(turn.query == "bad" for turn in batch):
+            raise RuntimeError("constraint violated")
+        return await write(batch)
+
+    monkeypatch.setattr(writer, "_write", failing_write)
+
+    async def scenario():
+        writer.start()
+        for query in ("good 1", "bad", "good 2"):
+            await writer.submit(make_turn(query))
+        # Returns once the bad turn is set aside instead of waiting for it forever
+        await writer.wait_for("s1", timeout=5)
+        await writer.submit(make_turn("good 3"))
+        await writer.wait_for("s1", timeout=5)
+        stats = writer.stats()
+        await writer.stop()
+        return stats
+
+    stats = run(scenario())
+    assert stored_queries(database) == ["good 1", "good 2", "good 3"]
+    assert stats["set_aside_turns"] == 1
+    # Kept for the next start, which retries it
+    assert spilled_queries(spill_path) == ["bad"]
+
+
+def test_readers_time_out_while_the_database_is_unavailable(database, conversation_id, spill_path, monkeypatch):
+    writer = TurnWriter(interval=0.001, spill_path=spill_path, max_attempts=1000)
+
+    async def unavailable(batch):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(writer, "_write", unavailable)
+
+    async def scenario():
+        writer.start()
+        await writer.submit(make_turn("q1"))
+        with pytest.raises(WriteBehindTimeout):
+            await writer.wait_for("s1", timeout=0.1)
+        await writer.stop(timeout=0)
+
+    run(scenario())
+    assert spilled_queries(spill_path) == ["q1"]
+
+
+def test_session_reads_answer_503_when_queued_turns_cannot_be_written(database, monkeypatch):
+    from app import api
+
+    async def wait_for(session_id=None, timeout=None):
+        raise WriteBehindTimeout("Chat turns are not written yet, try again later")
+
+    monkeypatch.setattr(api.turn_writer, "wait_for", wait_for)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            return [
+                await client.get("/api/conversations/s1"),
+                await client.post("/api/chat", json={"query": "hello", "session_id": "s1"}),
+                await client.get("/api/conversations"),
+            ]
+
+    responses = run(scenario())
+    # The list does not wait for queued turns, so a slow session cannot make it fail
+    assert [response.status_code for response in responses] == [503, 503, 200]
+    assert responses[0].headers["Retry-After"] == "5"
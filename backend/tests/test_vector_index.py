@@ -0,0 +1,85 @@
+# backend/tests/test_vector_index.py
+import os
+
+from app.vector_index import VectorIndex
+
+
+class FakeCollection:
+    """
+    The part of a Chroma collection that VectorIndex.load reads, counting embedding fetches
+    """
+
+    def __init__(self, ids, documents, embeddings, metadatas=None):
+        self.id = "collection-1"
+        self.ids, self.documents, self.embeddings = ids, documents, embeddings
+        self.metadatas = metadatas or [{"source": "kb.pdf"} for _ in ids]
+        self.embedding_fetches = 0
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, limit, offset, include):
+        if "embeddings" in include:
+            self.embedding_fetches += 1
+        window = slice(offset, offset + limit)
+        return {
+            "ids": self.ids[window],
+            "documents": self.documents[window],
+            "metadatas": self.metadatas[window],
+            "embeddings": self.embeddings[window],
+        }
+
+
+def make_collection():
+    return FakeCollection(["a", "b"], ["first chunk", "second chunk"], [[1.0, 0.0], [0.0, 1.0]])
+
+
+def test_unchanged_collection_loads_from_the_snapshot(tmp_path):
+    VectorIndex(path=str(tmp_path)).load(make_collection())
+
+    collection = make_collection()
+    index = VectorIndex(path=str(tmp_path))
+    assert index.load(collection) == 2
+
+    assert collection.embedding_fetches == 0
+    assert index.memory_mapped
+    assert index.query([1.0, 0.0], 1)["ids"] == [["a"]]
+
+
+def test_snapshot_with_the_same_count_but_other_content_is_rejected(tmp_path):
+    VectorIndex(path=str(tmp_path)).load(make_collection())
+
+    collection = make_collection()
+    collection.documents[1] = "second chunk, re-uploaded"
+    collection.embeddings[1] = [0.6, 0.8]
+    index = VectorIndex(path=str(tmp_path))
+    index.load(collection)
+
+    assert collection.embedding_fetches == 1
+    assert index.query([0.6, 0.8], 1)["documents"] == [["second chunk, re-uploaded"]]
+
+
+def test_updates_are_written_to_the_snapshot_later_not_inline(tmp_path):
+    index = VectorIndex(path=str(tmp_path), snapshot_delay=60)
+    index.load(make_collection())
+    records_file = os.path.join(str(tmp_path), "records.json")
+    written = os.path.getmtime(records_file)
+
+    index.add(["c"], ["third chunk"], [[0.7, 0.7]], [{"source": "other.pdf"}])
+    index.delete({"source": "other.pdf"})
+    index.add(["d"], ["fourth chunk"], [[0.8, 0.6]], [{"source": "other.pdf"}])
+
+    assert os.path.getmtime(records_file) == written
+    assert index.stats()["snapshot_pending"]
+
+    index.flush_snapshot()
+
+    assert not index.stats()["snapshot_pending"]
+    collection = FakeCollection(
+        ["d", "a", "b"], ["fourth chunk", "first chunk", "second chunk"], [[0.8, 0.6], [1.0, 0.0], [0.0, 1.0]],
+        [{"source": "other.pdf"}, {"source": "kb.pdf"}, {"source": "kb.pdf"}]
+    )
+    reloaded = VectorIndex(path=str(tmp_path))
+    reloaded.load(collection)
+    assert collection.embedding_fetches == 0
+    assert reloaded.query([0.8, 0.6], 1)["ids"] == [["d"]]
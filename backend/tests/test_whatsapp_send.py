@@ -0,0 +1,54 @@
+# backend/tests/test_whatsapp_send.py
+import asyncio
+import json
+
+import httpx
+
+from app import whatsapp
+
+
+def configure(monkeypatch, handler):
+    monkeypatch.setattr(whatsapp, "WHATSAPP_TOKEN", "token")
+    monkeypatch.setattr(whatsapp, "WHATSAPP_APP_SECRET", "secret")
+    monkeypatch.setattr(whatsapp, "WHATSAPP_PHONE_ID", "phone")
+    monkeypatch.setattr(whatsapp, "_graph_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_message_is_posted_to_the_graph_api(monkeypatch):
+    sent = []
+
+    def handler(request):
+        sent.append((request.url.path, request.headers["Authorization"], json.loads(request.content)))
+        return httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+    configure(monkeypatch, handler)
+
+    async def scenario():
+        try:
+            return await whatsapp.send_whatsapp_message("5551234567", "Olá")
+        finally:
+            await whatsapp.close_graph_client()
+
+    responses = asyncio.run(scenario())
+
+    assert responses == [{"messages": [{"id": "wamid.1"}]}]
+    path, authorization, payload = sent[0]
+    assert path.endswith("/phone/messages")
+    assert authorization == "Bearer token"
+    assert payload["to"] == "5551234567"
+    assert payload["text"] == {"body": "Olá"}
+
+
+def test_graph_api_errors_are_reported_per_part(monkeypatch):
+    configure(monkeypatch, lambda request: httpx.Response(400, json={"error": "invalid recipient"}))
+
+    async def scenario():
+        try:
+            return await whatsapp.send_whatsapp_message("5551234567", "Olá")
+        finally:
+            await whatsapp.close_graph_client()
+
+    responses = asyncio.run(scenario())
+
+    assert len(responses) == 1
+    assert "400" in responses[0]["error"]
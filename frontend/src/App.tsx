@@ -38,10 +38,12 @@ interface ServerConversation {
 
 interface ServerListResponse {
   conversations: ServerConversationSummary[];
+  next_cursor: string | null;
 }
 
 interface ServerConversationSummary {
   session_id: string;
+  status: string | null;
   created_at: string;
   updated_at: string;
   message_count: number;
@@ -246,16 +248,24 @@ function App() {
     return result;
   };
   
-  // Fetch all conversations from server
+  // Fetch all conversations from server, following the list's page cursor
   const fetchAllServerConversations = async (): Promise<ServerConversationSummary[]> => {
     try {
-      const response = await fetch('/api/conversations');
-      if (!response.ok) {
-        throw new Error(`Server returned ${response.status}: ${response.statusText}`);
-      }
-      
-      const data: ServerListResponse = await response.json();
-      return data.conversations;
+      const summaries: ServerConversationSummary[] = [];
+      let cursor: string | null = null;
+      do {
+        // Pages have the server's default size (CONVERSATIONS_PAGE_SIZE)
+        const url: string = cursor ? `/api/conversations?cursor=${encodeURIComponent(cursor)}` : '/api/conversations';
+        const response: Response = await fetch(url);
+        if (!response.ok) {
+          throw new Error(`Server returned ${response.status}: ${response.statusText}`);
+        }
+        
+        const data: ServerListResponse = await response.json();
+        summaries.push(...data.conversations);
+        cursor = data.next_cursor;
+      } while (cursor);
+      return summaries;
     } catch (error) {
       console.error("Error fetching all conversations:", error);
       return [];